@@ -1,12 +1,52 @@
-from flask import Flask
+import os
+import gc
+import time
+import logging
+from flask import Flask, Response, g, request
 from flask_cors import CORS
 from dotenv import load_dotenv
-import os
+
+def _queue_seconds(header, now):
+    """Time since the proxy stamped X-Request-Start ("t=<epoch seconds|ms|us>")."""
+    try:
+        stamp = float(header.split('=', 1)[-1])
+    except ValueError:
+        return None
+    while stamp > 1e11:  # milliseconds or microseconds
+        stamp /= 1000
+    return max(0.0, now - stamp)
+
+def preload_shared_state():
+    """Import the service modules and build the code catalog and its indexes in this process.
+
+    Meant for a forking server's master (see gunicorn.conf.py): workers
+    inherit all of it and share the pages copy-on-write instead of each
+    importing and building their own. Nothing that opens a connection,
+    client or thread is created here; services are built per worker.
+    """
+    load_dotenv()
+    from app.services import ai_service  # noqa: F401 (google.genai, pydantic)
+    from app.services.code_service import CodeService
+    from app.services.code_enrichment import get_enricher
+    from app.services.precoder import get_precoder, PRECODER_ENABLED
+
+    CodeService()
+    get_enricher()
+    if PRECODER_ENABLED:
+        get_precoder()
+    # Keep the collector from writing to (and so un-sharing) every inherited object
+    gc.freeze()
 
 def create_app():
     # Load environment variables
     load_dotenv()
 
+    # Prompts and model output are only logged at DEBUG, which must stay off in production
+    logging.basicConfig(
+        level=os.getenv('LOG_LEVEL', 'INFO').upper(),
+        format='%(asctime)s %(levelname)s %(name)s: %(message)s'
+    )
+
     # Initialize Flask app
     app = Flask(__name__)
     
@@ -23,4 +63,31 @@ def create_app():
     from app.api.routes import api_bp
     app.register_blueprint(api_bp, url_prefix='/api')
 
-    return app 
\ No newline at end of file
+    # Instrument every request
+    from app.services.metrics import registry, HTTP_REQUEST_SECONDS, HTTP_QUEUE_SECONDS, HTTP_ERRORS
+
+    @app.before_request
+    def start_timer():
+        g.request_start = time.perf_counter()
+        header = request.headers.get('X-Request-Start')
+        if header:
+            queued = _queue_seconds(header, time.time())
+            if queued is not None:
+                HTTP_QUEUE_SECONDS.observe(queued, request.url_rule.rule if request.url_rule else 'unmatched')
+
+    @app.after_request
+    def record_request(response):
+        start = g.pop('request_start', None)
+        if start is not None:
+            route = request.url_rule.rule if request.url_rule else 'unmatched'
+            HTTP_REQUEST_SECONDS.observe(time.perf_counter() - start, route, request.method, response.status_code)
+            if response.status_code >= 400:
+                HTTP_ERRORS.inc(route, response.status_code)
+        return response
+
+    @app.route('/metrics')
+    def metrics():
+        """Prometheus scrape endpoint"""
+        return Response(registry.render(), mimetype='text/plain; version=0.0.4')
+
+    return app 
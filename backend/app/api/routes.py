@@ -1,22 +1,192 @@
-from flask import Blueprint, request, jsonify
-from app.services.ai_service import AIService
+import json
+import hashlib
+import functools
+from datetime import datetime, timedelta
+from flask import Blueprint, Response, request, jsonify, make_response, stream_with_context
+from app.services.admission import (AdmissionController, Rejected, estimate_prompt_tokens,
+                                    ADMISSION_ENABLED, INTERACTIVE, BATCH)
 from app.services.code_service import CodeService
+from app.services.code_search import DEFAULT_LIMIT, MAX_LIMIT, MAX_OFFSET
+from app.services.batch_runner import BatchRunner, normalize_chart, BATCH_CONCURRENCY
+from app.services.job_queue import JobQueue, JOB_PRIORITIES, current_job
+from app.services.model_router import SPECULATIVE_SUGGESTIONS
+from app.services.process_local import ProcessLocal
 
 api_bp = Blueprint('api', __name__)
-ai_service = AIService()
-code_service = CodeService()
+
+def _build_ai_service():
+    # google.genai and pydantic are imported with the service, not with the app
+    from app.services.ai_service import AIService
+    return AIService()
+
+def _workup_job(payload):
+    workup = ai_service().generate_workup(payload['chartText'], payload.get('encounterId'))
+    if 'suggestions' in workup['errors'] and 'analysis' in workup['errors']:
+        return {'error': workup['errors']['suggestions']}
+    return workup
+
+def _job_slot_class(priority):
+    """High-priority jobs are a coder waiting in the UI and share interactive slots; the rest are batch work"""
+    return INTERACTIVE if priority == JOB_PRIORITIES['high'] else BATCH
+
+def _in_model_slot(handler):
+    """Run a job handler in a model slot of its priority's class"""
+    if not ADMISSION_ENABLED:
+        return handler
+
+    def run(payload):
+        with admission().slot(_job_slot_class(current_job()['priority'])):
+            return handler(payload)
+    return run
+
+def _build_job_queue():
+    queue = JobQueue()
+    queue.register('suggestions', _in_model_slot(lambda payload: ai_service().generate_suggestions(
+        payload['chartText'], encounter_id=payload.get('encounterId'))))
+    queue.register('analysis', _in_model_slot(lambda payload: ai_service().generate_analysis(
+        payload['chartText'], encounter_id=payload.get('encounterId'))))
+    queue.register('workup', _in_model_slot(_workup_job))
+    queue.register('verify_suggestions', _in_model_slot(lambda payload: ai_service().verify_suggestions(
+        payload['chartText'], payload.get('cptCodes', []), payload.get('icdCodes', []), payload.get('tier'))))
+    return queue
+
+# Built on first use in each worker process, after any fork
+ai_service = ProcessLocal(_build_ai_service)
+code_service = ProcessLocal(CodeService)
+job_queue = ProcessLocal(_build_job_queue)
+admission = ProcessLocal(AdmissionController)
+
+# Model prompts behind each job type, for estimating what a job will cost
+JOB_PROMPTS = {'workup': 3}
+
+def _client_key():
+    """Who a request is charged to: its Authorization header (hashed), else its address"""
+    authorization = request.headers.get('Authorization')
+    if authorization:
+        return 'auth:' + hashlib.sha256(authorization.encode()).hexdigest()[:16]
+    return f'ip:{request.remote_addr}'
+
+def _too_many(rejected):
+    """429 response telling the client when to try again"""
+    response = jsonify({'error': str(rejected), 'retryAfter': rejected.retry_after})
+    response.status_code = 429
+    response.headers['Retry-After'] = str(rejected.retry_after)
+    return response
+
+def _admitted(prompts=1):
+    """Run a model-bound view only once admission control lets it in; 429 if it does not
+
+    The request is charged the estimated prompt tokens of ``prompts``
+    prompts over its body and holds an interactive slot until its
+    response, or its stream, is finished.
+    """
+    def decorate(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            if not ADMISSION_ENABLED:
+                return view(*args, **kwargs)
+            try:
+                lease = admission().admit(_client_key(), estimate_prompt_tokens(request.content_length or 0, prompts))
+            except Rejected as e:
+                return _too_many(e)
+            try:
+                response = make_response(view(*args, **kwargs))
+            except Exception:
+                lease.release()
+                raise
+            if response.is_streamed:
+                response.call_on_close(lease.release)
+            else:
+                lease.release()
+            return response
+        return wrapper
+    return decorate
+
+def _pagination_args():
+    """Parse and validate the limit/offset query parameters of search routes."""
+    try:
+        limit = int(request.args.get('limit', DEFAULT_LIMIT))
+        offset = int(request.args.get('offset', 0))
+    except ValueError:
+        raise ValueError('limit and offset must be integers')
+    if not 1 <= limit <= MAX_LIMIT:
+        raise ValueError(f'limit must be between 1 and {MAX_LIMIT}')
+    if not 0 <= offset <= MAX_OFFSET:
+        raise ValueError(f'offset must be between 0 and {MAX_OFFSET}')
+    return limit, offset
+
+def _period_args():
+    """Parse the since/until (ISO 8601, UTC) query parameters of history routes; the last 30 days by default."""
+    try:
+        until = datetime.fromisoformat(request.args['until']) if 'until' in request.args else None
+        since = datetime.fromisoformat(request.args['since']) if 'since' in request.args else None
+    except ValueError:
+        raise ValueError('since and until must be ISO 8601 dates')
+    if until is None:
+        # Imported here with SQLAlchemy only when a history route is used; same clock as the audit rows
+        from app.services.audit_store import utcnow
+        until = utcnow()
+    if since is None:
+        since = until - timedelta(days=30)
+    if since.tzinfo is not None or until.tzinfo is not None:
+        raise ValueError('since and until must be UTC times without an offset')
+    return since, until
+
+def _encounter_id(data):
+    """The optional encounterId of a request body, as a string."""
+    encounter_id = data.get('encounterId')
+    if encounter_id is None or encounter_id == '':
+        return None
+    if isinstance(encounter_id, bool) or not isinstance(encounter_id, (str, int)) or len(str(encounter_id)) > 128:
+        raise ValueError('encounterId must be a string of at most 128 characters')
+    return str(encounter_id)
+
+def _sse_response(events):
+    """Stream (event, data) pairs to the client as server-sent events"""
+    def generate():
+        try:
+            for event, data in events:
+                yield f"event: {event}\ndata: {json.dumps(data)}\n\n"
+            yield "event: done\ndata: {}\n\n"
+        except Exception as e:
+            yield f"event: error\ndata: {json.dumps({'error': str(e)})}\n\n"
+
+    return Response(stream_with_context(generate()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
 
 @api_bp.route('/suggestions', methods=['POST'])
+@_admitted()
 def get_ai_suggestions():
-    """Get AI suggestions for CPT and ICD codes based on chart text"""
+    """Get AI suggestions for CPT and ICD codes based on chart text
+
+    With "speculative": true a fast model answers and a verification job is
+    queued on the usual model; poll /jobs/<verification.jobId> to learn
+    whether the codes changed. With "encounterId" the result is stored as a
+    version of that encounter and reports what changed since the last one.
+    """
     data = request.get_json()
     chart_text = data.get('chartText', '')
     
     if not chart_text:
         return jsonify({'error': 'Chart text is required'}), 400
+    try:
+        encounter_id = _encounter_id(data)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     
     try:
-        suggestions = ai_service.generate_suggestions(chart_text)
+        if encounter_id or not data.get('speculative', SPECULATIVE_SUGGESTIONS):
+            suggestions = ai_service().generate_suggestions(chart_text, encounter_id=encounter_id)
+        else:
+            suggestions = ai_service().speculative_suggestions(chart_text)
+            if suggestions.get('speculative'):
+                job = job_queue().submit('verify_suggestions', {
+                    'chartText': chart_text,
+                    'tier': suggestions.pop('verifyTier'),
+                    'cptCodes': [code['code'] for code in suggestions['cptCodes']],
+                    'icdCodes': [code['code'] for code in suggestions['icdCodes']],
+                }, JOB_PRIORITIES['high'])
+                suggestions['verification'] = {'jobId': job['jobId']}
         if "error" in suggestions:
             return jsonify({'error': suggestions["error"]}), 500
         return jsonify(suggestions)
@@ -24,51 +194,217 @@ def get_ai_suggestions():
         return jsonify({'error': str(e)}), 500
 
 @api_bp.route('/analysis', methods=['POST'])
+@_admitted()
 def get_analysis():
-    """Get in-depth analysis of the medical chart"""
+    """Get in-depth analysis of the medical chart
+
+    With "encounterId" only the sections changed since that encounter's
+    last version are sent to the model.
+    """
     data = request.get_json()
     chart_text = data.get('chartText', '')
     
     if not chart_text:
         return jsonify({'error': 'Chart text is required'}), 400
+    try:
+        encounter_id = _encounter_id(data)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     
     try:
-        analysis = ai_service.generate_analysis(chart_text)
+        analysis = ai_service().generate_analysis(chart_text, encounter_id=encounter_id)
         if "error" in analysis:
             return jsonify({'error': analysis["error"]}), 500
         return jsonify(analysis)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@api_bp.route('/suggestions/stream', methods=['POST'])
+@_admitted()
+def stream_ai_suggestions():
+    """Stream CPT and ICD code suggestions as server-sent events, one code per event"""
+    data = request.get_json()
+    chart_text = data.get('chartText', '')
+    
+    if not chart_text:
+        return jsonify({'error': 'Chart text is required'}), 400
+    
+    return _sse_response(ai_service().stream_suggestions(chart_text))
+
+@api_bp.route('/analysis/stream', methods=['POST'])
+@_admitted()
+def stream_analysis():
+    """Stream the chart analysis as server-sent events, one extracted concept per event"""
+    data = request.get_json()
+    chart_text = data.get('chartText', '')
+    
+    if not chart_text:
+        return jsonify({'error': 'Chart text is required'}), 400
+    
+    return _sse_response(ai_service().stream_analysis(chart_text))
+
+@api_bp.route('/workup', methods=['POST'])
+@_admitted(prompts=3)
+def get_workup():
+    """Get suggestions, analysis and alerts for a chart in one concurrent pass"""
+    data = request.get_json()
+    chart_text = data.get('chartText', '')
+    
+    if not chart_text:
+        return jsonify({'error': 'Chart text is required'}), 400
+    try:
+        encounter_id = _encounter_id(data)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    try:
+        workup = ai_service().generate_workup(chart_text, encounter_id)
+        if 'suggestions' in workup['errors'] and 'analysis' in workup['errors']:
+            return jsonify({'error': workup['errors']['suggestions']}), 500
+        return jsonify(workup)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@api_bp.route('/batch', methods=['POST'])
+def run_batch():
+    """Code an array of charts, streaming one NDJSON result line per chart"""
+    data = request.get_json()
+    charts = data.get('charts', []) if isinstance(data, dict) else data
+    
+    if not charts or not isinstance(charts, list):
+        return jsonify({'error': 'At least one chart is required'}), 400
+    if not all(isinstance(chart, dict) for chart in charts):
+        return jsonify({'error': 'Each chart must be an object'}), 400
+
+    try:
+        concurrency = int(data.get('concurrency', BATCH_CONCURRENCY)) if isinstance(data, dict) else BATCH_CONCURRENCY
+    except (TypeError, ValueError):
+        return jsonify({'error': 'concurrency must be an integer'}), 400
+    if concurrency < 1:
+        return jsonify({'error': 'concurrency must be at least 1'}), 400
+
+    admit = None
+    if ADMISSION_ENABLED:
+        # A throttled client is turned away up front; once started, each chart
+        # waits for its client's tokens and a batch slot
+        client, controller = _client_key(), admission()
+        try:
+            controller.charge(client, estimate_prompt_tokens(0), BATCH)
+        except Rejected as e:
+            return _too_many(e)
+        admit = lambda chart: controller.hold(client, estimate_prompt_tokens(len(chart['chartText'])), BATCH)
+
+    # Clients may lower the concurrency but never exceed the server's cap
+    runner = BatchRunner(ai_service(), concurrency=min(concurrency, BATCH_CONCURRENCY), admit=admit)
+
+    def generate():
+        for record in runner.run(normalize_chart(chart, i) for i, chart in enumerate(charts)):
+            yield json.dumps(record) + '\n'
+        yield json.dumps({'summary': runner.get_stats()}) + '\n'
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+@api_bp.route('/jobs', methods=['POST'])
+def submit_job():
+    """Queue a suggestions, analysis or workup job and return its id without waiting"""
+    data = request.get_json()
+    job_type = data.get('type', '')
+    chart_text = data.get('chartText', '')
+    priority = data.get('priority', 'normal')
+
+    if job_type not in job_queue().handlers:
+        return jsonify({'error': f"type must be one of: {', '.join(sorted(job_queue().handlers))}"}), 400
+    if not chart_text:
+        return jsonify({'error': 'Chart text is required'}), 400
+    if priority not in JOB_PRIORITIES:
+        return jsonify({'error': f"priority must be one of: {', '.join(JOB_PRIORITIES)}"}), 400
+    try:
+        encounter_id = _encounter_id(data)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    if ADMISSION_ENABLED:
+        # Jobs run in model slots later but are charged to their client now
+        try:
+            admission().charge(_client_key(), estimate_prompt_tokens(len(chart_text), JOB_PROMPTS.get(job_type, 1)),
+                               _job_slot_class(JOB_PRIORITIES[priority]))
+        except Rejected as e:
+            return _too_many(e)
+
+    payload = {'chartText': chart_text}
+    if encounter_id:
+        payload['encounterId'] = encounter_id
+    try:
+        job = job_queue().submit(job_type, payload, JOB_PRIORITIES[priority])
+        return jsonify(job), 202
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@api_bp.route('/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """Get a job's status and result; ?wait=<seconds> long-polls until it finishes"""
+    try:
+        wait = float(request.args.get('wait', 0))
+    except ValueError:
+        return jsonify({'error': 'wait must be a number'}), 400
+
+    job = job_queue().wait(job_id, wait) if wait > 0 else job_queue().get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(job), 200 if job['status'] in ('done', 'failed') else 202
+
+@api_bp.route('/jobs/stats', methods=['GET'])
+def get_job_stats():
+    """Get job counts by status"""
+    return jsonify(job_queue().get_stats())
+
+@api_bp.route('/admission/stats', methods=['GET'])
+def get_admission_stats():
+    """Get model slot usage, waiting requests and client bucket settings of this worker"""
+    if not ADMISSION_ENABLED:
+        return jsonify({'enabled': False})
+    return jsonify({'enabled': True, **admission().get_stats()})
+
 @api_bp.route('/icd/search', methods=['GET'])
 def search_icd_codes():
-    """Search ICD codes based on query"""
+    """Search ICD codes based on query, one ranked page at a time"""
     query = request.args.get('query', '')
     
     if not query:
         return jsonify({'error': 'Search query is required'}), 400
+
+    try:
+        limit, offset = _pagination_args()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     
     try:
-        results = code_service.search_icd_codes(query)
+        results = code_service().search_icd_codes(query, limit, offset, request.args.get('category'))
         return jsonify(results)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @api_bp.route('/cpt/search', methods=['GET'])
 def search_cpt_codes():
-    """Search CPT codes based on query"""
+    """Search CPT codes based on query, one ranked page at a time"""
     query = request.args.get('query', '')
     
     if not query:
         return jsonify({'error': 'Search query is required'}), 400
+
+    try:
+        limit, offset = _pagination_args()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     
     try:
-        results = code_service.search_cpt_codes(query)
+        results = code_service().search_cpt_codes(query, limit, offset, request.args.get('category'))
         return jsonify(results)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @api_bp.route('/rationale', methods=['POST'])
+@_admitted()
 def get_rationale():
     """Get coding rationale for selected codes"""
     data = request.get_json()
@@ -79,9 +415,52 @@ def get_rationale():
         return jsonify({'error': 'At least one code is required'}), 400
     
     try:
-        rationale = ai_service.generate_rationale(cpt_codes, icd_codes)
+        rationale = ai_service().generate_rationale(cpt_codes, icd_codes)
         if "error" in rationale:
             return jsonify({'error': rationale["error"]}), 500
         return jsonify(rationale)
     except Exception as e:
-        return jsonify({'error': str(e)}), 500 
\ No newline at end of file
+        return jsonify({'error': str(e)}), 500 
+
+@api_bp.route('/models/stats', methods=['GET'])
+def get_model_stats():
+    """Get per-tier latency, error, token and cost stats, speculative agreement rates and circuit states"""
+    return jsonify({**ai_service().router.get_stats(), 'client': ai_service().gemini.get_stats()})
+
+@api_bp.route('/cache/stats', methods=['GET'])
+def get_cache_stats():
+    """Get hit/miss counters of the model response cache"""
+    return jsonify(ai_service().response_cache.get_stats())
+
+@api_bp.route('/audit/encounters', methods=['GET'])
+def get_audited_encounters():
+    """Encounters coded with ?code= between ?since= and ?until= (default: the last 30 days)"""
+    code = request.args.get('code', '')
+    if not code:
+        return jsonify({'error': 'code is required'}), 400
+    try:
+        since, until = _period_args()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    audit = ai_service().audit
+    if audit is None:
+        return jsonify({'error': 'The audit store is disabled'}), 404
+    try:
+        return jsonify(audit.encounters_with_code(code, since, until))
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@api_bp.route('/audit/latency', methods=['GET'])
+def get_audited_latency():
+    """Result counts, latency and tokens per prompt type between ?since= and ?until="""
+    try:
+        since, until = _period_args()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    audit = ai_service().audit
+    if audit is None:
+        return jsonify({'error': 'The audit store is disabled'}), 404
+    try:
+        return jsonify(audit.latency_by_prompt_type(since, until))
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
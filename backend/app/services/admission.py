@@ -0,0 +1,203 @@
+import os
+import math
+import time
+import heapq
+import itertools
+import threading
+from typing import Dict, Any, List, Optional
+
+from app.services.batch_runner import TokenBucket
+from app.services.prompt_builder import CHARS_PER_TOKEN
+from app.services.metrics import ADMISSION, ADMISSION_WAIT_SECONDS
+
+# --- Admission settings ---
+ADMISSION_ENABLED = os.getenv('ADMISSION_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+# Estimated prompt tokens one client (one Authorization header) may send per minute, and at once
+CLIENT_TOKENS_PER_MINUTE = float(os.getenv('CLIENT_TOKENS_PER_MINUTE', '200000'))
+CLIENT_BURST_TOKENS = int(os.getenv('CLIENT_BURST_TOKENS', '50000'))
+# Model-bound requests in flight across the server; match to the upstream quota
+# (about requests per minute x seconds per request / 60)
+ADMISSION_MAX_CONCURRENCY = int(os.getenv('ADMISSION_MAX_CONCURRENCY', '16'))
+# An interactive request waits this long for a free slot before getting a 429
+ADMISSION_MAX_WAIT_SECONDS = float(os.getenv('ADMISSION_MAX_WAIT_SECONDS', '5'))
+# Instructions each prompt adds to the chart, in tokens
+PROMPT_OVERHEAD_TOKENS = int(os.getenv('PROMPT_OVERHEAD_TOKENS', '600'))
+# Buckets of clients idle this long are full again and are forgotten
+CLIENT_IDLE_SECONDS = 600.0
+
+# Slot priorities: interactive requests are given free slots before batch work
+INTERACTIVE, BATCH = 0, 1
+PRIORITY_NAMES = {INTERACTIVE: 'interactive', BATCH: 'batch'}
+
+
+def estimate_prompt_tokens(chars: int, prompts: int = 1) -> int:
+    """Estimated prompt tokens of sending ``chars`` of input in ``prompts`` prompts."""
+    return prompts * (PROMPT_OVERHEAD_TOKENS + (chars + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN)
+
+
+class Rejected(Exception):
+    """A request was not admitted; the client may try again after ``retry_after`` seconds."""
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = max(1, math.ceil(retry_after))
+
+
+class PrioritySemaphore:
+    """Counting semaphore that hands a freed slot to the most urgent waiter first.
+
+    Waiters of equal priority are served in arrival order. A waiter that
+    gives up is skipped when its turn comes.
+    """
+
+    def __init__(self, slots: int):
+        self.slots = max(1, slots)
+        self.in_use = 0
+        self.hold_seconds = 1.0  # moving average of how long a slot is held
+        self._waiters: List[list] = []  # heap of [priority, arrival, event, state]
+        self._arrivals = itertools.count()
+        self._lock = threading.Lock()
+
+    def acquire(self, priority: int, timeout: Optional[float] = None) -> bool:
+        with self._lock:
+            if self.in_use < self.slots and not any(w[3] == 'waiting' and w[0] <= priority for w in self._waiters):
+                self.in_use += 1
+                return True
+            waiter = [priority, next(self._arrivals), threading.Event(), 'waiting']
+            heapq.heappush(self._waiters, waiter)
+        waiter[2].wait(timeout)
+        with self._lock:
+            if waiter[3] == 'granted':
+                return True
+            waiter[3] = 'gave_up'
+            return False
+
+    def release(self, held_seconds: float = None):
+        with self._lock:
+            if held_seconds is not None:
+                self.hold_seconds += 0.1 * (held_seconds - self.hold_seconds)
+            while self._waiters:
+                waiter = heapq.heappop(self._waiters)
+                if waiter[3] == 'waiting':
+                    # The slot passes straight to the waiter; in_use stays the same
+                    waiter[3] = 'granted'
+                    waiter[2].set()
+                    return
+            self.in_use -= 1
+
+    def waiting(self) -> Dict[str, int]:
+        with self._lock:
+            counts = {name: 0 for name in PRIORITY_NAMES.values()}
+            for waiter in self._waiters:
+                if waiter[3] == 'waiting':
+                    counts[PRIORITY_NAMES[waiter[0]]] += 1
+            return counts
+
+
+class Lease:
+    """A slot held by one request; released once, however many times ``release`` is called."""
+
+    def __init__(self, semaphore: PrioritySemaphore):
+        self.semaphore = semaphore
+        self.acquired_at = time.monotonic()
+        self._released = False
+        self._lock = threading.Lock()
+
+    def release(self):
+        with self._lock:
+            if self._released:
+                return
+            self._released = True
+        self.semaphore.release(time.monotonic() - self.acquired_at)
+
+    def __enter__(self) -> 'Lease':
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+
+class AdmissionController:
+    """Decides which model-bound requests run now, which wait and which are turned away.
+
+    Every client has a token bucket filled at ``tokens_per_minute``
+    estimated prompt tokens, so a client's share of the model follows
+    how much chart text it sends rather than how many requests. Requests
+    that pass their bucket then need one of ``max_concurrency`` slots,
+    which go to interactive requests before batch work. Interactive
+    requests wait at most ``max_wait_seconds`` for a slot; batch work
+    (charts of a /batch run, queued jobs) waits as long as it takes.
+
+    Limits are for the whole server and split evenly between its
+    ``processes`` (gunicorn workers), each of which has its own controller.
+    """
+
+    def __init__(self, tokens_per_minute: float = CLIENT_TOKENS_PER_MINUTE, burst_tokens: int = CLIENT_BURST_TOKENS,
+                 max_concurrency: int = ADMISSION_MAX_CONCURRENCY, max_wait_seconds: float = ADMISSION_MAX_WAIT_SECONDS,
+                 processes: int = None):
+        # Set by gunicorn.conf.py in each worker; read here because workers are forked after import
+        processes = max(1, processes or int(os.getenv('ADMISSION_PROCESSES', '1')))
+        self.tokens_per_minute = tokens_per_minute / processes
+        self.burst_tokens = max(1, burst_tokens // processes)
+        self.max_wait_seconds = max_wait_seconds
+        self.slots = PrioritySemaphore(max(1, max_concurrency // processes))
+        self._buckets: Dict[str, TokenBucket] = {}
+        self._lock = threading.Lock()
+        self._pruned_at = time.monotonic()
+
+    def _bucket(self, client: str) -> TokenBucket:
+        now = time.monotonic()
+        with self._lock:
+            if now - self._pruned_at > CLIENT_IDLE_SECONDS:
+                self._pruned_at = now
+                self._buckets = {key: bucket for key, bucket in self._buckets.items()
+                                 if now - bucket.updated_at < CLIENT_IDLE_SECONDS}
+            bucket = self._buckets.get(client)
+            if bucket is None:
+                bucket = self._buckets[client] = TokenBucket(self.tokens_per_minute, self.burst_tokens)
+            return bucket
+
+    def charge(self, client: str, tokens: int, priority: int = INTERACTIVE):
+        """Take ``tokens`` from the client's bucket, or raise Rejected if it has too few."""
+        wait_seconds = self._bucket(client).try_acquire(tokens)
+        if wait_seconds:
+            ADMISSION.inc(PRIORITY_NAMES[priority], 'throttled')
+            raise Rejected('Too many requests from this client', wait_seconds)
+
+    def slot(self, priority: int = INTERACTIVE, timeout: Optional[float] = None) -> Lease:
+        """Wait for a slot (up to ``timeout`` seconds) and return its lease, or raise Rejected."""
+        start = time.perf_counter()
+        acquired = self.slots.acquire(priority, timeout)
+        ADMISSION_WAIT_SECONDS.observe(time.perf_counter() - start, PRIORITY_NAMES[priority])
+        if not acquired:
+            ADMISSION.inc(PRIORITY_NAMES[priority], 'busy')
+            raise Rejected('The server is at capacity', self.slots.hold_seconds)
+        ADMISSION.inc(PRIORITY_NAMES[priority], 'admitted')
+        return Lease(self.slots)
+
+    def admit(self, client: str, tokens: int, priority: int = INTERACTIVE) -> Lease:
+        """Charge an interactive request and give it a slot, or raise Rejected without charging it."""
+        self.charge(client, tokens, priority)
+        try:
+            return self.slot(priority, self.max_wait_seconds)
+        except Rejected:
+            self._bucket(client).refund(tokens)
+            raise
+
+    def hold(self, client: str, tokens: int, priority: int = BATCH) -> Lease:
+        """Like ``admit`` for work that was already accepted: waits for tokens and a slot instead of failing."""
+        self._bucket(client).acquire(tokens)
+        return self.slot(priority)
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            clients = len(self._buckets)
+        return {
+            'slots': self.slots.slots,
+            'inUse': self.slots.in_use,
+            'waiting': self.slots.waiting(),
+            'avgHoldSeconds': round(self.slots.hold_seconds, 3),
+            'clients': clients,
+            'tokensPerMinute': self.tokens_per_minute,
+            'burstTokens': self.burst_tokens,
+        }
@@ -1,16 +1,138 @@
 import os
-import json
-import re
-from typing import List, Dict, Any
-from google import genai
+import time
+import inspect
+import hashlib
+import logging
+import functools
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Iterator, Optional, Tuple
 from google.genai import types
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, ConfigDict, Field, ValidationError
+from app.services.response_cache import ResponseCache, cache_key
+from app.services.json_stream import StreamingItemParser
+from app.services.json_repair import parse_model_json
+from app.services.chart_chunker import (
+    chunk_chart, merge_analyses, split_units, unit_key, attribute_analysis, CHUNK_THRESHOLD_CHARS,
+)
+from app.services.code_enrichment import CodeEnricher, get_enricher
+from app.services.prompt_builder import PromptBuilder
+from app.services.context_cache import ContextCacheManager, is_cache_error
+from app.services.model_router import ModelRouter, ModelTier
+from app.services.precoder import PreCoder, Precoding, get_precoder, PRECODER_ANSWERS, PRECODER_ENABLED
+from app.services.encounter_store import EncounterStore
+from app.services.audit_store import AuditStore, AuditTrace, current_trace, start_trace, end_trace, AUDIT_ENABLED
+from app.services.gemini_client import (
+    ResilientGeminiClient, CircuitOpenError, is_upstream_failure, GEMINI_POOL_SIZE,
+)
+from app.services.job_queue import JOB_WORKERS
+from app.services.metrics import GEMINI_STAGE_SECONDS, GEMINI_TOKENS, GEMINI_CACHE, GEMINI_ERRORS, PRECODER
+
+logger = logging.getLogger(__name__)
+
+# --- Model settings ---
+# Models and output limits are chosen per prompt by ModelRouter
+GENERATION_SETTINGS = {
+    'top_k': 32,
+    'top_p': 1,
+    'temperature': 0.4,
+}
+
+# Stands in for the chart in prompts whose chart is in the cached context
+CHART_IN_CONTEXT = '[The EMR chart is the first message of this conversation.]'
+
+# Threads shared by all concurrent prompt fan-outs in this process
+WORKUP_MAX_WORKERS = int(os.getenv('WORKUP_MAX_WORKERS', '8'))
+CHUNK_MAX_WORKERS = int(os.getenv('CHUNK_MAX_WORKERS', '8'))
+
+
+
+def stable_id(prefix: str, key: str, seen: Dict[str, int]) -> str:
+    """An id derived from what an item is rather than where it is, so re-runs keep it.
+
+    ``seen`` counts the ids already handed out in one result; a repeat
+    gets a ``-2``, ``-3``... suffix.
+    """
+    base = f'{prefix}-{key}'
+    seen[base] = seen.get(base, 0) + 1
+    return base if seen[base] == 1 else f'{base}-{seen[base]}'
+
+
+# Stream events and the result keys their items are collected under for the audit store
+STREAM_RESULT_KEYS = {'cptCode': 'cptCodes', 'icdCode': 'icdCodes'}
+
+
+def audited(prompt_type: str):
+    """Record each result of an AIService method, and the model calls behind it, in the audit store.
+
+    The method's ``chart_text`` and ``encounter_id`` arguments, when it
+    has them, are stored with the result. Calls made while another
+    audited method is running belong to that method's result.
+    """
+    def decorate(method):
+        signature = inspect.signature(method)
+
+        def begin(self, args, kwargs):
+            if self.audit is None or current_trace() is not None:
+                return None
+            arguments = signature.bind(self, *args, **kwargs).arguments
+            return AuditTrace(prompt_type, arguments.get('chart_text'), arguments.get('encounter_id'))
+
+        if inspect.isgeneratorfunction(method):
+            @functools.wraps(method)
+            def stream(self, *args, **kwargs):
+                trace = begin(self, args, kwargs)
+                if trace is None:
+                    yield from method(self, *args, **kwargs)
+                    return
+                events, error = [], None
+                iterator = method(self, *args, **kwargs)
+                try:
+                    while True:
+                        # Set around each step only: the caller runs between events
+                        token = start_trace(trace)
+                        try:
+                            event = next(iterator)
+                        except StopIteration:
+                            break
+                        finally:
+                            end_trace(token)
+                        events.append(event)
+                        yield event
+                except GeneratorExit:
+                    error = 'Stream closed before it finished'
+                    raise
+                except Exception as e:
+                    error = str(e)
+                    raise
+                finally:
+                    result: Dict[str, List[Any]] = {}
+                    for name, data in events:
+                        if name == 'analysisItem':
+                            result.setdefault(data['section'], []).append(data['item'])
+                        else:
+                            result.setdefault(STREAM_RESULT_KEYS.get(name, name), []).append(data)
+                    self.audit.record(trace, result, error)
+            return stream
+
+        @functools.wraps(method)
+        def call(self, *args, **kwargs):
+            trace = begin(self, args, kwargs)
+            if trace is None:
+                return method(self, *args, **kwargs)
+            token = start_trace(trace)
+            try:
+                result = method(self, *args, **kwargs)
+            except Exception as e:
+                self.audit.record(trace, None, str(e))
+                raise
+            finally:
+                end_trace(token)
+            self.audit.record(trace, result, result.get('error') if isinstance(result, dict) else None)
+            return result
+        return call
+    return decorate
 
-# --- Constants for Prompt File Paths ---
-PROMPT_DIR = os.path.join(os.path.dirname(__file__), '..', 'prompts')
-CONFIDENT_CODES_PROMPT_FILE = os.path.join(PROMPT_DIR, 'confident_codes.txt')
-SECTIONAL_ANALYSIS_PROMPT_FILE = os.path.join(PROMPT_DIR, 'sectional_analysis.txt')
-CODING_ALERTS_PROMPT_FILE = os.path.join(PROMPT_DIR, 'coding_alerts.txt')
 
 # --- Define schemas ---
 class AnalysisSubSection(BaseModel):
@@ -30,6 +152,9 @@ class ConfidentICD(BaseModel):
     rationale: str
 
 class ConfidentCPT(BaseModel):
+    # The prompt example shows numeric units; accept them as strings
+    model_config = ConfigDict(coerce_numbers_to_str=True)
+
     code: str
     modifiers: List[str] = Field(default_factory=list)
     units: str
@@ -43,225 +168,686 @@ class Alert(BaseModel):
     alerts: List[str] = Field(default_factory=list)
 
 class AIService:
-    def __init__(self):
-        self.genai_client = genai.Client(api_key=os.getenv("GEMINI_API_KEY"))
-        self._load_prompt_templates()
-
-    def _load_prompt_templates(self):
-        """Load prompt templates from files."""
-        def load_template(filepath):
-            try:
-                with open(filepath, 'r', encoding='utf-8') as f:
-                    return f.read()
-            except Exception as e:
-                print(f"Error loading prompt template {filepath}: {e}")
-                return None
-
-        self.confident_codes_template = load_template(CONFIDENT_CODES_PROMPT_FILE)
-        self.sectional_analysis_template = load_template(SECTIONAL_ANALYSIS_PROMPT_FILE)
-        self.coding_alerts_template = load_template(CODING_ALERTS_PROMPT_FILE)
-
-    def _clean_json_string(self, text: str) -> str:
-        """Extract JSON block from Gemini response."""
+    def __init__(self, response_cache: ResponseCache = None, enricher: CodeEnricher = None,
+                 prompts: PromptBuilder = None, router: ModelRouter = None, gemini: ResilientGeminiClient = None,
+                 precoder: PreCoder = None, encounters: EncounterStore = None, audit: AuditStore = None):
+        # Enough connections for every thread in this process that can be waiting on the model
+        self.gemini = gemini or ResilientGeminiClient(
+            GEMINI_POOL_SIZE or WORKUP_MAX_WORKERS + CHUNK_MAX_WORKERS + JOB_WORKERS)
+        self.response_cache = response_cache or ResponseCache()
+        self.enricher = enricher or get_enricher()
+        # Gives the model candidate codes as hints (and, with PRECODER_ANSWERS, answers routine encounters alone)
+        self.precoder = precoder or (get_precoder() if PRECODER_ENABLED else None)
+        # Previous versions of edited charts, so re-runs only redo what changed
+        self.encounters = encounters or EncounterStore()
+        # Every result, its cost and the model answers behind it, written off the request path
+        self.audit = audit or (AuditStore() if AUDIT_ENABLED else None)
+        self.context_cache = ContextCacheManager(self.gemini.client)
+        self.router = router or ModelRouter()
+        self.executor = ThreadPoolExecutor(max_workers=WORKUP_MAX_WORKERS, thread_name_prefix='gemini')
+        # Separate pool: chunked analysis may itself be running inside a workup task
+        self.chunk_executor = ThreadPoolExecutor(max_workers=CHUNK_MAX_WORKERS, thread_name_prefix='gemini-chunk')
+        # Templates are compiled once and reloaded when their files change
+        self.prompts = prompts or PromptBuilder()
+
+    def _generation_settings(self, prompt_type: str, tier: ModelTier) -> Dict[str, Any]:
+        settings = {**GENERATION_SETTINGS, 'max_output_tokens': self.router.route(prompt_type).max_output_tokens}
+        if tier.thinking_budget is not None:
+            settings['thinking_config'] = types.ThinkingConfig(thinking_budget=tier.thinking_budget)
+        return settings
+
+    def _generation_config(self, prompt_type: str, tier: ModelTier, response_schema=None,
+                           cached_content: str = None) -> types.GenerateContentConfig:
+        """Generation config shared by the blocking and streaming calls."""
+        return types.GenerateContentConfig(
+            **self._generation_settings(prompt_type, tier),
+            response_mime_type='application/json',
+            response_schema=response_schema,
+            cached_content=cached_content,
+            safety_settings=[
+                types.SafetySetting(
+                    category="HARM_CATEGORY_HATE_SPEECH",
+                    threshold="BLOCK_MEDIUM_AND_ABOVE"
+                ),
+                types.SafetySetting(
+                    category="HARM_CATEGORY_DANGEROUS_CONTENT",
+                    threshold="BLOCK_MEDIUM_AND_ABOVE"
+                ),
+                types.SafetySetting(
+                    category="HARM_CATEGORY_HARASSMENT",
+                    threshold="BLOCK_MEDIUM_AND_ABOVE"
+                ),
+                types.SafetySetting(
+                    category="HARM_CATEGORY_SEXUALLY_EXPLICIT",
+                    threshold="BLOCK_MEDIUM_AND_ABOVE"
+                ),
+            ]
+        )
+
+    def _cache_key(self, prompt_type: str, prompt_text: str, response_schema, tier: ModelTier) -> str:
+        return cache_key(prompt_type, prompt_text, tier.model, {
+            **self._generation_settings(prompt_type, tier),
+            'response_schema': response_schema.model_json_schema() if response_schema else None,
+        })
+
+    def _tier(self, prompt_type: str, prompt_text: str, tier: Optional[str]) -> ModelTier:
+        return self.router.tier(tier) if tier else self.router.choose(prompt_type, len(prompt_text))
+
+    def _prompt_context(self, template: Optional[str], prompt_text: str, model: str,
+                        share_chart: bool = False) -> Optional[Tuple[str, str]]:
+        """(cached content name, text still to send) for a chart prompt, or None to send it all inline.
+
+        With ``share_chart`` (several prompts about one encounter) the chart
+        is cached once and only the instructions are sent.
+        """
+        if template is None or not share_chart:
+            return None
+        prefix, closing = self.prompts.chart_parts(template)
+        chart_end = prompt_text.rfind(closing) if closing else len(prompt_text)
+        if not prompt_text.startswith(prefix) or chart_end < len(prefix):
+            return None  # the template was reloaded after the prompt was built
+        chart_text = prompt_text[len(prefix):chart_end]
+        name = self.context_cache.chart_cache(model, self.prompts.chart_context(chart_text))
+        return (name, prefix + CHART_IN_CONTEXT + prompt_text[chart_end:]) if name else None
+
+    def _stale(self, prompt_type: str, prompt_text: str, response_schema) -> Optional[Dict[str, Any]]:
+        """An expired cached answer to this prompt from any tier, for when the model is failing."""
+        for tier in self.router.tiers.values():
+            stale = self.response_cache.get_stale(self._cache_key(prompt_type, prompt_text, response_schema, tier))
+            if stale is not None:
+                GEMINI_CACHE.inc(prompt_type, 'stale')
+                return stale
+        return None
+
+    def _deadline(self, prompt_type: str) -> float:
+        return time.monotonic() + self.router.route(prompt_type).deadline
+
+    def _generate(self, prompt_type: str, tier: ModelTier, prompt_text: str, response_schema,
+                  context: Optional[Tuple[str, str]], deadline: float):
+        """One blocking model call, resending the prompt inline if its cached context has expired."""
+        name, contents = context if context else (None, prompt_text)
         try:
-            # First try to find a complete JSON block
-            match = re.search(r'```json\s*(\{.*?\})\s*```', text, re.DOTALL)
-            if match:
-                return match.group(1)
-
-            # If no complete block found, try to find the largest valid JSON object
-            first_brace = text.find('{')
-            if first_brace == -1:
-                return text.strip()
-
-            # Find all complete JSON objects
-            json_objects = []
-            stack = []
-            start = first_brace
-            
-            for i, char in enumerate(text[first_brace:], first_brace):
-                if char == '{':
-                    stack.append(i)
-                elif char == '}':
-                    if stack:
-                        start = stack.pop()
-                        if not stack:  # We found a complete object
-                            json_objects.append(text[start:i+1])
-            
-            if json_objects:
-                # Return the largest complete JSON object
-                return max(json_objects, key=len)
-
-            # If no complete objects found, try to fix common issues
-            text = text.strip()
-            
-            # Fix incomplete arrays
-            if text.count('[') > text.count(']'):
-                text += ']'
-            
-            # Fix incomplete objects
-            if text.count('{') > text.count('}'):
-                text += '}'
-            
-            # Fix trailing commas
-            text = re.sub(r',\s*([}\]])', r'\1', text)
-            
-            # Fix incomplete strings
-            text = re.sub(r'([^\\])"([^"]*?)(?=\s*[}\]])', r'\1"\2"', text)
-            
-            # Fix missing quotes around property names
-            text = re.sub(r'([{,])\s*([a-zA-Z_][a-zA-Z0-9_]*)\s*:', r'\1"\2":', text)
-            
-            return text
-
+            return self.gemini.generate(prompt_type, tier.model, contents,
+                                        self._generation_config(prompt_type, tier, response_schema, name), deadline)
         except Exception as e:
-            print(f"Error cleaning JSON string: {str(e)}")
-            return text.strip()
-
-    def _call_gemini(self, prompt_type: str, prompt_text: str, response_schema=None) -> Dict[str, Any]:
-        """Make call to Gemini API."""
+            if name is None or not is_cache_error(e):
+                raise
+            logger.warning("Cached context %s unavailable, sending prompt inline: %s", name, e)
+            self.context_cache.invalidate(name)
+            return self._generate(prompt_type, tier, prompt_text, response_schema, None, deadline)
+
+    def _generate_stream(self, prompt_type: str, tier: ModelTier, prompt_text: str, response_schema,
+                         context: Optional[Tuple[str, str]], deadline: float):
+        """Streaming counterpart of ``_generate``; falls back before the first chunk only."""
+        name, contents = context if context else (None, prompt_text)
         try:
-            print(f"Making Gemini API call for {prompt_type}")
-            print(f"Using model: gemini-2.5-pro-preview-03-25")
-            print(f"Prompt text: {prompt_text[:200]}...")  # Print first 200 chars of prompt
-            
-            response = self.genai_client.models.generate_content(
-                model="gemini-2.5-pro-preview-03-25",
-                contents=prompt_text,
-                config=types.GenerateContentConfig(
-                    max_output_tokens=10000,
-                    top_k=32,
-                    top_p=1,
-                    temperature=0.4,
-                    response_mime_type='application/json',
-                    response_schema=response_schema,
-                    safety_settings=[
-                        types.SafetySetting(
-                            category="HARM_CATEGORY_HATE_SPEECH",
-                            threshold="BLOCK_MEDIUM_AND_ABOVE"
-                        ),
-                        types.SafetySetting(
-                            category="HARM_CATEGORY_DANGEROUS_CONTENT",
-                            threshold="BLOCK_MEDIUM_AND_ABOVE"
-                        ),
-                        types.SafetySetting(
-                            category="HARM_CATEGORY_HARASSMENT",
-                            threshold="BLOCK_MEDIUM_AND_ABOVE"
-                        ),
-                        types.SafetySetting(
-                            category="HARM_CATEGORY_SEXUALLY_EXPLICIT",
-                            threshold="BLOCK_MEDIUM_AND_ABOVE"
-                        ),
-                    ]
-                )
-            )
-            print(f"Raw Gemini response: {response.text}")
-            cleaned_text = self._clean_json_string(response.text)
-            print(f"Cleaned JSON text: {cleaned_text}")
+            return self.gemini.generate_stream(prompt_type, tier.model, contents,
+                                               self._generation_config(prompt_type, tier, response_schema, name),
+                                               deadline)
+        except Exception as e:
+            if name is None or not is_cache_error(e):
+                raise
+            logger.warning("Cached context %s unavailable, sending prompt inline: %s", name, e)
+            self.context_cache.invalidate(name)
+            return self._generate_stream(prompt_type, tier, prompt_text, response_schema, None, deadline)
+
+    def _call_gemini(self, prompt_type: str, prompt_text: str, response_schema=None,
+                     template: str = None, share_chart: bool = False, tier: str = None) -> Dict[str, Any]:
+        """Make call to Gemini API, answering repeats from the response cache.
+
+        The model tier is picked by the router unless ``tier`` names one.
+        ``template`` names the template ``prompt_text`` was built from, which
+        lets its static parts (or, with ``share_chart``, the chart) come from
+        the model's context cache instead of being sent again.
+        """
+        model_tier = self._tier(prompt_type, prompt_text, tier)
+        key = self._cache_key(prompt_type, prompt_text, response_schema, model_tier)
+        cached = self._cached(prompt_type, model_tier, key)
+        if cached is not None:
+            return cached
+
+        start = time.perf_counter()
+        deadline = self._deadline(prompt_type)
+        try:
+            logger.info("Making Gemini API call for %s with model %s", prompt_type, model_tier.model)
+            # Prompts and responses contain PHI; only dump them when debugging
+            logger.debug("Prompt text: %s", prompt_text)
             
+            context = self._prompt_context(template, prompt_text, model_tier.model, share_chart)
             try:
-                result = json.loads(cleaned_text)
-                print(f"Parsed JSON result: {result}")
-                return result
-            except json.JSONDecodeError as e:
-                print(f"JSON decode error: {str(e)}")
-                # Try to extract partial results if possible
-                if '"suggestedIcd"' in cleaned_text and '"suggestedCpt"' in cleaned_text:
-                    # Extract the last complete object before the error
-                    last_complete = cleaned_text.rfind('},')
-                    if last_complete != -1:
-                        cleaned_text = cleaned_text[:last_complete+1] + ']}'
-                        try:
-                            result = json.loads(cleaned_text)
-                            print(f"Recovered partial result: {result}")
-                            return result
-                        except:
-                            pass
-                return {"error": f"Failed to parse JSON response: {str(e)}"}
+                with GEMINI_STAGE_SECONDS.time(prompt_type, 'llm'):
+                    response = self._generate(prompt_type, model_tier, prompt_text, response_schema, context, deadline)
+            except Exception:
+                self.router.record(model_tier, prompt_type, time.perf_counter() - start, error=True)
+                raise
+            latency = time.perf_counter() - start
+            self.router.record(model_tier, prompt_type, latency, response.usage_metadata)
+            self._record_usage(prompt_type, response)
+            logger.debug("Raw Gemini response: %s", response.text)
+
+            timings = {}
+            result, complete = parse_model_json(response.text, response_schema, timings)
+            for stage, seconds in timings.items():
+                GEMINI_STAGE_SECONDS.observe(seconds, prompt_type, stage)
+            self._audit_call(prompt_type, model_tier.model, 'model', key, latency, response.usage_metadata,
+                             None if result is not None else "Failed to parse JSON response",
+                             result if complete else None)
+            if result is None:
+                GEMINI_ERRORS.inc(prompt_type, 'JSONDecodeError')
+                return {"error": "Failed to parse JSON response"}
+            logger.debug("Parsed JSON result: %s", result)
+            if complete:
+                # Only complete parses are cached; recovered partials may be transient
+                self.response_cache.set(key, result)
+            else:
+                logger.warning("Recovered partial result for %s", prompt_type)
+            return result
                 
         except Exception as e:
-            print(f"Error in Gemini call ({prompt_type}): {str(e)}")
-            print(f"Error type: {type(e)}")
-            import traceback
-            print(f"Traceback: {traceback.format_exc()}")
+            GEMINI_ERRORS.inc(prompt_type, type(e).__name__)
+            upstream = is_upstream_failure(e) or isinstance(e, CircuitOpenError)
+            stale = self._stale(prompt_type, prompt_text, response_schema) if upstream else None
+            self._audit_call(prompt_type, model_tier.model, 'stale' if stale is not None else 'model', key,
+                             time.perf_counter() - start, error=str(e))
+            if stale is not None:
+                # An older answer beats none while the model is failing
+                logger.warning("Serving stale cached %s after: %s", prompt_type, e)
+                return stale
+            if upstream:
+                logger.error("Gemini call (%s) failed: %s", prompt_type, e)
+            else:
+                logger.exception("Error in Gemini call (%s)", prompt_type)
             return {"error": str(e)}
 
-    def generate_suggestions(self, chart_text: str) -> Dict[str, Any]:
-        """Generate CPT and ICD code suggestions based on chart text."""
-        print(f"Starting generate_suggestions with chart text: {chart_text[:200]}...")
-        
-        if not self.confident_codes_template:
-            print("Error: confident_codes_template is None")
+    def _stream_gemini(self, prompt_type: str, prompt_text: str, response_schema, keys: List[str],
+                       template: str = None, tier: str = None) -> Iterator[Tuple[str, Any]]:
+        """Stream a Gemini call, yielding (key, item) for each array item as soon as it is complete.
+
+        The complete response is parsed and cached at the end so a later
+        blocking call for the same prompt is a cache hit, and a cached
+        response is replayed item by item without calling the model.
+        """
+        model_tier = self._tier(prompt_type, prompt_text, tier)
+        key = self._cache_key(prompt_type, prompt_text, response_schema, model_tier)
+        cached = self._cached(prompt_type, model_tier, key)
+        if cached is not None:
+            for item_key in keys:
+                for item in cached.get(item_key) or []:
+                    yield item_key, item
+            return
+
+        logger.info("Making streaming Gemini API call for %s with model %s", prompt_type, model_tier.model)
+        parser = StreamingItemParser(keys)
+        chunks = []
+        start = time.perf_counter()
+        deadline = self._deadline(prompt_type)
+        last_chunk = None
+        yielded = False
+        try:
+            context = self._prompt_context(template, prompt_text, model_tier.model)
+            for chunk in self._generate_stream(prompt_type, model_tier, prompt_text, response_schema, context, deadline):
+                last_chunk = chunk
+                text = chunk.text or ''
+                chunks.append(text)
+                for item in parser.feed(text):
+                    yielded = True
+                    yield item
+        except Exception as e:
+            GEMINI_ERRORS.inc(prompt_type, type(e).__name__)
+            self.router.record(model_tier, prompt_type, time.perf_counter() - start, error=True)
+            stale = None
+            if not yielded and (is_upstream_failure(e) or isinstance(e, CircuitOpenError)):
+                stale = self._stale(prompt_type, prompt_text, response_schema)
+            self._audit_call(prompt_type, model_tier.model, 'stale' if stale is not None else 'model', key,
+                             time.perf_counter() - start, error=str(e))
+            if stale is None:
+                raise
+            logger.warning("Serving stale cached %s after: %s", prompt_type, e)
+            for item_key in keys:
+                for item in stale.get(item_key) or []:
+                    yield item_key, item
+            return
+        latency = time.perf_counter() - start
+        usage = getattr(last_chunk, 'usage_metadata', None)
+        GEMINI_STAGE_SECONDS.observe(latency, prompt_type, 'llm')
+        self.router.record(model_tier, prompt_type, latency, usage)
+        if last_chunk is not None:
+            # Usage metadata is cumulative; the final chunk carries the totals
+            self._record_usage(prompt_type, last_chunk)
+
+        result, complete = parse_model_json(''.join(chunks), response_schema)
+        self._audit_call(prompt_type, model_tier.model, 'model', key, latency, usage,
+                         None if result is not None else "Failed to parse JSON response",
+                         result if complete else None)
+        if complete:
+            self.response_cache.set(key, result)
+
+    def _cached(self, prompt_type: str, tier: ModelTier, key: str) -> Optional[Dict[str, Any]]:
+        """A stored answer to the request ``key``: from the response cache, else from the audit store."""
+        cached = self.response_cache.get(key)
+        if cached is not None:
+            GEMINI_CACHE.inc(prompt_type, 'hit')
+            logger.info("Cache hit for %s", prompt_type)
+            self._audit_call(prompt_type, tier.model, 'cache', key)
+            return cached
+        stored = self.audit.find_response(key) if self.audit is not None else None
+        if stored is not None:
+            GEMINI_CACHE.inc(prompt_type, 'audit_hit')
+            logger.info("Audit store hit for %s", prompt_type)
+            self._audit_call(prompt_type, tier.model, 'audit', key)
+            self.response_cache.set(key, stored)
+            return stored
+        GEMINI_CACHE.inc(prompt_type, 'miss')
+        return None
+
+    def _audit_call(self, prompt_type: str, model: str, source: str, key: str, latency: float = 0.0,
+                    usage=None, error: str = None, response: Any = None):
+        """Add a model call (or stored answer) to the result being audited, if any."""
+        trace = current_trace()
+        if trace is not None:
+            trace.add_call(prompt_type, model, source, latency, key, usage, error, response)
+
+    def _record_usage(self, prompt_type: str, response):
+        """Count prompt/response tokens reported in a response's usage metadata."""
+        usage = getattr(response, 'usage_metadata', None)
+        if usage is None:
+            return
+        if usage.prompt_token_count:
+            GEMINI_TOKENS.inc(prompt_type, 'prompt', amount=usage.prompt_token_count)
+        if usage.candidates_token_count:
+            GEMINI_TOKENS.inc(prompt_type, 'response', amount=usage.candidates_token_count)
+        if usage.cached_content_token_count:
+            # Included in the prompt count, but billed at the cached rate
+            GEMINI_TOKENS.inc(prompt_type, 'cached', amount=usage.cached_content_token_count)
+
+    def _format_cpt(self, cpt: Dict[str, Any], seen: Dict[str, int]) -> Dict[str, Any]:
+        modifiers = sorted(m.strip().upper() for m in cpt['modifiers'] if m.strip())
+        return {
+            'id': stable_id('cpt-ai', '-'.join([cpt['code'].strip().upper(), *modifiers]), seen),
+            'code': cpt['code'],
+            'description': '',  # Filled in from the catalog by CodeEnricher
+            'unit': cpt['units'],
+            'modifiers': ','.join(cpt['modifiers']),
+            'rationale': cpt['rationale'],
+            'relatedLink': '#',
+            'aapcGuidance': 'Verify documentation'
+        }
+
+    def _format_icd(self, icd: Dict[str, Any], seen: Dict[str, int]) -> Dict[str, Any]:
+        return {
+            'id': stable_id('icd-ai', icd['code'].strip().upper(), seen),
+            'code': icd['code'],
+            'description': '',  # Filled in from the catalog by CodeEnricher
+            'rationale': icd['rationale'],
+            'relatedSeriesCodes': []
+        }
+
+    def _format_analysis_item(self, section: str, item: Dict[str, Any], seen: Dict[str, int]) -> Dict[str, Any]:
+        code = item.get('related_codes', [''])[0] if item.get('related_codes') else None
+        key = str(code).strip().upper() if code else '-'.join(str(item.get('text_mention', '')).lower().split())[:60]
+        if section in ['symptoms', 'medications']:
+            return {
+                'id': stable_id(section, key, seen),
+                'description': item.get('text_mention', ''),
+                'rationale': item.get('rationale', ''),
+                'code': code
+            }
+        # diagnoses and procedures
+        return {
+            'id': stable_id(section, key, seen),
+            'code': code,
+            'description': item.get('text_mention', ''),
+            'rationale': item.get('rationale', '')
+        }
+
+    @audited("Confident Codes")
+    def generate_suggestions(self, chart_text: str, share_chart: bool = False, tier: str = None,
+                             encounter_id: str = None, original_chars: int = None) -> Dict[str, Any]:
+        """Generate CPT and ICD code suggestions based on chart text.
+
+        With ``encounter_id`` the result is stored as that encounter's
+        latest version and carries what changed since the previous one.
+        ``original_chars`` is the untrimmed length of an already trimmed
+        ``chart_text``, for the prompt size metrics.
+        """
+        if not self.prompts.is_loaded('confident_codes'):
+            logger.error("confident_codes template is not loaded")
             return {"error": "Prompt template not loaded"}
             
         try:
-            prompt = self.confident_codes_template.format(emr_text=chart_text)
-            print(f"Formatted prompt: {prompt[:200]}...")
-            
-            result = self._call_gemini("Confident Codes", prompt, ConfidentCode)
-            print(f"Raw result from Gemini: {result}")
-            
-            if "error" in result:
-                print(f"Error in result: {result['error']}")
-                return {"error": result["error"]}
+            prompt, precoded = self._suggestions_prompt(chart_text, original_chars)
+            result = precoded if precoded is not None else self._suggestions(prompt, share_chart, tier)
+            if encounter_id and "error" not in result:
+                result['encounter'] = self._suggestions_version(encounter_id, chart_text, result)
+            return result
+        except Exception as e:
+            logger.exception("Error in generate_suggestions")
+            return {"error": str(e)}
 
-            # Transform the result to match the expected format
+    def _suggestions_version(self, encounter_id: str, chart_text: str, result: Dict[str, Any]) -> Dict[str, Any]:
+        """Store suggestions as an encounter version; returns the changed sections and code ids added/removed.
+
+        Codes are chosen for the encounter as a whole (the E/M level
+        depends on all of it), so suggestions are always made from the full
+        chart; unchanged charts are answered from the response cache.
+        """
+        trimmed = self.prompts.trim_chart(chart_text)
+        units = {unit_key(unit): unit.name for unit in split_units(trimmed)}
+        previous = self.encounters.get(encounter_id, 'suggestions')
+        state = previous['state'] if previous else {'units': {}, 'codes': {'cpt': [], 'icd': []}}
+        codes = {'cpt': [code['id'] for code in result['cptCodes']], 'icd': [code['id'] for code in result['icdCodes']]}
+        changes = {}
+        for kind in ('cpt', 'icd'):
+            old, new = state['codes'][kind], codes[kind]
+            changes[kind] = {'added': [i for i in new if i not in old], 'removed': [i for i in old if i not in new]}
+        chart_hash = hashlib.sha256(trimmed.encode('utf-8')).hexdigest()
+        version = self.encounters.put(encounter_id, 'suggestions', chart_hash, {'units': units, 'codes': codes})
+        return {
+            'id': encounter_id,
+            'version': version,
+            'changedSections': sorted({name for key, name in units.items() if key not in state['units']})
+                               if previous else [],
+            'changes': changes,
+        }
+
+    def _precode(self, chart_text: str) -> Optional[Precoding]:
+        """Rule-based candidate codes for a trimmed chart, or None if the pre-coder is off or fails."""
+        if self.precoder is None:
+            return None
+        try:
+            with GEMINI_STAGE_SECONDS.time("Confident Codes", 'precode'):
+                return self.precoder.precode(chart_text)
+        except Exception:
+            logger.exception("Pre-coder failed")
+            return None
+
+    def _suggestions_prompt(self, chart_text: str,
+                            original_chars: int = None) -> Tuple[Optional[str], Optional[Dict[str, Any]]]:
+        """(confident_codes prompt, None), or (None, suggestions) when the pre-coder answers alone.
+
+        With ``PRECODER_ANSWERS``, charts the pre-coder is confident about
+        skip the model; otherwise its candidate codes are added to the
+        prompt as hints.
+        """
+        trimmed = self.prompts.trim_chart(chart_text)
+        precoding = self._precode(trimmed)
+        if precoding is not None and precoding.confident and PRECODER_ANSWERS:
+            result = self._transform_suggestions(precoding.as_model_output())
+            if all(code['valid'] and code['billable'] for code in result['cptCodes'] + result['icdCodes']):
+                PRECODER.inc('answered')
+                logger.info("Pre-coder answered suggestions without the model")
+                trace = current_trace()
+                if trace is not None:
+                    trace.rules = True
+                result['source'] = 'rules'
+                return None, result
+            PRECODER.inc('rejected')
+        elif precoding is not None:
+            PRECODER.inc('hinted' if precoding.icd or precoding.cpt else 'no_candidates')
+            logger.debug("Pre-coder deferred to the model: %s", '; '.join(precoding.reasons))
+        hints = precoding.hints() if precoding is not None else ''
+        prompt = self.prompts.chart_prompt('confident_codes', "Confident Codes", trimmed, trimmed=True,
+                                           original_chars=original_chars or len(chart_text), code_hints=hints)
+        return prompt, None
+
+    def _suggestions(self, prompt: str, share_chart: bool = False, tier: str = None) -> Dict[str, Any]:
+        result = self._call_gemini("Confident Codes", prompt, ConfidentCode, 'confident_codes', share_chart, tier)
+        
+        if "error" in result:
+            logger.warning("Error in suggestions result: %s", result['error'])
+            return {"error": result["error"]}
+        return self._transform_suggestions(result)
+
+    def _transform_suggestions(self, result: Dict[str, Any]) -> Dict[str, Any]:
+        """Format a ``ConfidentCode`` answer for the UI and fill it in from the catalog."""
+        seen: Dict[str, int] = {}
+        with GEMINI_STAGE_SECONDS.time("Confident Codes", 'transform'):
             transformed_result = {
-                'cptCodes': [
-                    {
-                        'id': f'cpt-ai-{i+1}',
-                        'code': cpt['code'],
-                        'description': '',  # Would need to be populated from a code database
-                        'unit': cpt['units'],
-                        'modifiers': ','.join(cpt['modifiers']),
-                        'rationale': cpt['rationale'],
-                        'relatedLink': '#',
-                        'aapcGuidance': 'Verify documentation'
-                    }
-                    for i, cpt in enumerate(result.get('suggestedCpt', []))
-                ],
-                'icdCodes': [
-                    {
-                        'id': f'icd-ai-{i+1}',
-                        'code': icd['code'],
-                        'description': '',  # Would need to be populated from a code database
-                        'rationale': icd['rationale'],
-                        'relatedSeriesCodes': []
-                    }
-                    for i, icd in enumerate(result.get('suggestedIcd', []))
-                ]
+                'cptCodes': [self._format_cpt(cpt, seen) for cpt in result.get('suggestedCpt', [])],
+                'icdCodes': [self._format_icd(icd, seen) for icd in result.get('suggestedIcd', [])]
             }
-            print(f"Transformed result: {transformed_result}")
-            return transformed_result
-            
+            # Descriptions, series codes and validity from the catalog, so the UI needs no lookups
+            self.enricher.enrich_suggestions(transformed_result)
+        logger.debug("Transformed result: %s", transformed_result)
+        return transformed_result
+
+    @audited("Confident Codes")
+    def speculative_suggestions(self, chart_text: str) -> Dict[str, Any]:
+        """Suggestions from the fast tier, returned before the usual tier has checked them.
+
+        The result carries ``speculative: True`` and the ``verifyTier`` to
+        pass to ``verify_suggestions``. When the router would use the fast
+        tier anyway, the usual tier's answer is already cached, or the fast
+        call fails, the usual tier's answer is returned instead.
+        """
+        if not self.prompts.is_loaded('confident_codes'):
+            logger.error("confident_codes template is not loaded")
+            return {"error": "Prompt template not loaded"}
+
+        try:
+            prompt, precoded = self._suggestions_prompt(chart_text)
+            if precoded is not None:
+                return precoded
+            verify_tier = self.router.choose("Confident Codes", len(prompt))
+            fast_tier = self.router.tier('fast')
+            if verify_tier is fast_tier or self.response_cache.get(
+                    self._cache_key("Confident Codes", prompt, ConfidentCode, verify_tier)) is not None:
+                return self._suggestions(prompt, tier=verify_tier.name)
+            result = self._suggestions(prompt, tier=fast_tier.name)
+            if "error" in result:
+                return self._suggestions(prompt, tier=verify_tier.name)
+            result['speculative'] = True
+            result['verifyTier'] = verify_tier.name
+            return result
         except Exception as e:
-            print(f"Error in generate_suggestions: {str(e)}")
-            print(f"Error type: {type(e)}")
-            import traceback
-            print(f"Traceback: {traceback.format_exc()}")
+            logger.exception("Error in speculative_suggestions")
             return {"error": str(e)}
 
-    def generate_alerts(self, chart_text: str) -> List[str]:
+    def verify_suggestions(self, chart_text: str, cpt_codes: List[str], icd_codes: List[str],
+                           tier: str = None) -> Dict[str, Any]:
+        """Rerun suggestions on ``tier`` and compare them with speculative codes.
+
+        Returns the verified suggestions plus ``changed`` and the codes
+        ``added``/``removed`` per code type, and records the agreement
+        for routing.
+        """
+        result = self.generate_suggestions(chart_text, tier=tier)
+        if "error" in result:
+            return result
+        changes = {}
+        for kind, key, guessed in (('cpt', 'cptCodes', cpt_codes), ('icd', 'icdCodes', icd_codes)):
+            verified = {str(code['code']).upper() for code in result[key]}
+            guessed = {str(code).upper() for code in guessed}
+            changes[kind] = {'added': sorted(verified - guessed), 'removed': sorted(guessed - verified)}
+        result['changed'] = any(change['added'] or change['removed'] for change in changes.values())
+        result['changes'] = changes
+        self.router.record_agreement("Confident Codes", not result['changed'])
+        return result
+
+    @audited("Alerts")
+    def generate_alerts(self, chart_text: str, share_chart: bool = False, original_chars: int = None) -> List[str]:
         """Generate coding alerts based on chart text."""
-        prompt = self.coding_alerts_template.format(emr_text=chart_text)
-        result = self._call_gemini("Alerts", prompt, Alert)
+        prompt = self.prompts.chart_prompt('coding_alerts', "Alerts", chart_text, original_chars=original_chars)
+        result = self._call_gemini("Alerts", prompt, Alert, 'coding_alerts', share_chart)
         return result.get('alerts', []) if "error" not in result else []
 
-    def generate_analysis(self, chart_text: str) -> Dict[str, Any]:
-        """Generate in-depth analysis of the medical chart."""
+    def generate_workup(self, chart_text: str, encounter_id: str = None) -> Dict[str, Any]:
+        """Run the suggestions, analysis and alerts prompts concurrently and merge the results.
+
+        Latency is that of the slowest prompt rather than the sum, and a
+        failing prompt is reported under 'errors' without discarding the others.
+        The chart is uploaded to the context cache once per model (when
+        large enough) and shared by the prompts routed to that model.
+        With ``encounter_id`` suggestions and analysis are versioned as in
+        ``generate_suggestions`` and ``generate_analysis``.
+        """
+        # Trimmed once for all three; the prompt size metrics still count the chart as submitted
+        original_chars = len(chart_text)
+        chart_text = self.prompts.trim_chart(chart_text)
+        futures = {
+            'suggestions': self.executor.submit(self.generate_suggestions, chart_text, True, None, encounter_id,
+                                                original_chars),
+            'analysis': self.executor.submit(self.generate_analysis, chart_text, True, encounter_id, original_chars),
+            'alerts': self.executor.submit(self.generate_alerts, chart_text, True, original_chars),
+        }
+
+        workup = {'cptCodes': [], 'icdCodes': [], 'alerts': [], 'analysis': None, 'errors': {}}
+        for part, future in futures.items():
+            try:
+                result = future.result()
+            except Exception as e:
+                logger.exception("Error in workup %s", part)
+                workup['errors'][part] = str(e)
+                continue
+
+            if part == 'alerts':
+                workup['alerts'] = result
+            elif "error" in result:
+                workup['errors'][part] = result["error"]
+            elif part == 'suggestions':
+                workup['cptCodes'] = result['cptCodes']
+                workup['icdCodes'] = result['icdCodes']
+                if 'encounter' in result:
+                    workup['encounter'] = result['encounter']
+            else:
+                workup['analysis'] = result
+        return workup
+
+    def _analysis_tier(self, trimmed: str) -> str:
+        """The tier the whole chart's analysis prompt is routed to.
+
+        Chunks and changed sections are small, but they need the model the
+        whole chart would get, not the one for prompts their size.
+        """
+        prompt_chars = len(self.prompts.templates['sectional_analysis'].render(emr_text=trimmed))
+        return self.router.choose("Analysis", prompt_chars).name
+
+    def _analyze_chunks(self, chart_text: str, original_chars: int, tier: str) -> Dict[str, Any]:
+        """Run the sectional-analysis prompt on section-aware chunks in parallel and merge them.
+
+        Latency follows the largest chunk rather than the whole chart.
+        Chunks that fail are skipped; the call only fails if all of them do.
+        ``chart_text`` is already trimmed; ``original_chars`` is its untrimmed length.
+        Every chunk goes to ``tier``.
+        """
+        chunks = chunk_chart(chart_text)
+        logger.info("Analyzing chart in %d chunks", len(chunks))
+        scale = original_chars / max(len(chart_text), 1)
+        futures = [
+            # With a copy of the context, so the chunks' calls count toward the audited result
+            self.chunk_executor.submit(
+                contextvars.copy_context().run, self._call_gemini, "Analysis",
+                self.prompts.chart_prompt('sectional_analysis', "Analysis", chunk.text, trimmed=True,
+                                          original_chars=round(len(chunk.text) * scale)),
+                SectionalAnalysis, 'sectional_analysis', False, tier
+            )
+            for chunk in chunks
+        ]
+        results, errors = [], []
+        for future in futures:
+            result = future.result()
+            if "error" in result:
+                errors.append(result["error"])
+            else:
+                results.append(result)
+        if not results:
+            return {"error": errors[0] if errors else "No chart content to analyze"}
+        return merge_analyses(results)
+
+    def _raw_analysis(self, trimmed: str, original_chars: int, share_chart: bool = False,
+                      tier: str = None) -> Dict[str, Any]:
+        """The SectionalAnalysis answer for trimmed chart text, chunked when it is long.
+
+        ``tier`` defaults to the one this text would be routed to whole.
+        """
+        # Trimmed before deciding whether to chunk: boilerplate should not force a split
+        if len(trimmed) > CHUNK_THRESHOLD_CHARS:
+            return self._analyze_chunks(trimmed, original_chars, tier or self._analysis_tier(trimmed))
+        prompt = self.prompts.chart_prompt('sectional_analysis', "Analysis", trimmed, trimmed=True,
+                                           original_chars=original_chars)
+        return self._call_gemini("Analysis", prompt, SectionalAnalysis, 'sectional_analysis', share_chart, tier)
+
+    def _incremental_analysis(self, encounter_id: str, trimmed: str, original_chars: int,
+                              share_chart: bool = False) -> Tuple[Dict[str, Any], Optional[Dict[str, Any]]]:
+        """Analyze only the parts of an encounter's chart that changed since its stored version.
+
+        The chart is split into units (sections, long ones by paragraph).
+        Units whose text is unchanged keep the items attributed to them last
+        time; new or edited units are analyzed together in one smaller call.
+        Items that could not be attributed to a unit are kept while the
+        chart only grows. Returns the raw merged result and the encounter
+        summary (None on error).
+        """
+        units = split_units(trimmed)
+        keys = [unit_key(unit) for unit in units]
+        previous = self.encounters.get(encounter_id, 'analysis')
+        known = previous['state']['units'] if previous else {}
+        changed = [unit for unit, key in zip(units, keys) if key not in known]
+        if previous is None:
+            result, analyzed = self._raw_analysis(trimmed, original_chars, share_chart), trimmed
+        elif changed:
+            analyzed = ''.join(unit.text for unit in changed)
+            scale = original_chars / max(len(trimmed), 1)
+            result = self._raw_analysis(analyzed, round(len(analyzed) * scale), tier=self._analysis_tier(trimmed))
+        else:
+            result, analyzed = {}, ''
+        if "error" in result:
+            return result, None
+
+        per_unit, loose = attribute_analysis(result, units if previous is None else changed)
+        if previous is not None:
+            per_unit.update({key: known[key] for key in keys if key in known})
+            if set(known) <= set(keys):
+                # Only additions: what could not be placed last time is still in the chart
+                loose = merge_analyses([previous['state']['loose'], loose])
+        merged = merge_analyses([per_unit[key] for key in keys] + [loose])
+
+        chart_hash = hashlib.sha256(trimmed.encode('utf-8')).hexdigest()
+        version = self.encounters.put(encounter_id, 'analysis', chart_hash, {
+            'units': {key: per_unit[key] for key in keys},
+            'loose': loose,
+        })
+        current = set(keys)
+        removed = [key for key in known if key not in current]
+        encounter = {
+            'id': encounter_id,
+            'version': version,
+            'changedSections': sorted({unit.name for unit in changed}) if previous else [],
+            'removedUnits': len(removed),
+            'reanalyzedChars': len(analyzed),
+        }
+        logger.info("Encounter %s v%d: re-analyzed %d of %d chars", encounter_id, version, len(analyzed), len(trimmed))
+        return merged, encounter
+
+    @audited("Analysis")
+    def generate_analysis(self, chart_text: str, share_chart: bool = False, encounter_id: str = None,
+                          original_chars: int = None) -> Dict[str, Any]:
+        """Generate in-depth analysis of the medical chart.
+
+        With ``encounter_id`` the chart is a new version of that encounter
+        and only its changed sections are sent to the model.
+        ``original_chars`` is the untrimmed length of an already trimmed
+        ``chart_text``, for the prompt size metrics.
+        """
         try:
-            prompt = self.sectional_analysis_template.format(emr_text=chart_text)
-            result = self._call_gemini("Analysis", prompt, SectionalAnalysis)
+            trimmed = self.prompts.trim_chart(chart_text)
+            original_chars = original_chars or len(chart_text)
+            encounter = None
+            if encounter_id:
+                result, encounter = self._incremental_analysis(encounter_id, trimmed, original_chars, share_chart)
+            else:
+                result = self._raw_analysis(trimmed, original_chars, share_chart)
             
             if "error" in result:
-                print(f"Error in analysis result: {result['error']}")
+                logger.warning("Error in analysis result: %s", result['error'])
                 return {"error": result["error"]}
 
             # Ensure we have a valid result structure
             if not isinstance(result, dict):
-                print(f"Invalid result type: {type(result)}")
+                logger.warning("Invalid result type: %s", type(result))
                 return {"error": "Invalid response format"}
 
+            transform_start = time.perf_counter()
             # Initialize default structure
             analysis = {
                 'symptoms': [],
@@ -271,62 +857,74 @@ class AIService:
             }
 
             # Safely extract and transform each section
+            seen: Dict[str, int] = {}
             for section in ['symptoms', 'diagnoses', 'medications', 'procedures']:
                 items = result.get(section, [])
                 if not isinstance(items, list):
-                    print(f"Invalid {section} format: {type(items)}")
+                    logger.warning("Invalid %s format: %s", section, type(items))
                     continue
 
                 for item in items:
                     try:
-                        if section in ['symptoms', 'medications']:
-                            analysis[section].append({
-                                'description': item.get('text_mention', ''),
-                                'rationale': item.get('rationale', ''),
-                                'code': item.get('related_codes', [''])[0] if item.get('related_codes') else None
-                            })
-                        else:  # diagnoses and procedures
-                            analysis[section].append({
-                                'code': item.get('related_codes', [''])[0] if item.get('related_codes') else None,
-                                'description': item.get('text_mention', ''),
-                                'rationale': item.get('rationale', '')
-                            })
+                        analysis[section].append(self._format_analysis_item(section, item, seen))
                     except Exception as e:
-                        print(f"Error processing {section} item: {str(e)}")
+                        logger.warning("Error processing %s item: %s", section, e)
                         continue
 
+            self.enricher.enrich_analysis(analysis)
+            GEMINI_STAGE_SECONDS.observe(time.perf_counter() - transform_start, "Analysis", 'transform')
+            if encounter is not None:
+                analysis['encounter'] = encounter
             return analysis
 
         except Exception as e:
-            print(f"Error in generate_analysis: {str(e)}")
-            print(f"Error type: {type(e)}")
-            import traceback
-            print(f"Traceback: {traceback.format_exc()}")
+            logger.exception("Error in generate_analysis")
             return {"error": str(e)}
 
+    @audited("Confident Codes")
+    def stream_suggestions(self, chart_text: str) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        """Yield ('cptCode' | 'icdCode', code) events as the model produces each code."""
+        prompt, precoded = self._suggestions_prompt(chart_text)
+        if precoded is not None:
+            for code in precoded['cptCodes']:
+                yield 'cptCode', code
+            for code in precoded['icdCodes']:
+                yield 'icdCode', code
+            return
+        seen: Dict[str, int] = {}
+        keys = ['suggestedCpt', 'suggestedIcd']
+        for key, item in self._stream_gemini("Confident Codes", prompt, ConfidentCode, keys, 'confident_codes'):
+            try:
+                if key == 'suggestedCpt':
+                    code = self.enricher.enrich_cpt(
+                        self._format_cpt(ConfidentCPT.model_validate(item).model_dump(), seen))
+                    event = 'cptCode'
+                else:
+                    code = self.enricher.enrich_icd(
+                        self._format_icd(ConfidentICD.model_validate(item).model_dump(), seen))
+                    event = 'icdCode'
+            except ValidationError as e:
+                logger.warning("Skipping invalid %s item: %s", key, e)
+                continue
+            yield event, code
+
+    @audited("Analysis")
+    def stream_analysis(self, chart_text: str) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        """Yield ('analysisItem', {'section', 'item'}) events as each concept is extracted."""
+        prompt = self.prompts.chart_prompt('sectional_analysis', "Analysis", chart_text)
+        sections = ['symptoms', 'diagnoses', 'medications', 'procedures']
+        seen: Dict[str, int] = {}
+        for section, item in self._stream_gemini("Analysis", prompt, SectionalAnalysis, sections, 'sectional_analysis'):
+            if not isinstance(item, dict):
+                continue
+            formatted = self.enricher.enrich_analysis_item(section, self._format_analysis_item(section, item, seen))
+            yield 'analysisItem', {'section': section, 'item': formatted}
+
+    @audited("Rationale")
     def generate_rationale(self, cpt_codes: List[Dict], icd_codes: List[Dict]) -> Dict[str, Any]:
         """Generate coding rationale for selected codes."""
-        # Create a prompt for rationale generation
-        prompt = f"""Analyze the following selected codes and provide a comprehensive coding rationale:
-
-CPT Codes:
-{json.dumps(cpt_codes, indent=2)}
-
-ICD Codes:
-{json.dumps(icd_codes, indent=2)}
-
-Please provide your analysis in the following JSON format:
-{{
-    "overallRationale": "Overall explanation of code selection",
-    "codeRationales": {{
-        "cpt": {{
-            "code": "Rationale for this code"
-        }},
-        "icd": {{
-            "code": "Rationale for this code"
-        }}
-    }}
-}}"""
+        # Only the fields the model needs, as compact JSON
+        prompt = self.prompts.rationale_prompt(cpt_codes, icd_codes)
 
         result = self._call_gemini("Rationale", prompt)
         
@@ -0,0 +1,189 @@
+import os
+import json
+import time
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from contextlib import nullcontext
+from typing import Dict, Any, Callable, ContextManager, Iterable, Iterator, Optional, Set
+
+# --- Batch settings ---
+BATCH_CONCURRENCY = int(os.getenv('BATCH_CONCURRENCY', '4'))
+BATCH_RATE_PER_MINUTE = float(os.getenv('BATCH_RATE_PER_MINUTE', '60'))
+BATCH_MAX_RETRIES = int(os.getenv('BATCH_MAX_RETRIES', '5'))
+BATCH_BACKOFF_BASE_SECONDS = 2.0
+BATCH_BACKOFF_MAX_SECONDS = 120.0
+
+QUOTA_ERROR_MARKERS = ('429', 'RESOURCE_EXHAUSTED', 'quota', 'rate limit')
+
+
+def is_quota_error(message: str) -> bool:
+    """True if an error message looks like an upstream quota/rate limit rejection."""
+    message = message.lower()
+    return any(marker.lower() in message for marker in QUOTA_ERROR_MARKERS)
+
+
+def backoff_delay(attempt: int) -> float:
+    """Exponential backoff with full jitter for the given retry attempt (0-based)."""
+    ceiling = min(BATCH_BACKOFF_MAX_SECONDS, BATCH_BACKOFF_BASE_SECONDS * (2 ** attempt))
+    return random.uniform(0, ceiling)
+
+
+class TokenBucket:
+    """Thread-safe token bucket: ``rate_per_minute`` steady rate with a small burst."""
+
+    def __init__(self, rate_per_minute: float, burst: int = 1):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = max(1, burst)
+        self.tokens = float(self.capacity)
+        self.updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def try_acquire(self, amount: float = 1) -> float:
+        """Take ``amount`` tokens (at most the capacity) and return 0, or return the seconds until they are there."""
+        amount = min(amount, self.capacity)
+        with self._lock:
+            self._refill(time.monotonic())
+            if self.tokens >= amount:
+                self.tokens -= amount
+                return 0.0
+            return (amount - self.tokens) / self.rate
+
+    def acquire(self, amount: float = 1):
+        """Block until ``amount`` tokens are available, then take them."""
+        while True:
+            wait_seconds = self.try_acquire(amount)
+            if not wait_seconds:
+                return
+            time.sleep(wait_seconds)
+
+    def refund(self, amount: float):
+        """Give back tokens taken for work that was not done."""
+        with self._lock:
+            self._refill(time.monotonic())
+            self.tokens = min(self.capacity, self.tokens + min(amount, self.capacity))
+
+
+def read_charts(filepath: str) -> Iterator[Dict[str, Any]]:
+    """Yield charts from a JSONL file or a file holding one JSON array."""
+    with open(filepath, 'r', encoding='utf-8') as f:
+        first = f.read(1)
+        while first and first.isspace():
+            first = f.read(1)
+        f.seek(0)
+        if first == '[':
+            charts = json.load(f)
+        else:
+            charts = (json.loads(line) for line in f if line.strip())
+        for index, chart in enumerate(charts):
+            yield normalize_chart(chart, index)
+
+
+def normalize_chart(chart: Dict[str, Any], index: int) -> Dict[str, Any]:
+    """Give every chart a string id; falls back to its position in the input."""
+    chart_id = chart.get('id') or chart.get('encounterId') or str(index)
+    return {'id': str(chart_id), 'chartText': chart.get('chartText', '')}
+
+
+def completed_ids(output_path: str) -> Set[str]:
+    """Ids already written to an output file, used as the resume checkpoint."""
+    done = set()
+    if not os.path.exists(output_path):
+        return done
+    with open(output_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # A line cut short by the interruption; that chart is redone
+                continue
+            if record.get('status') == 'ok':
+                done.add(record['id'])
+    return done
+
+
+class BatchRunner:
+    """Codes many charts through ``AIService.generate_suggestions``.
+
+    At most ``concurrency`` charts are in flight, calls are paced by a token
+    bucket, and quota rejections are retried with jittered backoff. Results
+    are yielded as they complete so callers can stream them to disk.
+    ``admit(chart)``, when given, returns a context manager each attempt
+    runs inside (e.g. the server's admission control).
+    """
+
+    def __init__(self, ai_service, concurrency: int = BATCH_CONCURRENCY,
+                 rate_per_minute: float = BATCH_RATE_PER_MINUTE, max_retries: int = BATCH_MAX_RETRIES,
+                 admit: Optional[Callable[[Dict[str, Any]], ContextManager]] = None):
+        self.ai_service = ai_service
+        self.concurrency = max(1, concurrency)
+        self.max_retries = max_retries
+        self.admit = admit
+        self.rate_limiter = TokenBucket(rate_per_minute, burst=self.concurrency)
+        self.stats = {'completed': 0, 'failed': 0, 'skipped': 0, 'retries': 0}
+        self.started_at = None
+        self._lock = threading.Lock()
+
+    def _code_chart(self, chart: Dict[str, Any]) -> Dict[str, Any]:
+        if not chart['chartText']:
+            return {'id': chart['id'], 'status': 'error', 'error': 'Chart text is required', 'attempts': 0}
+
+        attempt = 0
+        while True:
+            self.rate_limiter.acquire()
+            try:
+                with self.admit(chart) if self.admit else nullcontext():
+                    result = self.ai_service.generate_suggestions(chart['chartText'])
+            except Exception as e:
+                result = {"error": str(e)}
+            attempt += 1
+
+            if "error" in result and is_quota_error(result["error"]) and attempt <= self.max_retries:
+                with self._lock:
+                    self.stats['retries'] += 1
+                time.sleep(backoff_delay(attempt - 1))
+                continue
+
+            if "error" in result:
+                return {'id': chart['id'], 'status': 'error', 'error': result["error"], 'attempts': attempt}
+            return {'id': chart['id'], 'status': 'ok', 'result': result, 'attempts': attempt}
+
+    def _record(self, record: Dict[str, Any]) -> Dict[str, Any]:
+        with self._lock:
+            self.stats['completed' if record['status'] == 'ok' else 'failed'] += 1
+        return record
+
+    def run(self, charts: Iterable[Dict[str, Any]], skip_ids: Set[str] = frozenset()) -> Iterator[Dict[str, Any]]:
+        """Yield one result record per chart, in completion order."""
+        self.started_at = time.monotonic()
+        with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix='batch') as pool:
+            pending = set()
+            for chart in charts:
+                if chart['id'] in skip_ids:
+                    self.stats['skipped'] += 1
+                    continue
+                # Keep the input lazy: only pull another chart once a slot frees up
+                if len(pending) >= self.concurrency:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        yield self._record(future.result())
+                pending.add(pool.submit(self._code_chart, chart))
+
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield self._record(future.result())
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Counters plus throughput in charts per minute since ``run`` started."""
+        with self._lock:
+            stats = dict(self.stats)
+        elapsed = time.monotonic() - self.started_at if self.started_at else 0.0
+        processed = stats['completed'] + stats['failed']
+        stats['elapsed_seconds'] = round(elapsed, 2)
+        stats['charts_per_minute'] = round(processed * 60 / elapsed, 2) if elapsed else 0.0
+        return stats
@@ -0,0 +1,210 @@
+import os
+import re
+import hashlib
+from typing import List, Dict, Any, NamedTuple, Tuple
+
+# --- Chunking settings ---
+# Charts shorter than this are analyzed in a single call
+CHUNK_THRESHOLD_CHARS = int(os.getenv('CHUNK_THRESHOLD_CHARS', '12000'))
+CHUNK_MAX_CHARS = int(os.getenv('CHUNK_MAX_CHARS', '6000'))
+# Sections longer than this are re-analyzed paragraph by paragraph after an edit
+INCREMENTAL_UNIT_CHARS = int(os.getenv('INCREMENTAL_UNIT_CHARS', '2000'))
+
+ANALYSIS_SECTIONS = ['diagnoses', 'symptoms', 'medications', 'procedures']
+
+# Canonical section names and the headers charts commonly use for them
+SECTION_HEADERS = {
+    'chief_complaint': ['chief complaint', 'cc', 'reason for visit'],
+    'hpi': ['history of present illness', 'hpi', 'interval history', 'subjective'],
+    'history': ['past medical history', 'pmh', 'past surgical history', 'psh',
+                'family history', 'social history', 'medical history'],
+    'ros': ['review of systems', 'ros'],
+    'medications': ['medications', 'current medications', 'meds', 'medication list',
+                    'home medications', 'discharge medications'],
+    'allergies': ['allergies'],
+    'exam': ['physical exam', 'physical examination', 'exam', 'objective', 'vitals', 'vital signs'],
+    'results': ['labs', 'laboratory', 'results', 'imaging', 'diagnostics'],
+    'assessment_plan': ['assessment and plan', 'assessment/plan', 'assessment & plan', 'a/p',
+                        'assessment', 'plan', 'impression', 'diagnosis', 'diagnoses'],
+    'procedures': ['procedures', 'procedure', 'procedure note', 'operative note', 'orders'],
+    'course': ['hospital course', 'progress note', 'progress notes', 'addendum'],
+}
+
+_PARAGRAPH_BREAK_RE = re.compile(r'\n[ \t]*\n')
+_HEADER_NAMES = {alias: name for name, aliases in SECTION_HEADERS.items() for alias in aliases}
+_HEADER_RE = re.compile(
+    r'^[ \t]*(' + '|'.join(sorted((re.escape(a) for a in _HEADER_NAMES), key=len, reverse=True)) + r')[ \t]*:',
+    re.IGNORECASE | re.MULTILINE,
+)
+
+
+class ChartSection(NamedTuple):
+    name: str
+    text: str
+
+
+class ChartChunk(NamedTuple):
+    sections: List[str]
+    text: str
+
+
+def split_sections(chart_text: str) -> List[ChartSection]:
+    """Split a chart on recognised section headers ("HPI:", "Assessment/Plan:", ...).
+
+    Text before the first header is kept as a 'preamble' section.
+    """
+    sections = []
+    matches = list(_HEADER_RE.finditer(chart_text))
+    if not matches or matches[0].start() > 0:
+        end = matches[0].start() if matches else len(chart_text)
+        if chart_text[:end].strip():
+            sections.append(ChartSection('preamble', chart_text[:end]))
+    for i, match in enumerate(matches):
+        end = matches[i + 1].start() if i + 1 < len(matches) else len(chart_text)
+        name = _HEADER_NAMES[match.group(1).lower()]
+        sections.append(ChartSection(name, chart_text[match.start():end]))
+    return sections
+
+
+def _split_long_text(text: str, max_chars: int) -> List[str]:
+    """Split on line boundaries so no piece exceeds ``max_chars``."""
+    pieces, current = [], ''
+    for line in text.splitlines(keepends=True):
+        while len(line) > max_chars:
+            if current:
+                pieces.append(current)
+                current = ''
+            pieces.append(line[:max_chars])
+            line = line[max_chars:]
+        if len(current) + len(line) > max_chars:
+            pieces.append(current)
+            current = ''
+        current += line
+    if current.strip():
+        pieces.append(current)
+    return pieces
+
+
+def chunk_chart(chart_text: str, max_chars: int = CHUNK_MAX_CHARS) -> List[ChartChunk]:
+    """Group consecutive sections into chunks of at most ``max_chars``.
+
+    Sections are never split unless a single section is itself too long,
+    so each chunk carries its own headers (HPI, Assessment/Plan, ...) as
+    context for the model.
+    """
+    chunks: List[ChartChunk] = []
+    names: List[str] = []
+    current = ''
+    for section in split_sections(chart_text):
+        if len(section.text) > max_chars:
+            if current:
+                chunks.append(ChartChunk(names, current))
+                names, current = [], ''
+            for piece in _split_long_text(section.text, max_chars):
+                chunks.append(ChartChunk([section.name], piece))
+            continue
+        if current and len(current) + len(section.text) > max_chars:
+            chunks.append(ChartChunk(names, current))
+            names, current = [], ''
+        names.append(section.name)
+        current += section.text
+    if current.strip():
+        chunks.append(ChartChunk(names, current))
+    return chunks
+
+
+def _merge_key(item: Dict[str, Any]) -> str:
+    codes = item.get('related_codes') or []
+    if codes:
+        return 'code:' + codes[0].strip().upper()
+    return 'text:' + ' '.join(str(item.get('text_mention', '')).lower().split())
+
+
+def merge_analyses(results: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Merge per-chunk SectionalAnalysis results in chunk order.
+
+    Items describing the same concept (same primary code, or same mention
+    when there is no code) collapse into the first occurrence, which keeps
+    its rationale and source_snippet; related codes from later duplicates
+    are appended. The output depends only on the order of ``results``.
+    """
+    merged: Dict[str, List[Dict[str, Any]]] = {section: [] for section in ANALYSIS_SECTIONS}
+    for section in ANALYSIS_SECTIONS:
+        seen: Dict[str, Dict[str, Any]] = {}
+        for result in results:
+            for item in result.get(section) or []:
+                if not isinstance(item, dict):
+                    continue
+                key = _merge_key(item)
+                existing = seen.get(key)
+                if existing is None:
+                    item = dict(item, related_codes=list(item.get('related_codes') or []))
+                    seen[key] = item
+                    merged[section].append(item)
+                    continue
+                known = {c.strip().upper() for c in existing['related_codes']}
+                for code in item.get('related_codes') or []:
+                    if code.strip().upper() not in known:
+                        known.add(code.strip().upper())
+                        existing['related_codes'].append(code)
+    return merged
+
+
+def split_units(chart_text: str) -> List[ChartSection]:
+    """Split a chart into the units an edit invalidates: sections, with long ones cut at blank lines.
+
+    Every boundary depends only on the text around it, so an edit changes
+    the units it touches and no others, and the units joined give back
+    ``chart_text``.
+    """
+    units = []
+    for section in split_sections(chart_text):
+        if len(section.text) <= INCREMENTAL_UNIT_CHARS:
+            units.append(section)
+            continue
+        start = 0
+        for match in _PARAGRAPH_BREAK_RE.finditer(section.text):
+            units.append(ChartSection(section.name, section.text[start:match.end()]))
+            start = match.end()
+        if start < len(section.text):
+            units.append(ChartSection(section.name, section.text[start:]))
+    return units
+
+
+def _normalized(text: str) -> str:
+    return ' '.join(text.lower().split())
+
+
+def unit_key(unit: ChartSection) -> str:
+    """Content address of a unit; reflowing whitespace does not change it."""
+    return hashlib.sha256(f'{unit.name}\0{_normalized(unit.text)}'.encode('utf-8')).hexdigest()
+
+
+def attribute_analysis(result: Dict[str, Any],
+                       units: List[ChartSection]) -> Tuple[Dict[str, Dict[str, Any]], Dict[str, Any]]:
+    """Split a SectionalAnalysis result by the units its items were found in.
+
+    An item belongs to every unit containing its source_snippet, or failing
+    that its text_mention, so it survives while any of them is unchanged.
+    Returns per-unit results keyed by ``unit_key`` and the items that could
+    not be placed.
+    """
+    keys = [unit_key(unit) for unit in units]
+    texts = [_normalized(unit.text) for unit in units]
+    per_unit = {key: {section: [] for section in ANALYSIS_SECTIONS} for key in keys}
+    loose: Dict[str, Any] = {section: [] for section in ANALYSIS_SECTIONS}
+    for section in ANALYSIS_SECTIONS:
+        for item in result.get(section) or []:
+            if not isinstance(item, dict):
+                continue
+            homes = []
+            for field in ('source_snippet', 'text_mention'):
+                needle = _normalized(str(item.get(field) or ''))
+                homes = [key for key, text in zip(keys, texts) if needle and needle in text]
+                if homes:
+                    break
+            for key in dict.fromkeys(homes):
+                per_unit[key][section].append(item)
+            if not homes:
+                loose[section].append(item)
+    return per_unit, loose
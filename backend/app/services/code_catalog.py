@@ -0,0 +1,221 @@
+import os
+import re
+import csv
+import bisect
+import logging
+import threading
+from array import array
+from typing import List, Dict, Any, Optional, Iterable, Tuple, Callable, TypeVar
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar('T')
+
+# --- Constants for Catalog File Paths ---
+DATA_DIR = os.path.join(os.path.dirname(__file__), '..', 'data')
+ICD_CATALOG_FILE = os.getenv('ICD_CATALOG_PATH', os.path.join(DATA_DIR, 'icd10cm_codes.tsv'))
+CPT_CATALOG_FILE = os.getenv('CPT_CATALOG_PATH', os.path.join(DATA_DIR, 'cpt_codes.tsv'))
+
+_TOKEN_RE = re.compile(r'[a-z0-9]+')
+
+# ICD-10-CM chapters keyed by the first letter of the code, used when a
+# catalog file (e.g. the CMS code order file) carries no category column.
+ICD_CHAPTERS = {
+    'A': 'Infectious Diseases', 'B': 'Infectious Diseases',
+    'C': 'Neoplasms', 'D': 'Neoplasms',
+    'E': 'Endocrine', 'F': 'Mental Health', 'G': 'Nervous System',
+    'H': 'Eye and Ear', 'I': 'Cardiovascular', 'J': 'Respiratory',
+    'K': 'Digestive', 'L': 'Skin', 'M': 'Musculoskeletal',
+    'N': 'Genitourinary', 'O': 'Pregnancy', 'P': 'Perinatal',
+    'Q': 'Congenital', 'R': 'Symptoms',
+    'S': 'Injury and Poisoning', 'T': 'Injury and Poisoning',
+    'U': 'Special Purposes',
+    'V': 'External Causes', 'W': 'External Causes', 'X': 'External Causes', 'Y': 'External Causes',
+    'Z': 'Factors Influencing Health',
+}
+
+
+def normalize_code(code: str) -> str:
+    """Normalize a code for lookups: upper case, no dot, no whitespace."""
+    return code.replace('.', '').strip().upper()
+
+
+def tokenize(text: str) -> List[str]:
+    """Split free text into lower-case alphanumeric tokens."""
+    return _TOKEN_RE.findall(text.lower())
+
+
+def _dot_icd(code: str) -> str:
+    """Insert the ICD-10-CM dot after the category (first three characters)."""
+    code = normalize_code(code)
+    return code if len(code) <= 3 else f"{code[:3]}.{code[3:]}"
+
+
+class CodeTable:
+    """Read-only code table stored as parallel arrays sorted by normalized code.
+
+    Codes are kept sorted so code prefix search is a pair of bisects, and
+    descriptions are indexed by token into sorted ``array('I')`` posting
+    lists so description search never scans the table. Ranking lives in
+    ``code_search.CodeSearchEngine``.
+    """
+
+    def __init__(self, kind: str, rows: Iterable[Dict[str, Any]]):
+        self.kind = kind
+        rows = sorted(rows, key=lambda r: normalize_code(r['code']))
+
+        self.keys: List[str] = []
+        self.codes: List[str] = []
+        self.descriptions: List[str] = []
+        self.categories: List[str] = []
+        self.category_ids = array('H')
+        self.modifiers: List[Tuple[str, ...]] = []
+        self.units: List[str] = []
+
+        category_lookup: Dict[str, int] = {}
+        modifier_lookup: Dict[Tuple[str, ...], Tuple[str, ...]] = {}
+        postings: Dict[str, List[int]] = {}
+
+        for row_id, row in enumerate(rows):
+            self.keys.append(normalize_code(row['code']))
+            self.codes.append(row['code'])
+            self.descriptions.append(row['description'])
+
+            category = row.get('category', '')
+            if category not in category_lookup:
+                category_lookup[category] = len(self.categories)
+                self.categories.append(category)
+            self.category_ids.append(category_lookup[category])
+
+            if kind == 'cpt':
+                # Most CPT rows share one of a handful of modifier sets
+                modifiers = tuple(row.get('modifiers', ()))
+                self.modifiers.append(modifier_lookup.setdefault(modifiers, modifiers))
+                self.units.append(row.get('units', '1'))
+
+            for token in set(tokenize(row['description'])):
+                postings.setdefault(token, []).append(row_id)
+
+        self.postings: Dict[str, array] = {token: array('I', ids) for token, ids in postings.items()}
+        self.vocabulary: List[str] = sorted(self.postings)
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def row(self, row_id: int) -> Dict[str, Any]:
+        """Materialize the API representation of one row."""
+        result = {
+            'code': self.codes[row_id],
+            'description': self.descriptions[row_id],
+            'category': self.categories[self.category_ids[row_id]],
+        }
+        if self.kind == 'cpt':
+            result['modifiers'] = list(self.modifiers[row_id])
+            result['units'] = self.units[row_id]
+        return result
+
+    def find(self, code: str) -> Optional[int]:
+        """Return the row id of an exact code, or None."""
+        key = normalize_code(code)
+        i = bisect.bisect_left(self.keys, key)
+        if i < len(self.keys) and self.keys[i] == key:
+            return i
+        return None
+
+    def code_prefix_range(self, prefix: str) -> range:
+        """Row ids whose normalized code starts with ``prefix``."""
+        prefix = normalize_code(prefix)
+        if not prefix:
+            return range(0)
+        lo = bisect.bisect_left(self.keys, prefix)
+        hi = bisect.bisect_left(self.keys, prefix + '\uffff', lo)
+        return range(lo, hi)
+
+    def vocabulary_prefix(self, prefix: str) -> List[str]:
+        """Indexed description tokens that start with ``prefix``."""
+        lo = bisect.bisect_left(self.vocabulary, prefix)
+        hi = bisect.bisect_left(self.vocabulary, prefix + '\uffff', lo)
+        return self.vocabulary[lo:hi]
+
+
+def _read_rows(filepath: str, kind: str) -> List[Dict[str, Any]]:
+    """Read catalog rows from a TSV file or a CMS-style fixed width code file."""
+    rows = []
+    with open(filepath, 'r', encoding='utf-8') as f:
+        if filepath.endswith('.tsv'):
+            for record in csv.DictReader(f, delimiter='\t'):
+                row = {
+                    'code': record['code'].strip(),
+                    'description': record['description'].strip(),
+                    'category': (record.get('category') or '').strip(),
+                }
+                if kind == 'cpt':
+                    modifiers = record.get('modifiers') or ''
+                    row['modifiers'] = [m.strip() for m in modifiers.split(',') if m.strip()]
+                    row['units'] = (record.get('units') or '1').strip()
+                rows.append(row)
+        else:
+            # e.g. icd10cm_codes_2025.txt: "A000    Cholera due to Vibrio cholerae..."
+            for line in f:
+                parts = line.rstrip('\n').split(None, 1)
+                if len(parts) != 2:
+                    continue
+                code, description = parts
+                row = {'code': code, 'description': description.strip(), 'category': ''}
+                if kind == 'icd':
+                    row['code'] = _dot_icd(code)
+                    row['category'] = ICD_CHAPTERS.get(row['code'][0], '')
+                else:
+                    row['modifiers'] = []
+                    row['units'] = '1'
+                rows.append(row)
+    return rows
+
+
+def load_code_table(filepath: str, kind: str) -> CodeTable:
+    """Load a code table from disk, returning an empty table if it is missing."""
+    try:
+        rows = _read_rows(filepath, kind)
+    except Exception as e:
+        logger.error("Error loading %s catalog %s: %s", kind, filepath, e)
+        rows = []
+    return CodeTable(kind, rows)
+
+
+class CodeCatalog:
+    """The ICD-10-CM and CPT code tables, loaded once per process.
+
+    Loaded in a forking server's master (see ``app.preload_shared_state``),
+    the tables and every index built with ``shared`` are inherited by the
+    workers and shared copy-on-write instead of rebuilt in each of them.
+    """
+
+    def __init__(self, icd_path: str = ICD_CATALOG_FILE, cpt_path: str = CPT_CATALOG_FILE):
+        self.icd = load_code_table(icd_path, 'icd')
+        self.cpt = load_code_table(cpt_path, 'cpt')
+        self._shared: Dict[str, Any] = {}
+        self._shared_lock = threading.Lock()
+
+    def shared(self, name: str, build: Callable[['CodeCatalog'], T]) -> T:
+        """The read-only index ``name``, built from this catalog with ``build(catalog)`` on first use."""
+        index = self._shared.get(name)
+        if index is None:
+            with self._shared_lock:
+                index = self._shared.get(name)
+                if index is None:
+                    index = self._shared[name] = build(self)
+        return index
+
+
+_catalog: Optional[CodeCatalog] = None
+_catalog_lock = threading.Lock()
+
+
+def get_catalog() -> CodeCatalog:
+    """Return the process-wide catalog, loading it on first use."""
+    global _catalog
+    if _catalog is None:
+        with _catalog_lock:
+            if _catalog is None:
+                _catalog = CodeCatalog()
+    return _catalog
@@ -0,0 +1,139 @@
+import os
+import re
+from typing import List, Dict, Any, Optional
+
+from app.services.code_catalog import CodeCatalog, CodeTable, normalize_code, get_catalog
+
+# --- Enrichment settings ---
+MAX_SERIES_CODES = int(os.getenv('MAX_SERIES_CODES', '10'))
+
+_ICD_FORMAT_RE = re.compile(r'^[A-Z][0-9][0-9A-Z](?:\.?[0-9A-Z]{1,4})?$')
+_CPT_FORMAT_RE = re.compile(r'^(?:[0-9]{4}[0-9FTU]|[A-V][0-9]{4})$')
+# "CPT:71046", "ICD-10: I10", "HCPCS J1100" as written in analysis output
+_SYSTEM_PREFIX_RE = re.compile(r'^\s*(ICD-?10(?:-?CM)?|CPT|HCPCS)\s*:?\s*', re.IGNORECASE)
+
+# Analysis sections whose related codes come from each table
+ICD_SECTIONS = ('diagnoses', 'symptoms')
+CPT_SECTIONS = ('procedures',)
+
+
+class _TableIndex:
+    """Hash index by normalized code plus the precomputed ICD hierarchy of one table."""
+
+    def __init__(self, table: CodeTable):
+        self.table = table
+        self.rows: Dict[str, int] = {key: i for i, key in enumerate(table.keys)}
+        self.billable = bytearray(b'\x01') * len(table)
+        self.series: Dict[str, range] = {}
+        if table.kind != 'icd':
+            return
+        keys = table.keys
+        for i, key in enumerate(keys):
+            # Keys are sorted, so a code's children immediately follow it;
+            # a code with children is a header and cannot be billed
+            if i + 1 < len(keys) and keys[i + 1].startswith(key):
+                self.billable[i] = 0
+            for parent in (self.parent(key), key[:3]):
+                if parent not in self.series:
+                    self.series[parent] = table.code_prefix_range(parent)
+
+    @staticmethod
+    def parent(key: str) -> str:
+        """The subcategory (or, for three-character codes, category) a code belongs to."""
+        return key[:-1] if len(key) > 3 else key[:3]
+
+    def series_codes(self, key: str, row_id: Optional[int]) -> List[str]:
+        """Other codes in the same subcategory, falling back to the category."""
+        codes = []
+        for parent in dict.fromkeys((self.parent(key), key[:3])):
+            for i in self.series.get(parent, ()):
+                if i != row_id and self.billable[i]:
+                    codes.append(self.table.codes[i])
+                    if len(codes) >= MAX_SERIES_CODES:
+                        return codes
+            if codes:
+                break
+        return codes
+
+
+class CodeEnricher:
+    """Fills model-suggested codes in from the catalog in one pass, with no extra requests.
+
+    Suggested codes gain their description, category and (CPT) allowed
+    modifiers, ICD codes list sibling codes from the same subcategory, and
+    every code is flagged ``valid`` (well-formed and in the catalog) and
+    ``billable`` (ICD: not a header code with children).
+    """
+
+    def __init__(self, catalog: CodeCatalog):
+        self.icd = _TableIndex(catalog.icd)
+        self.cpt = _TableIndex(catalog.cpt)
+
+    def _lookup(self, index: _TableIndex, code: str):
+        key = normalize_code(code)
+        return key, index.rows.get(key)
+
+    def enrich_icd(self, item: Dict[str, Any]) -> Dict[str, Any]:
+        """Fill one suggested ICD code dict in place and return it."""
+        code = str(item.get('code') or '').strip().upper()
+        key, row_id = self._lookup(self.icd, code)
+        well_formed = bool(_ICD_FORMAT_RE.match(code))
+        if row_id is not None:
+            item['code'] = self.icd.table.codes[row_id]
+            item['description'] = item.get('description') or self.icd.table.descriptions[row_id]
+            item['category'] = self.icd.table.categories[self.icd.table.category_ids[row_id]]
+        item['relatedSeriesCodes'] = self.icd.series_codes(key, row_id) if well_formed else []
+        item['valid'] = well_formed and row_id is not None
+        item['billable'] = item['valid'] and bool(self.icd.billable[row_id])
+        return item
+
+    def enrich_cpt(self, item: Dict[str, Any]) -> Dict[str, Any]:
+        """Fill one suggested CPT code dict in place and return it."""
+        code = str(item.get('code') or '').strip().upper()
+        _, row_id = self._lookup(self.cpt, code)
+        if row_id is not None:
+            item['description'] = item.get('description') or self.cpt.table.descriptions[row_id]
+            item['category'] = self.cpt.table.categories[self.cpt.table.category_ids[row_id]]
+            item['allowedModifiers'] = list(self.cpt.table.modifiers[row_id])
+        else:
+            item['allowedModifiers'] = []
+        item['valid'] = bool(_CPT_FORMAT_RE.match(code)) and row_id is not None
+        item['billable'] = item['valid']
+        return item
+
+    def enrich_suggestions(self, suggestions: Dict[str, Any]) -> Dict[str, Any]:
+        """Enrich every code of a ``{cptCodes, icdCodes}`` result in place."""
+        for item in suggestions.get('cptCodes', []):
+            self.enrich_cpt(item)
+        for item in suggestions.get('icdCodes', []):
+            self.enrich_icd(item)
+        return suggestions
+
+    def enrich_analysis_item(self, section: str, item: Dict[str, Any]) -> Dict[str, Any]:
+        """Add the catalog description and validity of a formatted analysis item's code."""
+        if section in ICD_SECTIONS:
+            index, pattern = self.icd, _ICD_FORMAT_RE
+        elif section in CPT_SECTIONS:
+            index, pattern = self.cpt, _CPT_FORMAT_RE
+        else:
+            return item
+        code = _SYSTEM_PREFIX_RE.sub('', str(item.get('code') or '')).upper()
+        if not code:
+            return item
+        _, row_id = self._lookup(index, code)
+        item['codeDescription'] = index.table.descriptions[row_id] if row_id is not None else ''
+        item['valid'] = bool(pattern.match(code)) and row_id is not None
+        return item
+
+    def enrich_analysis(self, analysis: Dict[str, Any]) -> Dict[str, Any]:
+        """Enrich every item of a formatted analysis result in place."""
+        for section, items in analysis.items():
+            if isinstance(items, list):
+                for item in items:
+                    self.enrich_analysis_item(section, item)
+        return analysis
+
+
+def get_enricher() -> CodeEnricher:
+    """The enricher of the process-wide catalog."""
+    return get_catalog().shared('enricher', CodeEnricher)
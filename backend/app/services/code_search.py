@@ -0,0 +1,205 @@
+import re
+import math
+import heapq
+import bisect
+from array import array
+from typing import List, Dict, Optional, Tuple
+
+from app.services.code_catalog import CodeTable, normalize_code, tokenize
+
+# --- Ranking parameters ---
+BM25_K1 = 1.2
+BM25_B = 0.75
+CODE_EXACT_BOOST = 100.0
+CODE_PREFIX_BOOST = 50.0
+PREFIX_TERM_WEIGHT = 0.8
+FUZZY_TERM_WEIGHT = 0.5
+
+# --- Bounds that keep per-keystroke work independent of catalog size ---
+DEFAULT_LIMIT = 20
+MAX_LIMIT = 100
+MAX_OFFSET = 1000
+MIN_PREFIX_LENGTH = 2
+MAX_PREFIX_EXPANSIONS = 50
+MAX_FUZZY_EXPANSIONS = 10
+MAX_CODE_PREFIX_HITS = 500
+MAX_CANDIDATES = 5000
+
+_CODE_QUERY_RE = re.compile(r'^[A-Za-z0-9.]+$')
+
+
+def _contains(postings: array, row: int) -> bool:
+    i = bisect.bisect_left(postings, row)
+    return i < len(postings) and postings[i] == row
+
+
+def _trigrams(term: str) -> List[str]:
+    padded = f"${term}$"
+    return [padded[i:i + 3] for i in range(len(padded) - 2)]
+
+
+def _within_distance(a: str, b: str, max_distance: int) -> bool:
+    """Levenshtein check that stops as soon as a whole row exceeds the limit."""
+    if abs(len(a) - len(b)) > max_distance:
+        return False
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        current = [i] + [0] * len(b)
+        for j, cb in enumerate(b, 1):
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ca != cb))
+        if min(current) > max_distance:
+            return False
+        previous = current
+    return previous[-1] <= max_distance
+
+
+class CodeSearchEngine:
+    """Ranked, typo tolerant search over one ``CodeTable``.
+
+    Descriptions are scored with BM25, the last query token is expanded as
+    a prefix for search-as-you-type, tokens that match nothing fall back to
+    trigram candidates confirmed by edit distance, and exact or prefix code
+    matches are boosted above any description match.
+    """
+
+    def __init__(self, table: CodeTable):
+        self.table = table
+        n = len(table)
+
+        lengths = [len(tokenize(d)) for d in table.descriptions]
+        avg_length = (sum(lengths) / n) if n else 1.0
+        # Descriptions are short, so every term is scored with tf=1 and the
+        # BM25 length normalization can be folded into one factor per row
+        self.length_factor = array('f', [
+            (BM25_K1 + 1) / (1 + BM25_K1 * (1 - BM25_B + BM25_B * length / avg_length))
+            for length in lengths
+        ])
+        self.idf: Dict[str, float] = {
+            term: math.log(1 + (n - len(ids) + 0.5) / (len(ids) + 0.5))
+            for term, ids in table.postings.items()
+        }
+
+        trigram_index: Dict[str, List[int]] = {}
+        for term_id, term in enumerate(table.vocabulary):
+            for gram in set(_trigrams(term)):
+                trigram_index.setdefault(gram, []).append(term_id)
+        self.trigram_index: Dict[str, array] = {g: array('I', ids) for g, ids in trigram_index.items()}
+
+        self.category_lookup = {name.lower(): i for i, name in enumerate(table.categories)}
+
+    def _fuzzy_terms(self, token: str) -> List[str]:
+        """Vocabulary terms within a small edit distance of ``token``."""
+        if len(token) < 4:
+            return []
+        grams = set(_trigrams(token))
+        shared: Dict[int, int] = {}
+        for gram in grams:
+            for term_id in self.trigram_index.get(gram, ()):
+                shared[term_id] = shared.get(term_id, 0) + 1
+
+        max_distance = 1 if len(token) <= 5 else 2
+        min_shared = max(1, len(grams) - 3 * max_distance)
+        candidates = heapq.nlargest(
+            MAX_FUZZY_EXPANSIONS * 4,
+            (item for item in shared.items() if item[1] >= min_shared),
+            key=lambda item: item[1],
+        )
+        vocabulary = self.table.vocabulary
+        terms = [vocabulary[term_id] for term_id, _ in candidates
+                 if _within_distance(token, vocabulary[term_id], max_distance)]
+        return terms[:MAX_FUZZY_EXPANSIONS]
+
+    def _expand(self, token: str, is_last: bool) -> List[Tuple[str, float]]:
+        """Index terms a query token may match, each with a score weight."""
+        postings = self.table.postings
+        terms = []
+        if token in postings:
+            terms.append((token, 1.0))
+        if is_last and len(token) >= MIN_PREFIX_LENGTH:
+            prefixed = [t for t in self.table.vocabulary_prefix(token) if t != token]
+            # Keep the most common completions; rare ones rarely help a typeahead box
+            prefixed = heapq.nlargest(MAX_PREFIX_EXPANSIONS, prefixed, key=lambda t: len(postings[t]))
+            terms.extend((t, PREFIX_TERM_WEIGHT) for t in prefixed)
+        if not terms:
+            terms.extend((t, FUZZY_TERM_WEIGHT) for t in self._fuzzy_terms(token))
+        return terms
+
+    def _score_descriptions(self, tokens: List[str]) -> Dict[int, float]:
+        """BM25 scores for rows whose description matches every query token."""
+        if not tokens:
+            return {}
+        expansions = []
+        for i, token in enumerate(tokens):
+            terms = self._expand(token, is_last=(i == len(tokens) - 1))
+            if not terms:
+                return {}
+            expansions.append(terms)
+
+        postings = self.table.postings
+        # Seed candidates from the most selective token, then probe the rest
+        expansions.sort(key=lambda terms: sum(len(postings[t]) for t, _ in terms))
+        first, rest = expansions[0], expansions[1:]
+
+        # Very unselective queries ("unspecified") are ranked over a capped
+        # candidate set so a single keystroke never scores the whole catalog
+        scores: Dict[int, float] = {}
+        for term, weight in first:
+            term_score = self.idf[term] * weight
+            for row in postings[term][:MAX_CANDIDATES]:
+                if term_score > scores.get(row, 0.0):
+                    scores[row] = term_score
+            if len(scores) >= MAX_CANDIDATES:
+                break
+
+        for terms in rest:
+            next_scores: Dict[int, float] = {}
+            for row, score in scores.items():
+                best = 0.0
+                for term, weight in terms:
+                    term_score = self.idf[term] * weight
+                    if term_score > best and _contains(postings[term], row):
+                        best = term_score
+                if best:
+                    next_scores[row] = score + best
+            scores = next_scores
+            if not scores:
+                break
+
+        length_factor = self.length_factor
+        return {row: score * length_factor[row] for row, score in scores.items()}
+
+    def search(self, query: str, limit: int = DEFAULT_LIMIT, offset: int = 0,
+               category: Optional[str] = None) -> List[int]:
+        """Return one page of row ids ranked best first."""
+        query = query.strip()
+        limit = max(0, min(limit, MAX_LIMIT))
+        offset = max(0, offset)
+        if not query or not limit:
+            return []
+
+        category_id = None
+        if category:
+            category_id = self.category_lookup.get(category.strip().lower())
+            if category_id is None:
+                return []
+
+        scores = self._score_descriptions(tokenize(query))
+
+        if _CODE_QUERY_RE.match(query):
+            key = normalize_code(query)
+            keys = self.table.keys
+            hits = self.table.code_prefix_range(key)
+            for row in hits[:MAX_CODE_PREFIX_HITS]:
+                if keys[row] == key:
+                    boost = CODE_EXACT_BOOST
+                else:
+                    # Closer completions (fewer extra characters) rank higher
+                    boost = CODE_PREFIX_BOOST - (len(keys[row]) - len(key))
+                scores[row] = scores.get(row, 0.0) + boost
+
+        if category_id is not None:
+            category_ids = self.table.category_ids
+            scores = {row: s for row, s in scores.items() if category_ids[row] == category_id}
+
+        ranked = heapq.nsmallest(offset + limit, scores, key=lambda row: (-scores[row], row))
+        return ranked[offset:]
@@ -0,0 +1,134 @@
+import os
+import time
+import hashlib
+import logging
+import threading
+from typing import Dict, Any, List, Optional
+
+from google.genai import types
+
+from app.services.metrics import CONTEXT_CACHE
+
+logger = logging.getLogger(__name__)
+
+# --- Context cache settings ---
+CONTEXT_CACHE_ENABLED = os.getenv('CONTEXT_CACHE_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+# Charts are only reused by the prompts of one encounter
+CONTEXT_CACHE_CHART_TTL_SECONDS = int(os.getenv('CONTEXT_CACHE_CHART_TTL_SECONDS', '600'))
+# The API rejects caches below a model-specific size; smaller content is sent inline.
+# Set to use one minimum for every model instead of MODEL_MIN_CACHE_TOKENS.
+CONTEXT_CACHE_MIN_TOKENS = int(os.getenv('CONTEXT_CACHE_MIN_TOKENS', '0')) or None
+# Smallest cacheable content per model family (by substring of the model name), in tokens
+MODEL_MIN_CACHE_TOKENS = {'flash': 1024, 'pro': 2048}
+# For models not listed above
+DEFAULT_MIN_CACHE_TOKENS = 4096
+# A cached handle this close to expiry is not handed out (a request may outlive it)
+EXPIRY_MARGIN_SECONDS = 60
+# After a failed upload, send the content inline for this long before trying again
+FAILURE_BACKOFF_SECONDS = 300
+# Cache uploads are an optimization; never let one hold up a request for long
+UPLOAD_TIMEOUT_MS = 10000
+
+CHARS_PER_TOKEN = 4
+
+
+def min_cache_tokens(model: str) -> int:
+    """The smallest content, in tokens, the API accepts as a context cache for ``model``."""
+    model = model.lower()
+    for family, tokens in MODEL_MIN_CACHE_TOKENS.items():
+        if family in model:
+            return tokens
+    return DEFAULT_MIN_CACHE_TOKENS
+
+
+def is_cache_error(error: Exception) -> bool:
+    """Whether a failed request points at a missing or expired cached content."""
+    code = getattr(error, 'code', None)
+    return code in (403, 404) or (code == 400 and 'cache' in str(error).lower())
+
+
+class _Entry:
+    def __init__(self, name: Optional[str], expires_at: float):
+        self.name = name              # None marks a failed upload
+        self.expires_at = expires_at
+
+
+class ContextCacheManager:
+    """Uploads an encounter's chart once and hands out cached-content names.
+
+    Entries are keyed by a hash of the model and content, so every prompt
+    sending the same chart to the same model shares one upload. Content
+    below the model's minimum cache size is not uploaded, and any failure
+    (API errors, an expired handle reported by the model call) makes
+    callers fall back to sending the prompt inline. The static prompt
+    instructions are far below every model's minimum, so they are not
+    cached on their own.
+    """
+
+    def __init__(self, client, enabled: bool = CONTEXT_CACHE_ENABLED,
+                 min_tokens: Optional[int] = CONTEXT_CACHE_MIN_TOKENS):
+        self.client = client
+        self.enabled = enabled
+        self.min_tokens = min_tokens
+        self._entries: Dict[str, _Entry] = {}
+        self._lock = threading.Lock()
+        # Striped so concurrent requests for one key wait for a single upload
+        self._upload_locks = [threading.Lock() for _ in range(16)]
+
+    def _get(self, model: str, kind: str, text: str, ttl_seconds: int, build_config) -> Optional[str]:
+        if not self.enabled or len(text) // CHARS_PER_TOKEN < (self.min_tokens or min_cache_tokens(model)):
+            return None
+        key = hashlib.sha256(f'{model}\0{kind}\0{text}'.encode('utf-8')).hexdigest()
+        now = time.time()
+        entry = self._entries.get(key)
+        if entry is not None and entry.expires_at - EXPIRY_MARGIN_SECONDS > now:
+            CONTEXT_CACHE.inc(kind, 'reuse' if entry.name else 'skip')
+            return entry.name
+
+        # One upload per key even when many requests arrive together
+        with self._upload_locks[int(key[:8], 16) % len(self._upload_locks)]:
+            entry = self._entries.get(key)
+            if entry is not None and entry.expires_at - EXPIRY_MARGIN_SECONDS > time.time():
+                CONTEXT_CACHE.inc(kind, 'reuse' if entry.name else 'skip')
+                return entry.name
+            self._prune()
+            try:
+                cached = self.client.caches.create(model=model, config=build_config(f'{ttl_seconds}s'))
+                self._entries[key] = _Entry(cached.name, time.time() + ttl_seconds)
+                CONTEXT_CACHE.inc(kind, 'create')
+                logger.info("Created %s context cache %s", kind, cached.name)
+                return cached.name
+            except Exception as e:
+                self._entries[key] = _Entry(None, time.time() + FAILURE_BACKOFF_SECONDS)
+                CONTEXT_CACHE.inc(kind, 'error')
+                logger.warning("Could not create %s context cache, sending inline: %s", kind, e)
+                return None
+
+    def _prune(self):
+        now = time.time()
+        with self._lock:
+            for key in [k for k, e in self._entries.items() if e.expires_at <= now]:
+                del self._entries[key]
+
+    def chart_cache(self, model: str, chart_context: str) -> Optional[str]:
+        """Cached content holding one encounter's chart as the first user turn."""
+        return self._get(model, 'chart', chart_context, CONTEXT_CACHE_CHART_TTL_SECONDS, lambda ttl: types.CreateCachedContentConfig(
+            contents=[types.Content(role='user', parts=[types.Part(text=chart_context)])],
+            ttl=ttl, display_name='encounter-chart', http_options=types.HttpOptions(timeout=UPLOAD_TIMEOUT_MS)))
+
+    def invalidate(self, name: str):
+        """Forget a handle the API no longer recognizes."""
+        with self._lock:
+            for key, entry in list(self._entries.items()):
+                if entry.name == name:
+                    del self._entries[key]
+        CONTEXT_CACHE.inc('any', 'expired')
+
+    def get_stats(self) -> Dict[str, Any]:
+        now = time.time()
+        entries: List[_Entry] = list(self._entries.values())
+        return {
+            'enabled': self.enabled,
+            'live': sum(1 for e in entries if e.name and e.expires_at > now),
+            'backoff': sum(1 for e in entries if not e.name and e.expires_at > now),
+        }
@@ -0,0 +1,34 @@
+import os
+import stat
+import logging
+
+logger = logging.getLogger(__name__)
+
+# --- Data directory settings ---
+# Default home of the SQLite files that hold chart text and coding results
+# (jobs, encounters, audit); Flask's instance folder unless set
+APP_DATA_DIR = os.getenv('APP_DATA_DIR', os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__)))), 'instance'))
+
+
+def data_path(filename: str) -> str:
+    """Default path of a data file: ``filename`` in APP_DATA_DIR."""
+    return os.path.join(APP_DATA_DIR, filename)
+
+
+def ensure_private_file(path: str) -> str:
+    """Create ``path`` readable by this user only (and its directory, 0700) if missing; returns ``path``.
+
+    SQLite gives a database's -wal and -shm files the database file's
+    permissions, so those stay private too. An existing file that other
+    users can read is left as it is and logged.
+    """
+    if not path or path == ':memory:':
+        return path
+    directory = os.path.dirname(os.path.abspath(path))
+    if not os.path.isdir(directory):
+        os.makedirs(directory, mode=0o700, exist_ok=True)
+    os.close(os.open(path, os.O_CREAT | os.O_WRONLY, 0o600))
+    if os.stat(path).st_mode & (stat.S_IRWXG | stat.S_IRWXO):
+        logger.warning("%s is accessible to other users; it holds chart text", path)
+    return path
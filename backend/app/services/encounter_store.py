@@ -0,0 +1,93 @@
+import os
+import json
+import time
+import sqlite3
+import logging
+import threading
+from typing import Dict, Any, Optional
+
+from app.services.data_dir import data_path, ensure_private_file
+
+logger = logging.getLogger(__name__)
+
+# --- Encounter store settings ---
+# One SQLite file shared by every worker process on the host
+ENCOUNTER_DB_PATH = os.getenv('ENCOUNTER_DB_PATH', data_path('encounters.db'))
+# Encounters not re-run for this long are forgotten; the next run starts from scratch
+ENCOUNTER_TTL_SECONDS = float(os.getenv('ENCOUNTER_TTL_SECONDS', str(7 * 86400)))
+
+
+class EncounterStore:
+    """The latest version of each encounter (its chart's hash) and its results, per result kind.
+
+    A version is the chart as last submitted for an encounter id; the
+    number goes up each time a different chart is stored and stays the
+    same when the same chart is sent again. ``state`` is whatever the
+    caller needs to redo only the changed part of the work next time.
+    """
+
+    def __init__(self, db_path: str = ENCOUNTER_DB_PATH, ttl_seconds: float = ENCOUNTER_TTL_SECONDS):
+        self.db_path = db_path
+        self.ttl_seconds = ttl_seconds
+        self._local = threading.local()
+        ensure_private_file(db_path)
+        conn = self._connection()
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS encounters ('
+            ' encounter_id TEXT NOT NULL, kind TEXT NOT NULL, version INTEGER NOT NULL,'
+            ' chart_hash TEXT NOT NULL, state TEXT NOT NULL, updated_at REAL NOT NULL,'
+            ' PRIMARY KEY (encounter_id, kind))'
+        )
+        conn.execute('CREATE INDEX IF NOT EXISTS encounters_updated_at ON encounters (updated_at)')
+
+    def _connection(self) -> sqlite3.Connection:
+        # One connection per thread, opened lazily so forked workers never share one
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=10, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def get(self, encounter_id: str, kind: str) -> Optional[Dict[str, Any]]:
+        """``{version, chartHash, state}`` of the stored version, or None."""
+        try:
+            row = self._connection().execute(
+                'SELECT version, chart_hash, state FROM encounters'
+                ' WHERE encounter_id = ? AND kind = ? AND updated_at > ?',
+                (encounter_id, kind, time.time() - self.ttl_seconds),
+            ).fetchone()
+        except sqlite3.Error as e:
+            logger.error("Error reading encounter %s: %s", encounter_id, e)
+            return None
+        if row is None:
+            return None
+        return {'version': row[0], 'chartHash': row[1], 'state': json.loads(row[2])}
+
+    def put(self, encounter_id: str, kind: str, chart_hash: str, state: Dict[str, Any]) -> int:
+        """Store a version and return its number (0 if it could not be stored)."""
+        now = time.time()
+        conn = self._connection()
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                row = conn.execute(
+                    'SELECT version, chart_hash FROM encounters WHERE encounter_id = ? AND kind = ? AND updated_at > ?',
+                    (encounter_id, kind, now - self.ttl_seconds),
+                ).fetchone()
+                version = 1 if row is None else row[0] + (row[1] != chart_hash)
+                conn.execute(
+                    'INSERT OR REPLACE INTO encounters (encounter_id, kind, version, chart_hash, state, updated_at)'
+                    ' VALUES (?, ?, ?, ?, ?, ?)',
+                    (encounter_id, kind, version, chart_hash, json.dumps(state), now),
+                )
+                conn.execute('DELETE FROM encounters WHERE updated_at <= ?', (now - self.ttl_seconds,))
+                conn.execute('COMMIT')
+            except Exception:
+                conn.execute('ROLLBACK')
+                raise
+        except sqlite3.Error as e:
+            logger.error("Error storing encounter %s: %s", encounter_id, e)
+            return 0
+        return version
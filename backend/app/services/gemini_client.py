@@ -0,0 +1,333 @@
+import os
+import time
+import random
+import logging
+import itertools
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Dict, Any, Iterator, Optional
+
+import httpx
+from google import genai
+from google.genai import errors, types
+
+from app.services.metrics import GEMINI_RETRIES, GEMINI_HEDGES, GEMINI_CIRCUIT
+
+logger = logging.getLogger(__name__)
+
+# --- Client settings ---
+# Point the client at another endpoint (e.g. bench/fake_gemini.py) instead of the public API
+GEMINI_BASE_URL = os.getenv('GEMINI_BASE_URL')
+# Keep-alive connections shared by every thread of a process; 0 sizes the pool from the
+# thread pools that call the model
+GEMINI_POOL_SIZE = int(os.getenv('GEMINI_POOL_SIZE', '0'))
+# Extra attempts after a retryable error, as long as the prompt's deadline allows
+GEMINI_MAX_RETRIES = int(os.getenv('GEMINI_MAX_RETRIES', '2'))
+GEMINI_BACKOFF_BASE_SECONDS = 0.5
+GEMINI_BACKOFF_MAX_SECONDS = 8.0
+RETRYABLE_STATUS_CODES = (408, 429, 500, 502, 503, 504)
+
+# --- Circuit breaker settings (one breaker per model) ---
+# The circuit opens when this share of the calls in the window failed upstream
+CIRCUIT_FAILURE_RATE = float(os.getenv('CIRCUIT_FAILURE_RATE', '0.5'))
+CIRCUIT_MIN_CALLS = int(os.getenv('CIRCUIT_MIN_CALLS', '10'))
+CIRCUIT_WINDOW_SECONDS = 60.0
+# How long an open circuit rejects calls before letting a trial call through
+CIRCUIT_OPEN_SECONDS = float(os.getenv('CIRCUIT_OPEN_SECONDS', '30'))
+
+# --- Hedging settings ---
+GEMINI_HEDGE_ENABLED = os.getenv('GEMINI_HEDGE_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+# A duplicate request is sent once a call has run longer than this percentile of recent calls
+HEDGE_PERCENTILE = 0.95
+HEDGE_MIN_SAMPLES = 20
+HEDGE_WINDOW = 200
+# Hedges allowed per call on average, so a slow upstream is not sent twice the load
+HEDGE_BUDGET_RATIO = 0.1
+HEDGE_BUDGET_MAX = 10.0
+
+
+class DeadlineExceeded(TimeoutError):
+    """The prompt's deadline passed before the model answered."""
+
+
+class CircuitOpenError(Exception):
+    """Calls to a model are rejected while its circuit is open."""
+
+
+def is_retryable(error: Exception) -> bool:
+    """Whether a failed call may succeed if sent again: overload, 5xx, timeouts and dropped connections."""
+    if isinstance(error, errors.APIError):
+        return error.code in RETRYABLE_STATUS_CODES
+    return isinstance(error, (httpx.TimeoutException, httpx.NetworkError, httpx.RemoteProtocolError))
+
+
+def is_upstream_failure(error: Exception) -> bool:
+    """Whether a failed call says the model service is unhealthy (as opposed to a bad request)."""
+    return isinstance(error, DeadlineExceeded) or is_retryable(error)
+
+
+class CircuitBreaker:
+    """Fails calls to one model fast while most recent calls to it have failed.
+
+    Closed, it counts upstream failures over a sliding window and opens
+    when they reach ``failure_rate``. Open, it rejects calls for
+    ``open_seconds``, then lets a single trial call through: success
+    closes it, failure opens it again.
+    """
+
+    CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half_open'
+
+    def __init__(self, name: str, failure_rate: float = CIRCUIT_FAILURE_RATE, min_calls: int = CIRCUIT_MIN_CALLS,
+                 window_seconds: float = CIRCUIT_WINDOW_SECONDS, open_seconds: float = CIRCUIT_OPEN_SECONDS):
+        self.name = name
+        self.failure_rate = failure_rate
+        self.min_calls = min_calls
+        self.window_seconds = window_seconds
+        self.open_seconds = open_seconds
+        self.state = self.CLOSED
+        self._outcomes = deque()  # (monotonic time, failed)
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial_started_at = None
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        """Whether a call may be made now."""
+        now = time.monotonic()
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and now - self._opened_at >= self.open_seconds:
+                self.state = self.HALF_OPEN
+                self._trial_started_at = None
+            if self.state == self.HALF_OPEN:
+                # One trial at a time; a trial that never reported back is replaced
+                if self._trial_started_at is None or now - self._trial_started_at >= self.open_seconds:
+                    self._trial_started_at = now
+                    return True
+            GEMINI_CIRCUIT.inc(self.name, 'rejected')
+            return False
+
+    def record(self, failed: bool):
+        """Report the outcome of an allowed call."""
+        now = time.monotonic()
+        with self._lock:
+            if self.state == self.HALF_OPEN:
+                if failed:
+                    self._open(now)
+                else:
+                    self.state = self.CLOSED
+                    self._outcomes.clear()
+                    self._failures = 0
+                    GEMINI_CIRCUIT.inc(self.name, 'closed')
+                    logger.info("Circuit for %s closed", self.name)
+                return
+            if self.state == self.OPEN:
+                return  # a call that started before the circuit opened
+            self._outcomes.append((now, failed))
+            self._failures += failed
+            while self._outcomes and now - self._outcomes[0][0] > self.window_seconds:
+                self._failures -= self._outcomes.popleft()[1]
+            if len(self._outcomes) >= self.min_calls and self._failures / len(self._outcomes) >= self.failure_rate:
+                self._open(now)
+
+    def _open(self, now: float):
+        self.state = self.OPEN
+        self._opened_at = now
+        self._outcomes.clear()
+        self._failures = 0
+        GEMINI_CIRCUIT.inc(self.name, 'opened')
+        logger.warning("Circuit for %s opened; failing fast for %.0fs", self.name, self.open_seconds)
+
+
+class _Latencies:
+    """Recent successful call durations of one model and prompt type."""
+
+    def __init__(self):
+        self.samples = deque(maxlen=HEDGE_WINDOW)
+
+    def percentile(self, fraction: float) -> Optional[float]:
+        samples = sorted(self.samples)
+        if len(samples) < HEDGE_MIN_SAMPLES:
+            return None
+        return samples[min(len(samples) - 1, int(len(samples) * fraction))]
+
+
+class ResilientGeminiClient:
+    """A ``genai.Client`` behind deadlines, retries, circuit breakers and hedged requests.
+
+    One pooled HTTP client is shared by every thread of the process.
+    Every call carries the time left before its prompt's deadline as the
+    request timeout and is retried with jittered backoff only on
+    retryable errors while time remains. A per-model circuit breaker
+    rejects calls while the model keeps failing, and a blocking call
+    still running past the 95th percentile of recent calls gets a
+    duplicate request, the first answer winning.
+    """
+
+    def __init__(self, pool_size: int, api_key: str = None, base_url: str = GEMINI_BASE_URL,
+                 max_retries: int = GEMINI_MAX_RETRIES, hedge: bool = GEMINI_HEDGE_ENABLED):
+        self.pool_size = pool_size
+        self.max_retries = max_retries
+        self.hedge = hedge
+        limits = httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size)
+        self.client = genai.Client(
+            api_key=api_key or os.getenv("GEMINI_API_KEY"),
+            http_options=types.HttpOptions(base_url=base_url, client_args={'limits': limits}),
+        )
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self._latencies: Dict[tuple, _Latencies] = {}
+        self._hedge_tokens = HEDGE_BUDGET_MAX
+        self._lock = threading.Lock()
+        # Primary and hedge requests of blocking calls run here so the caller can wait on both
+        self._executor = ThreadPoolExecutor(max_workers=pool_size * 2, thread_name_prefix='gemini-call')
+
+    @property
+    def caches(self):
+        return self.client.caches
+
+    def breaker(self, model: str) -> CircuitBreaker:
+        breaker = self._breakers.get(model)
+        if breaker is None:
+            with self._lock:
+                breaker = self._breakers.setdefault(model, CircuitBreaker(model))
+        return breaker
+
+    def _latency(self, model: str, prompt_type: str) -> _Latencies:
+        latencies = self._latencies.get((model, prompt_type))
+        if latencies is None:
+            with self._lock:
+                latencies = self._latencies.setdefault((model, prompt_type), _Latencies())
+        return latencies
+
+    def _with_timeout(self, config: types.GenerateContentConfig, deadline: float) -> types.GenerateContentConfig:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise DeadlineExceeded('Deadline exceeded before the request was sent')
+        return config.model_copy(update={'http_options': types.HttpOptions(timeout=max(1, int(remaining * 1000)))})
+
+    def _send(self, model: str, contents, config: types.GenerateContentConfig, deadline: float):
+        return self.client.models.generate_content(model=model, contents=contents,
+                                                   config=self._with_timeout(config, deadline))
+
+    def _take_hedge_token(self) -> bool:
+        with self._lock:
+            if self._hedge_tokens >= 1:
+                self._hedge_tokens -= 1
+                return True
+            return False
+
+    def _hedged_send(self, prompt_type: str, model: str, contents, config, deadline: float):
+        with self._lock:
+            self._hedge_tokens = min(HEDGE_BUDGET_MAX, self._hedge_tokens + HEDGE_BUDGET_RATIO)
+        hedge_after = self._latency(model, prompt_type).percentile(HEDGE_PERCENTILE)
+        if hedge_after is None:
+            return self._send(model, contents, config, deadline)
+
+        primary = self._executor.submit(self._send, model, contents, config, deadline)
+        done, _ = wait([primary], timeout=min(hedge_after, max(0.0, deadline - time.monotonic())))
+        if done or not self._take_hedge_token():
+            return self._await(primary, deadline)
+        GEMINI_HEDGES.inc(prompt_type, 'sent')
+        hedge = self._executor.submit(self._send, model, contents, config, deadline)
+        pending, error = {primary, hedge}, None
+        while pending:
+            done, pending = wait(pending, timeout=max(0.0, deadline - time.monotonic()), return_when=FIRST_COMPLETED)
+            if not done:
+                raise DeadlineExceeded(f'{prompt_type} deadline exceeded')
+            for future in done:
+                if future.exception() is None:
+                    GEMINI_HEDGES.inc(prompt_type, 'hedge_won' if future is hedge else 'primary_won')
+                    return future.result()
+                error = future.exception()
+        raise error
+
+    @staticmethod
+    def _await(future, deadline: float):
+        done, _ = wait([future], timeout=max(0.0, deadline - time.monotonic()))
+        if not done:
+            raise DeadlineExceeded('Deadline exceeded waiting for the model')
+        return future.result()
+
+    def _backoff(self, prompt_type: str, attempt: int, error: Exception, deadline: float):
+        """Sleep before the next attempt, or re-raise if it could not finish before the deadline."""
+        delay = random.uniform(0, min(GEMINI_BACKOFF_MAX_SECONDS, GEMINI_BACKOFF_BASE_SECONDS * (2 ** attempt)))
+        if attempt >= self.max_retries or time.monotonic() + delay >= deadline:
+            raise error
+        GEMINI_RETRIES.inc(prompt_type, getattr(error, 'code', None) or type(error).__name__)
+        logger.warning("Retrying %s in %.1fs after: %s", prompt_type, delay, error)
+        time.sleep(delay)
+
+    def _check_deadline(self, error: Exception, deadline: float) -> Exception:
+        if isinstance(error, httpx.TimeoutException) and time.monotonic() >= deadline - 0.05:
+            return DeadlineExceeded(f'Model call timed out: {error}')
+        return error
+
+    def generate(self, prompt_type: str, model: str, contents, config: types.GenerateContentConfig,
+                 deadline: float):
+        """Blocking ``generate_content`` that gives up at ``deadline`` (a ``time.monotonic()`` value)."""
+        breaker = self.breaker(model)
+        for attempt in itertools.count():
+            if not breaker.allow():
+                raise CircuitOpenError(f'Circuit open for {model}; not calling the model')
+            start = time.monotonic()
+            try:
+                if self.hedge:
+                    response = self._hedged_send(prompt_type, model, contents, config, deadline)
+                else:
+                    response = self._send(model, contents, config, deadline)
+            except Exception as e:
+                e = self._check_deadline(e, deadline)
+                breaker.record(is_upstream_failure(e))
+                if not is_retryable(e):
+                    raise e
+                self._backoff(prompt_type, attempt, e, deadline)
+                continue
+            breaker.record(False)
+            self._latency(model, prompt_type).samples.append(time.monotonic() - start)
+            return response
+
+    def generate_stream(self, prompt_type: str, model: str, contents, config: types.GenerateContentConfig,
+                        deadline: float) -> Iterator[Any]:
+        """Streaming ``generate_content``, retried until its first chunk and cut off at ``deadline``.
+
+        The first chunk is fetched before returning, so errors sending the
+        request are raised here rather than from the iterator.
+        """
+        breaker = self.breaker(model)
+        for attempt in itertools.count():
+            if not breaker.allow():
+                raise CircuitOpenError(f'Circuit open for {model}; not calling the model')
+            try:
+                stream = self.client.models.generate_content_stream(
+                    model=model, contents=contents, config=self._with_timeout(config, deadline))
+                first = next(stream, None)
+            except Exception as e:
+                e = self._check_deadline(e, deadline)
+                breaker.record(is_upstream_failure(e))
+                if not is_retryable(e):
+                    raise e
+                self._backoff(prompt_type, attempt, e, deadline)
+                continue
+            return self._guarded_stream(breaker, first, stream, deadline)
+
+    def _guarded_stream(self, breaker: CircuitBreaker, first, stream, deadline: float) -> Iterator[Any]:
+        try:
+            if first is not None:
+                yield first
+            for chunk in stream:
+                if time.monotonic() > deadline:
+                    raise DeadlineExceeded('Deadline exceeded while streaming')
+                yield chunk
+        except Exception as e:
+            e = self._check_deadline(e, deadline)
+            breaker.record(is_upstream_failure(e))
+            raise e
+        breaker.record(False)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            'poolSize': self.pool_size,
+            'circuits': {model: breaker.state for model, breaker in sorted(self._breakers.items())},
+        }
@@ -0,0 +1,293 @@
+import os
+import json
+import time
+import uuid
+import sqlite3
+import hashlib
+import logging
+import threading
+from contextvars import ContextVar
+from typing import Callable, Dict, Any, Optional
+
+from app.services.data_dir import data_path, ensure_private_file
+
+logger = logging.getLogger(__name__)
+
+# --- Job queue settings ---
+# One SQLite file shared by every worker process on the host
+JOB_DB_PATH = os.getenv('JOB_DB_PATH', data_path('jobs.db'))
+JOB_WORKERS = int(os.getenv('JOB_WORKERS', '4'))
+# Finished jobs stay readable (and absorb duplicate submissions) for this long
+JOB_RESULT_TTL_SECONDS = float(os.getenv('JOB_RESULT_TTL_SECONDS', '3600'))
+# A running job whose worker has not reported on it in this long is assumed lost and requeued
+JOB_STALE_SECONDS = float(os.getenv('JOB_STALE_SECONDS', '600'))
+# How often a process reports that the jobs it runs (or holds waiting for a model slot) are alive
+JOB_HEARTBEAT_SECONDS = float(os.getenv('JOB_HEARTBEAT_SECONDS', '30'))
+# Longest a long-poll request may hold a web worker
+JOB_MAX_WAIT_SECONDS = float(os.getenv('JOB_MAX_WAIT_SECONDS', '30'))
+JOB_POLL_INTERVAL_SECONDS = float(os.getenv('JOB_POLL_INTERVAL_SECONDS', '0.25'))
+
+# Lower runs first
+JOB_PRIORITIES = {'high': 0, 'normal': 1, 'low': 2}
+
+QUEUED, RUNNING, DONE, FAILED = 'queued', 'running', 'done', 'failed'
+
+# The job a worker thread is running: {jobId, type, priority}
+_current_job: ContextVar[Optional[Dict[str, Any]]] = ContextVar('current_job', default=None)
+
+
+def current_job() -> Optional[Dict[str, Any]]:
+    """The job being run, for handlers that treat jobs differently by priority; None outside a job."""
+    return _current_job.get()
+
+
+def job_key(job_type: str, payload: Dict[str, Any]) -> str:
+    """Content address of a job: identical submissions share a key."""
+    return hashlib.sha256(
+        json.dumps({'type': job_type, 'payload': payload}, sort_keys=True).encode('utf-8')
+    ).hexdigest()
+
+
+class JobQueue:
+    """Durable priority queue of model jobs with in-process worker threads.
+
+    Jobs live in a SQLite table, so any worker process on the host can
+    submit, run or report on any job without a broker. A submission whose
+    type and payload match a queued, running or recently finished job
+    returns that job instead of creating a new one. Each process starts
+    its worker threads on first use, which keeps them out of a forking
+    parent. Idle workers poll with a read, taking the write lock only to
+    claim a job, and a heartbeat marks the jobs a process holds as alive
+    however long they run or wait.
+    """
+
+    def __init__(self, db_path: str = JOB_DB_PATH, workers: int = JOB_WORKERS,
+                 result_ttl_seconds: float = JOB_RESULT_TTL_SECONDS):
+        self.db_path = db_path
+        self.workers = workers
+        self.result_ttl_seconds = result_ttl_seconds
+        self.handlers: Dict[str, Callable[[Dict[str, Any]], Dict[str, Any]]] = {}
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._changed = threading.Condition()
+        self._worker_pid = None
+        self._held = set()  # ids of the jobs this process is running
+        self._held_lock = threading.Lock()
+        ensure_private_file(db_path)
+        conn = self._connection()
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS jobs ('
+            ' id TEXT PRIMARY KEY, type TEXT NOT NULL, dedupe_key TEXT NOT NULL,'
+            ' priority INTEGER NOT NULL, status TEXT NOT NULL, payload TEXT NOT NULL,'
+            ' result TEXT, error TEXT, submissions INTEGER NOT NULL DEFAULT 1,'
+            ' created_at REAL NOT NULL, started_at REAL, finished_at REAL, heartbeat_at REAL)'
+        )
+        if 'heartbeat_at' not in {row['name'] for row in conn.execute('PRAGMA table_info(jobs)')}:
+            try:
+                conn.execute('ALTER TABLE jobs ADD COLUMN heartbeat_at REAL')
+            except sqlite3.OperationalError:
+                pass  # Added by another process at the same moment
+        conn.execute('CREATE INDEX IF NOT EXISTS jobs_claim ON jobs (status, priority, created_at)')
+        conn.execute('CREATE INDEX IF NOT EXISTS jobs_dedupe ON jobs (dedupe_key, status)')
+
+    def _connection(self) -> sqlite3.Connection:
+        # One connection per thread, opened lazily so forked workers never share one
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=10, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def register(self, job_type: str, handler: Callable[[Dict[str, Any]], Dict[str, Any]]):
+        """Run jobs of ``job_type`` with ``handler(payload)``; a result with an "error" key fails the job."""
+        self.handlers[job_type] = handler
+
+    def submit(self, job_type: str, payload: Dict[str, Any], priority: int = JOB_PRIORITIES['normal']) -> Dict[str, Any]:
+        """Queue a job, or return the matching live job. Returns ``{jobId, status, deduplicated}``."""
+        if job_type not in self.handlers:
+            raise ValueError(f'Unknown job type: {job_type}')
+        self._ensure_workers()
+        key = job_key(job_type, payload)
+        now = time.time()
+        conn = self._connection()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            existing = conn.execute(
+                'SELECT id, status, priority FROM jobs WHERE dedupe_key = ?'
+                ' AND (status IN (?, ?) OR (status = ? AND finished_at > ?))'
+                ' ORDER BY created_at DESC LIMIT 1',
+                (key, QUEUED, RUNNING, DONE, now - self.result_ttl_seconds),
+            ).fetchone()
+            if existing is not None:
+                # A more urgent duplicate promotes the queued job
+                conn.execute(
+                    'UPDATE jobs SET submissions = submissions + 1, priority = MIN(priority, ?) WHERE id = ?',
+                    (priority, existing['id']),
+                )
+                conn.execute('COMMIT')
+                return {'jobId': existing['id'], 'status': existing['status'], 'deduplicated': True}
+            job_id = uuid.uuid4().hex
+            conn.execute(
+                'INSERT INTO jobs (id, type, dedupe_key, priority, status, payload, created_at)'
+                ' VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (job_id, job_type, key, priority, QUEUED, json.dumps(payload), now),
+            )
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        self._notify()
+        return {'jobId': job_id, 'status': QUEUED, 'deduplicated': False}
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Current state of a job, with its result once finished; None if unknown."""
+        row = self._connection().execute('SELECT * FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = {
+            'jobId': row['id'],
+            'type': row['type'],
+            'status': row['status'],
+            'submissions': row['submissions'],
+            'createdAt': row['created_at'],
+            'startedAt': row['started_at'],
+            'finishedAt': row['finished_at'],
+        }
+        if row['status'] == DONE:
+            job['result'] = json.loads(row['result'])
+        elif row['status'] == FAILED:
+            job['error'] = row['error']
+        return job
+
+    def wait(self, job_id: str, timeout: float) -> Optional[Dict[str, Any]]:
+        """Like ``get`` but blocks up to ``timeout`` seconds for the job to finish."""
+        self._ensure_workers()
+        deadline = time.monotonic() + min(timeout, JOB_MAX_WAIT_SECONDS)
+        while True:
+            job = self.get(job_id)
+            remaining = deadline - time.monotonic()
+            if job is None or job['status'] in (DONE, FAILED) or remaining <= 0:
+                return job
+            # Woken early by jobs finishing in this process; polls for the others
+            with self._changed:
+                self._changed.wait(min(remaining, JOB_POLL_INTERVAL_SECONDS))
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Job counts by status."""
+        rows = self._connection().execute('SELECT status, COUNT(*) FROM jobs GROUP BY status').fetchall()
+        stats = {status: 0 for status in (QUEUED, RUNNING, DONE, FAILED)}
+        stats.update({row[0]: row[1] for row in rows})
+        return stats
+
+    def _notify(self):
+        with self._changed:
+            self._changed.notify_all()
+
+    def _ensure_workers(self):
+        pid = os.getpid()
+        if self._worker_pid == pid:
+            return
+        with self._lock:
+            if self._worker_pid == pid:
+                return
+            self._worker_pid = pid
+            self._held = set()
+            self._requeue_stale()
+            for i in range(self.workers):
+                threading.Thread(target=self._work, name=f'job-worker-{i}', daemon=True).start()
+            threading.Thread(target=self._heartbeat, name='job-heartbeat', daemon=True).start()
+
+    def _requeue_stale(self):
+        conn = self._connection()
+        requeued = conn.execute(
+            'UPDATE jobs SET status = ?, started_at = NULL, heartbeat_at = NULL'
+            ' WHERE status = ? AND COALESCE(heartbeat_at, started_at) < ?',
+            (QUEUED, RUNNING, time.time() - JOB_STALE_SECONDS),
+        ).rowcount
+        if requeued:
+            logger.warning("Requeued %d stale jobs", requeued)
+        conn.execute(
+            'DELETE FROM jobs WHERE status IN (?, ?) AND finished_at < ?',
+            (DONE, FAILED, time.time() - self.result_ttl_seconds),
+        )
+
+    def _claim(self) -> Optional[sqlite3.Row]:
+        conn = self._connection()
+        # A read never waits on writers in WAL mode; the write lock is only taken when there is work
+        if conn.execute('SELECT 1 FROM jobs WHERE status = ? LIMIT 1', (QUEUED,)).fetchone() is None:
+            return None
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = conn.execute(
+                'SELECT * FROM jobs WHERE status = ? ORDER BY priority, created_at LIMIT 1', (QUEUED,)
+            ).fetchone()
+            if row is not None:
+                now = time.time()
+                conn.execute('UPDATE jobs SET status = ?, started_at = ?, heartbeat_at = ? WHERE id = ?',
+                             (RUNNING, now, now, row['id']))
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        return row
+
+    def _finish(self, job_id: str, result: Optional[Dict[str, Any]], error: Optional[str]):
+        self._connection().execute(
+            'UPDATE jobs SET status = ?, result = ?, error = ?, finished_at = ? WHERE id = ?',
+            (FAILED if error else DONE, None if error else json.dumps(result), error, time.time(), job_id),
+        )
+        self._notify()
+
+    def _heartbeat(self):
+        while True:
+            time.sleep(JOB_HEARTBEAT_SECONDS)
+            with self._held_lock:
+                held = list(self._held)
+            if not held:
+                continue
+            try:
+                self._connection().execute(
+                    f"UPDATE jobs SET heartbeat_at = ? WHERE status = ? AND id IN ({', '.join('?' * len(held))})",
+                    (time.time(), RUNNING, *held),
+                )
+            except sqlite3.Error as e:
+                logger.error("Error refreshing job heartbeats: %s", e)
+
+    def _work(self):
+        last_sweep = time.monotonic()
+        while True:
+            try:
+                row = self._claim()
+            except sqlite3.Error as e:
+                logger.error("Error claiming job: %s", e)
+                row = None
+            if row is None:
+                if time.monotonic() - last_sweep > JOB_STALE_SECONDS:
+                    self._requeue_stale()
+                    last_sweep = time.monotonic()
+                # Submissions from this process wake the worker at once; others are polled
+                with self._changed:
+                    self._changed.wait(JOB_POLL_INTERVAL_SECONDS)
+                continue
+
+            with self._held_lock:
+                self._held.add(row['id'])
+            token = _current_job.set({'jobId': row['id'], 'type': row['type'], 'priority': row['priority']})
+            try:
+                result = self.handlers[row['type']](json.loads(row['payload']))
+                error = result.get('error') if isinstance(result, dict) else None
+            except Exception as e:
+                logger.exception("Job %s (%s) failed", row['id'], row['type'])
+                result, error = None, str(e)
+            finally:
+                _current_job.reset(token)
+            try:
+                self._finish(row['id'], result, str(error) if error else None)
+            except sqlite3.Error as e:
+                logger.error("Error storing result of job %s: %s", row['id'], e)
+            finally:
+                with self._held_lock:
+                    self._held.discard(row['id'])
@@ -0,0 +1,251 @@
+import re
+import time
+import bisect
+import json
+import logging
+from typing import Any, Dict, List, Optional, Tuple, get_args, get_origin
+
+from pydantic import BaseModel, ValidationError
+
+# A truncated response is cut back to an earlier safe point at most this many
+# times (each retry costs one json.loads) before giving up.
+MAX_REPAIR_ATTEMPTS = 3
+
+logger = logging.getLogger(__name__)
+
+_CLOSERS = {'{': '}', '[': ']'}
+_STRUCTURAL_RE = re.compile(r'[{}\[\]",]')
+_STRING_END_RE = re.compile(r'["\\]')
+
+
+class _Scan:
+    """Result of one pass over the text."""
+
+    def __init__(self):
+        self.start = -1
+        self.end = -1              # index after the closing brace of a complete document
+        self.trailing_commas: List[int] = []
+        self.safe_points: List[int] = []   # positions a truncated document may be cut at
+        self.safe_closers: List[str] = []  # brackets that close the document at that point
+
+
+def _scan(text: str, offset: int = 0) -> _Scan:
+    """Walk ``text`` once, tracking strings and brackets of the first JSON object at or after ``offset``.
+
+    Records where the object ends (if it does), commas directly before a
+    closing bracket, and after every complete value the cut position plus
+    the closing brackets needed to finish the document there.
+    """
+    scan = _Scan()
+    start = text.find('{', offset)
+    if start == -1:
+        return scan
+    scan.start = start
+
+    stack: List[str] = []
+    closers = ''  # closing brackets for the current stack, innermost first
+    expect_key = False
+    last_comma = -1
+
+    # Jump between structural characters with C-level regex searches rather
+    # than stepping through every character in Python
+    i = start
+    structural = _STRUCTURAL_RE.search
+    string_end = _STRING_END_RE.search
+    n = len(text)
+    while i < n:
+        match = structural(text, i)
+        if match is None:
+            break
+        i = match.start()
+        char = text[i]
+        if char == '"':
+            string_is_key = expect_key
+            expect_key = False
+            last_comma = -1
+            j = i + 1
+            while True:
+                match = string_end(text, j)
+                if match is None:
+                    return scan
+                j = match.start()
+                if text[j] == '\\':
+                    j += 2
+                    continue
+                break
+            i = j
+            if not string_is_key:
+                scan.safe_points.append(i + 1)
+                scan.safe_closers.append(closers)
+        elif char in '{[':
+            stack.append(char)
+            closers = _CLOSERS[char] + closers
+            expect_key = char == '{'
+            last_comma = -1
+            # An empty container is already a valid value
+            scan.safe_points.append(i + 1)
+            scan.safe_closers.append(closers)
+        elif char in '}]':
+            if last_comma != -1 and not text[last_comma + 1:i].strip():
+                scan.trailing_commas.append(last_comma)
+            last_comma = -1
+            if stack:
+                stack.pop()
+                closers = closers[1:]
+            expect_key = False
+            if not stack:
+                scan.end = i + 1
+                return scan
+            scan.safe_points.append(i + 1)
+            scan.safe_closers.append(closers)
+        elif char == ',':
+            # A comma closes the previous value, numbers and literals included
+            scan.safe_points.append(i)
+            scan.safe_closers.append(closers)
+            last_comma = i
+            expect_key = stack[-1] == '{' if stack else False
+        i += 1
+    return scan
+
+
+def _join(text: str, start: int, end: int, skip: List[int], suffix: str = '') -> str:
+    """Slice ``text[start:end]`` minus the ``skip`` positions, plus ``suffix``, in one copy."""
+    if not skip:
+        return text[start:end] + suffix
+    parts = []
+    pos = start
+    for index in skip:
+        if index >= end:
+            break
+        parts.append(text[pos:index])
+        pos = index + 1
+    parts.append(text[pos:end])
+    parts.append(suffix)
+    return ''.join(parts)
+
+
+def _recover(text: str, scan: _Scan) -> Tuple[Optional[Any], bool]:
+    """``(value, cut)`` for the scanned object; ``cut`` when it had to be cut back and closed."""
+    if scan.end != -1:
+        try:
+            return json.loads(_join(text, scan.start, scan.end, scan.trailing_commas)), False
+        except json.JSONDecodeError as e:
+            # Cut back to before the offending character
+            limit = scan.start + e.pos
+    else:
+        limit = len(text)
+
+    for _ in range(MAX_REPAIR_ATTEMPTS):
+        index = bisect.bisect_right(scan.safe_points, limit) - 1
+        if index < 0:
+            break
+        cut = scan.safe_points[index]
+        candidate = _join(text, scan.start, cut, scan.trailing_commas, scan.safe_closers[index])
+        try:
+            return json.loads(candidate), True
+        except json.JSONDecodeError as e:
+            limit = min(cut - 1, scan.start + e.pos - 1)
+    return None, False
+
+
+def extract_json(text: str) -> Tuple[Optional[Any], bool]:
+    """Extract the first JSON object from a model response.
+
+    Returns ``(value, repaired)``. Code fences and surrounding prose are
+    ignored, trailing commas are dropped, and a truncated object is cut
+    back to the last complete value and closed, so the largest valid
+    prefix survives; ``repaired`` is True whenever the object's text was
+    changed. ``value`` is None when nothing could be recovered.
+    A brace-delimited fragment of prose that is not JSON is skipped and
+    scanning resumes after it, so the text is still walked only once; it
+    is only repaired if no later object parses.
+    """
+    # Fast path: a well-formed response parses in one C-level call
+    start, end = text.find('{'), text.rfind('}') + 1
+    if start != -1 and end > start:
+        try:
+            return json.loads(text[start:end]), False
+        except json.JSONDecodeError:
+            pass
+
+    offset = 0
+    fallback = None
+    while True:
+        scan = _scan(text, offset)
+        if scan.start == -1:
+            return (fallback, True) if fallback is not None else (None, False)
+        value, cut = _recover(text, scan)
+        if value is not None and (not cut or scan.end == -1):
+            return value, cut or bool(scan.trailing_commas)
+        if scan.end == -1:
+            return (fallback, True) if fallback is not None else (None, False)
+        if fallback is None:
+            fallback = value
+        offset = scan.end
+
+
+def _list_item_model(annotation) -> Optional[type]:
+    """The model type of a ``List[Model]`` field annotation, if it is one."""
+    if get_origin(annotation) in (list, List):
+        args = get_args(annotation)
+        if args and isinstance(args[0], type) and issubclass(args[0], BaseModel):
+            return args[0]
+    return None
+
+
+def validate_partial(schema: type, value: Any) -> Tuple[Optional[Dict[str, Any]], bool]:
+    """Validate ``value`` against ``schema``, dropping list items that do not validate.
+
+    A truncated response often ends in a half-written item; rather than
+    rejecting the whole document, only that item is discarded. Returns
+    ``(result, dropped)``; ``result`` is None if the document is unusable.
+    """
+    if not isinstance(value, dict):
+        return None, True
+    try:
+        return schema.model_validate(value).model_dump(), False
+    except ValidationError:
+        pass
+
+    cleaned = {}
+    for name, field in schema.model_fields.items():
+        if name not in value:
+            continue
+        item_model = _list_item_model(field.annotation)
+        if item_model is not None and isinstance(value[name], list):
+            items = []
+            for item in value[name]:
+                try:
+                    items.append(item_model.model_validate(item))
+                except ValidationError:
+                    continue
+            cleaned[name] = items
+        else:
+            cleaned[name] = value[name]
+    try:
+        return schema.model_validate(cleaned).model_dump(), True
+    except ValidationError as e:
+        logger.warning("Response does not match %s: %s", schema.__name__, e)
+        return None, True
+
+
+def parse_model_json(text: str, schema: Optional[type] = None,
+                     timings: Optional[Dict[str, float]] = None) -> Tuple[Optional[Any], bool]:
+    """Extract, repair and (optionally) validate a model response.
+
+    Returns ``(result, complete)`` where ``complete`` is False if any part
+    of the response had to be repaired or dropped. If ``timings`` is given,
+    the seconds spent extracting ('clean') and validating ('parse') are
+    stored in it.
+    """
+    start = time.perf_counter()
+    value, repaired = extract_json(text)
+    extracted = time.perf_counter()
+    if timings is not None:
+        timings['clean'] = extracted - start
+    if value is None or schema is None:
+        return value, value is not None and not repaired
+    result, dropped = validate_partial(schema, value)
+    if timings is not None:
+        timings['parse'] = time.perf_counter() - extracted
+    return result, result is not None and not repaired and not dropped
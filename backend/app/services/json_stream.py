@@ -0,0 +1,93 @@
+import json
+from typing import List, Any, Iterable, Optional, Tuple
+
+
+class StreamingItemParser:
+    """Incremental parser that emits array items of a JSON document as soon as they close.
+
+    Feed it the model output chunk by chunk; every object that is a direct
+    element of an array stored under one of ``keys`` is returned from
+    ``feed`` the moment its closing brace arrives, as ``(key, item)``.
+    Each character is scanned once, and text before the first open item
+    is discarded so the buffer never holds more than one pending item.
+    """
+
+    def __init__(self, keys: Iterable[str]):
+        self.keys = set(keys)
+        self._buffer = ''
+        self._pos = 0
+        # One entry per open container: (bracket, key the container is stored under)
+        self._stack: List[Tuple[str, Optional[str]]] = []
+        self._in_string = False
+        self._escape = False
+        self._string_start = None
+        self._expect_key = False
+        self._current_key: Optional[str] = None
+        self._item_start = None
+        self._item_key: Optional[str] = None
+        self._item_depth = 0
+
+    def feed(self, chunk: str) -> List[Tuple[str, Any]]:
+        """Consume the next chunk and return the items it completed."""
+        self._buffer += chunk
+        items = []
+        buffer = self._buffer
+        stack = self._stack
+        i = self._pos
+        end = len(buffer)
+
+        while i < end:
+            char = buffer[i]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == '\\':
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+                    if self._expect_key and stack and stack[-1][0] == '{':
+                        try:
+                            self._current_key = json.loads(buffer[self._string_start:i + 1])
+                        except json.JSONDecodeError:
+                            self._current_key = None
+                        self._expect_key = False
+                    self._string_start = None
+            elif char == '"':
+                self._in_string = True
+                self._string_start = i
+            elif char in '{[':
+                parent = stack[-1] if stack else None
+                if parent is None or parent[0] == '[':
+                    key = parent[1] if parent else None
+                else:
+                    key = self._current_key
+                if (char == '{' and self._item_start is None and parent is not None
+                        and parent[0] == '[' and parent[1] in self.keys):
+                    self._item_start = i
+                    self._item_key = parent[1]
+                    self._item_depth = len(stack)
+                stack.append((char, key))
+                self._expect_key = char == '{'
+            elif char in '}]':
+                if stack:
+                    stack.pop()
+                if self._item_start is not None and char == '}' and len(stack) == self._item_depth:
+                    try:
+                        items.append((self._item_key, json.loads(buffer[self._item_start:i + 1])))
+                    except json.JSONDecodeError:
+                        pass
+                    self._item_start = None
+                self._expect_key = False
+            elif char == ',' and stack and stack[-1][0] == '{':
+                self._expect_key = True
+            i += 1
+
+        # Drop everything no open item or key string still needs
+        keep_from = min(p for p in (self._item_start, self._string_start, end) if p is not None)
+        self._buffer = buffer[keep_from:]
+        self._pos = end - keep_from
+        if self._item_start is not None:
+            self._item_start -= keep_from
+        if self._string_start is not None:
+            self._string_start -= keep_from
+        return items
@@ -0,0 +1,266 @@
+import os
+import json
+import time
+import atexit
+import bisect
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Dict, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+# --- Metrics settings ---
+# Directory where each worker process writes its metrics so /metrics can sum them
+# (gunicorn.conf.py sets it); read when used, since a preloading master imports this first
+METRICS_DIR_ENV = 'METRICS_MULTIPROC_DIR'
+# How often a worker writes its metrics there; /metrics lags the other workers by up to this
+METRICS_FLUSH_SECONDS = float(os.getenv('METRICS_FLUSH_SECONDS', '5'))
+# Seconds; spans code search (sub-millisecond) up to long LLM calls
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120)
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels_text(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = '') -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class Counter:
+    """Monotonic counter with a fixed set of label names."""
+
+    kind = 'counter'
+
+    def __init__(self, name: str, help_text: str, labels: Tuple[str, ...] = ()):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = labels
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels: str, amount: float = 1):
+        key = tuple(str(label) for label in labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def snapshot(self) -> Dict[Tuple[str, ...], float]:
+        with self._lock:
+            return dict(self._values)
+
+    @staticmethod
+    def merge(values: Dict[Tuple[str, ...], float], key: Tuple[str, ...], value: float):
+        values[key] = values.get(key, 0) + value
+
+    def render(self, values: Dict[Tuple[str, ...], float] = None) -> List[str]:
+        values = sorted((self.snapshot() if values is None else values).items())
+        return [f'{self.name}{_labels_text(self.label_names, key)} {value}' for key, value in values]
+
+
+class Histogram:
+    """Cumulative bucket histogram with a fixed set of label names."""
+
+    kind = 'histogram'
+
+    def __init__(self, name: str, help_text: str, labels: Tuple[str, ...] = (), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = labels
+        self.buckets = tuple(buckets)
+        self._series: Dict[Tuple[str, ...], list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labels: str):
+        key = tuple(str(label) for label in labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                # Per-bucket counts (last slot is +Inf), then sum
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    @contextmanager
+    def time(self, *labels: str):
+        """Observe the wall-clock duration of the ``with`` block."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, *labels)
+
+    def snapshot(self) -> Dict[Tuple[str, ...], list]:
+        with self._lock:
+            return {key: [list(counts), total] for key, (counts, total) in self._series.items()}
+
+    @staticmethod
+    def merge(values: Dict[Tuple[str, ...], list], key: Tuple[str, ...], value: list):
+        series = values.get(key)
+        if series is None:
+            values[key] = [list(value[0]), value[1]]
+        elif len(series[0]) == len(value[0]):
+            series[0] = [a + b for a, b in zip(series[0], value[0])]
+            series[1] += value[1]
+
+    def render(self, values: Dict[Tuple[str, ...], list] = None) -> List[str]:
+        values = self.snapshot() if values is None else values
+        series = sorted((key, counts, total) for key, (counts, total) in values.items())
+        lines = []
+        for key, counts, total in series:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                le = 'le="+Inf"' if bound == float('inf') else f'le="{bound}"'
+                lines.append(f'{self.name}_bucket{_labels_text(self.label_names, key, le)} {cumulative}')
+            lines.append(f'{self.name}_sum{_labels_text(self.label_names, key)} {total}')
+            lines.append(f'{self.name}_count{_labels_text(self.label_names, key)} {cumulative}')
+        return lines
+
+
+class MetricsRegistry:
+    """The process's metrics, rendered in the Prometheus text format.
+
+    Each process counts on its own. With METRICS_MULTIPROC_DIR set, every
+    process that called ``start_sharing`` writes its counts to
+    ``<dir>/<pid>.json`` every METRICS_FLUSH_SECONDS and at exit, and
+    ``render`` adds up all the files there, so any worker answering
+    /metrics reports the whole server. Files of exited workers are kept
+    so that totals never go down; the directory is cleared when the
+    server starts.
+    """
+
+    def __init__(self):
+        self._metrics: Dict[str, object] = {}
+        self._lock = threading.Lock()
+        self._sharing_pid = None
+
+    def register(self, metric):
+        with self._lock:
+            return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name: str, help_text: str, labels: Tuple[str, ...] = ()) -> Counter:
+        return self.register(Counter(name, help_text, labels))
+
+    def histogram(self, name: str, help_text: str, labels: Tuple[str, ...] = (), buckets=LATENCY_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, help_text, labels, buckets))
+
+    def snapshot(self) -> Dict[str, list]:
+        """This process's values as JSON-ready ``{metric: [[labels, value], ...]}``."""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return {metric.name: [[list(key), value] for key, value in metric.snapshot().items()] for metric in metrics}
+
+    def write_snapshot(self, directory: str):
+        path = os.path.join(directory, f'{os.getpid()}.json')
+        with open(path + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump(self.snapshot(), f)
+        os.replace(path + '.tmp', path)
+
+    def start_sharing(self, directory: str = None, interval: float = METRICS_FLUSH_SECONDS):
+        """Write this process's metrics to ``directory`` (METRICS_MULTIPROC_DIR) periodically and at exit."""
+        directory = directory or os.getenv(METRICS_DIR_ENV)
+        if not directory or self._sharing_pid == os.getpid():
+            return
+        self._sharing_pid = os.getpid()
+        os.makedirs(directory, exist_ok=True)
+
+        def flush():
+            try:
+                self.write_snapshot(directory)
+            except OSError as e:
+                logger.error("Error writing metrics to %s: %s", directory, e)
+
+        def run():
+            while True:
+                time.sleep(interval)
+                flush()
+
+        threading.Thread(target=run, name='metrics-flush', daemon=True).start()
+        atexit.register(flush)
+
+    def _merged(self, metrics: list) -> Dict[str, dict]:
+        """Live values of this process plus the last written values of every other one."""
+        merged = {metric.name: metric.snapshot() for metric in metrics}
+        directory = os.getenv(METRICS_DIR_ENV)
+        if not directory or not os.path.isdir(directory):
+            return merged
+        own = f'{os.getpid()}.json'
+        by_name = {metric.name: metric for metric in metrics}
+        for filename in os.listdir(directory):
+            if not filename.endswith('.json') or filename == own:
+                continue
+            try:
+                with open(os.path.join(directory, filename), encoding='utf-8') as f:
+                    data = json.load(f)
+            except (OSError, ValueError):
+                continue  # Being replaced or unreadable; counted on the next scrape
+            for name, series in data.items():
+                metric = by_name.get(name)
+                if metric is not None:
+                    for key, value in series:
+                        metric.merge(merged[name], tuple(key), value)
+        return merged
+
+    def render(self) -> str:
+        """Prometheus text exposition format (version 0.0.4), summed over processes when sharing."""
+        with self._lock:
+            metrics = sorted(self._metrics.values(), key=lambda m: m.name)
+        merged = self._merged(metrics)
+        lines = []
+        for metric in metrics:
+            lines.append(f'# HELP {metric.name} {metric.help_text}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            lines.extend(metric.render(merged[metric.name]))
+        return '\n'.join(lines) + '\n'
+
+
+registry = MetricsRegistry()
+
+# --- HTTP metrics ---
+HTTP_REQUEST_SECONDS = registry.histogram(
+    'http_request_duration_seconds', 'Time spent handling a request', ('route', 'method', 'status'))
+HTTP_QUEUE_SECONDS = registry.histogram(
+    'http_request_queue_seconds', 'Time between the proxy accepting a request and a worker starting it', ('route',))
+HTTP_ERRORS = registry.counter(
+    'http_request_errors_total', 'Requests that returned a 4xx or 5xx status', ('route', 'status'))
+
+# --- Model call metrics ---
+GEMINI_STAGE_SECONDS = registry.histogram(
+    'gemini_stage_duration_seconds', 'Time per model call stage (precode, llm, clean, parse, transform)', ('prompt_type', 'stage'))
+GEMINI_TOKENS = registry.counter(
+    'gemini_tokens_total', 'Prompt and response tokens reported by the model', ('prompt_type', 'kind'))
+GEMINI_CACHE = registry.counter(
+    'gemini_cache_lookups_total', 'Response cache lookups by result', ('prompt_type', 'result'))
+GEMINI_ERRORS = registry.counter(
+    'gemini_errors_total', 'Failed model calls by error class', ('prompt_type', 'error'))
+PROMPT_TOKENS = registry.counter(
+    'prompt_estimated_tokens_total', 'Estimated prompt tokens before and after prompt-size reduction', ('prompt_type', 'stage'))
+CONTEXT_CACHE = registry.counter(
+    'gemini_context_cache_total', 'Context cache uploads, reuses and failures', ('kind', 'result'))
+MODEL_CALLS = registry.counter(
+    'gemini_model_calls_total', 'Model calls by routed tier and outcome', ('tier', 'prompt_type', 'result'))
+MODEL_COST = registry.counter(
+    'gemini_estimated_cost_usd_total', 'Estimated model spend at list prices', ('tier', 'prompt_type'))
+SPECULATION = registry.counter(
+    'gemini_speculation_total', 'Speculative fast answers by whether verification changed them', ('prompt_type', 'result'))
+GEMINI_RETRIES = registry.counter(
+    'gemini_retries_total', 'Model calls sent again after a retryable error', ('prompt_type', 'error'))
+GEMINI_HEDGES = registry.counter(
+    'gemini_hedged_requests_total', 'Duplicate requests sent for slow model calls and which copy answered', ('prompt_type', 'result'))
+GEMINI_CIRCUIT = registry.counter(
+    'gemini_circuit_events_total', 'Circuit breaker openings, closings and rejected calls per model', ('model', 'event'))
+PRECODER = registry.counter(
+    'precoder_results_total', 'Suggestion requests answered by the rule-based pre-coder or sent to the model', ('result',))
+AUDIT_RECORDS = registry.counter(
+    'audit_records_total', 'Results queued for, written to, dropped by or failed in the audit store', ('result',))
+
+# --- Admission metrics ---
+ADMISSION = registry.counter(
+    'admission_decisions_total', 'Model-bound requests admitted, throttled by their client bucket or turned away busy', ('priority', 'result'))
+ADMISSION_WAIT_SECONDS = registry.histogram(
+    'admission_wait_seconds', 'Time spent waiting for a model slot', ('priority',))
@@ -0,0 +1,199 @@
+import os
+import time
+import threading
+from typing import Dict, Any, Optional, Tuple
+
+from app.services.metrics import MODEL_CALLS, MODEL_COST, SPECULATION
+
+# --- Model tier settings ---
+GEMINI_PRO_MODEL = os.getenv('GEMINI_PRO_MODEL', 'gemini-2.5-pro-preview-03-25')
+GEMINI_FAST_MODEL = os.getenv('GEMINI_FAST_MODEL', 'gemini-2.5-flash')
+# Prompts up to this many characters count as small and may use a prompt type's small-prompt tier
+ROUTING_SMALL_PROMPT_CHARS = int(os.getenv('ROUTING_SMALL_PROMPT_CHARS', '8000'))
+# A tier failing more than this share of recent calls for a prompt type is routed around
+ROUTING_MAX_ERROR_RATE = float(os.getenv('ROUTING_MAX_ERROR_RATE', '0.5'))
+# A tier's error rate halves every this many seconds, so a tier that is routed
+# around (and so no longer called) is tried again once its failures are old
+ROUTING_ERROR_HALF_LIFE_SECONDS = float(os.getenv('ROUTING_ERROR_HALF_LIFE_SECONDS', '60'))
+# Fast answers must match their verification this often for the fast tier to be trusted
+ROUTING_MIN_AGREEMENT = float(os.getenv('ROUTING_MIN_AGREEMENT', '0.9'))
+# Observations needed before measured stats override the static routes
+ROUTING_MIN_SAMPLES = int(os.getenv('ROUTING_MIN_SAMPLES', '20'))
+# Default for /api/suggestions requests that do not say whether to answer speculatively
+SPECULATIVE_SUGGESTIONS = os.getenv('SPECULATIVE_SUGGESTIONS', 'false').lower() in ('1', 'true', 'yes')
+# Weight of the newest observation in the moving averages
+EWMA_ALPHA = 0.1
+
+
+class ModelTier:
+    """A model with its generation limits and list prices (USD per million tokens)."""
+
+    def __init__(self, name: str, model: str, input_price: float, output_price: float,
+                 thinking_budget: Optional[int] = None):
+        self.name = name
+        self.model = model
+        self.input_price = input_price
+        self.output_price = output_price
+        self.thinking_budget = thinking_budget  # None keeps the model's default
+
+    def cost(self, prompt_tokens: int, output_tokens: int) -> float:
+        return (prompt_tokens * self.input_price + output_tokens * self.output_price) / 1_000_000
+
+
+class Route:
+    """Where one prompt type goes: ``small_tier`` for small prompts, ``tier`` otherwise.
+
+    ``deadline`` (seconds) bounds a call including its retries.
+    ``verified`` routes only use the fast tier once speculative runs have
+    shown it agrees with the slow one; ``latency_budget`` (seconds) lets an
+    interactive prompt move to the fast tier when its usual tier gets slow.
+    """
+
+    def __init__(self, small_tier: str, tier: str, max_output_tokens: int, deadline: float,
+                 verified: bool = False, latency_budget: Optional[float] = None):
+        self.small_tier = small_tier
+        self.tier = tier
+        self.max_output_tokens = max_output_tokens
+        self.deadline = deadline
+        self.verified = verified
+        self.latency_budget = latency_budget
+
+
+TIERS = {
+    'fast': ModelTier('fast', GEMINI_FAST_MODEL, 0.30, 2.50, thinking_budget=0),
+    'pro': ModelTier('pro', GEMINI_PRO_MODEL, 1.25, 10.00),
+}
+
+ROUTES = {
+    'Confident Codes': Route('fast', 'pro', 8192, 60, verified=True, latency_budget=30),
+    'Analysis': Route('fast', 'pro', 10000, 120),
+    'Alerts': Route('fast', 'fast', 2048, 30),
+    'Rationale': Route('fast', 'fast', 4096, 45),
+}
+DEFAULT_ROUTE = Route('pro', 'pro', 10000, 120)
+
+
+class _TierStats:
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.seconds = None      # moving average latency of successful calls
+        self.error_rate = 0.0    # moving average share of failed calls, as of updated_at
+        self.updated_at = time.monotonic()
+        self.prompt_tokens = 0
+        self.output_tokens = 0
+        self.cost = 0.0
+
+    def current_error_rate(self, now: float) -> float:
+        """The error rate decayed for the time since the last call."""
+        return self.error_rate * 0.5 ** ((now - self.updated_at) / ROUTING_ERROR_HALF_LIFE_SECONDS)
+
+
+class ModelRouter:
+    """Picks a model tier per prompt type and prompt size, informed by measured stats.
+
+    The static ``ROUTES`` give the starting point. Per tier and prompt type
+    the router keeps moving averages of latency and error rate plus token
+    and cost totals; speculative runs report whether the fast answer
+    matched its verification. A tier that keeps failing is routed around
+    until its error rate decays (never onto a fast tier a verified route
+    does not yet trust), a verified route only goes fast once agreement
+    is proven, and an
+    interactive route over its latency budget moves to the fast tier when
+    that tier is trusted.
+    """
+
+    def __init__(self, tiers: Dict[str, ModelTier] = None, routes: Dict[str, Route] = None,
+                 small_prompt_chars: int = ROUTING_SMALL_PROMPT_CHARS):
+        self.tiers = tiers or TIERS
+        self.routes = routes or ROUTES
+        self.small_prompt_chars = small_prompt_chars
+        self._stats: Dict[Tuple[str, str], _TierStats] = {}
+        self._agreement: Dict[str, list] = {}  # prompt type -> [checks, agreed]
+        self._lock = threading.Lock()
+
+    def route(self, prompt_type: str) -> Route:
+        return self.routes.get(prompt_type, DEFAULT_ROUTE)
+
+    def _failing(self, tier: str, prompt_type: str) -> bool:
+        stats = self._stats.get((tier, prompt_type))
+        return (stats is not None and stats.calls >= ROUTING_MIN_SAMPLES
+                and stats.current_error_rate(time.monotonic()) > ROUTING_MAX_ERROR_RATE)
+
+    def _fast_trusted(self, prompt_type: str, route: Route) -> bool:
+        checks, agreed = self._agreement.get(prompt_type, (0, 0))
+        if checks < ROUTING_MIN_SAMPLES:
+            return not route.verified
+        return agreed / checks >= ROUTING_MIN_AGREEMENT
+
+    def choose(self, prompt_type: str, prompt_chars: int = 0) -> ModelTier:
+        """The tier to call for a prompt of ``prompt_type`` and this size."""
+        route = self.route(prompt_type)
+        name = route.small_tier if prompt_chars <= self.small_prompt_chars else route.tier
+        fast_trusted = self._fast_trusted(prompt_type, route)
+        if name == 'fast' and not fast_trusted:
+            name = route.tier if route.tier != 'fast' else 'pro'
+        elif name != 'fast' and route.latency_budget and fast_trusted:
+            stats = self._stats.get((name, prompt_type))
+            if stats is not None and stats.seconds is not None and stats.seconds > route.latency_budget:
+                name = 'fast'
+        if self._failing(name, prompt_type):
+            other = 'pro' if name == 'fast' else 'fast'
+            if not self._failing(other, prompt_type) and (other != 'fast' or fast_trusted):
+                name = other
+        return self.tiers[name]
+
+    def tier(self, name: str) -> ModelTier:
+        return self.tiers[name]
+
+    def record(self, tier: ModelTier, prompt_type: str, seconds: float, usage=None, error: bool = False):
+        """Fold one finished call (its latency, usage metadata or failure) into the stats."""
+        prompt_tokens = getattr(usage, 'prompt_token_count', None) or 0
+        output_tokens = (getattr(usage, 'candidates_token_count', None) or 0) + \
+            (getattr(usage, 'thoughts_token_count', None) or 0)
+        cost = tier.cost(prompt_tokens, output_tokens)
+        with self._lock:
+            stats = self._stats.setdefault((tier.name, prompt_type), _TierStats())
+            now = time.monotonic()
+            stats.calls += 1
+            stats.error_rate = stats.current_error_rate(now)
+            stats.error_rate += EWMA_ALPHA * ((1.0 if error else 0.0) - stats.error_rate)
+            stats.updated_at = now
+            if error:
+                stats.errors += 1
+            else:
+                stats.seconds = seconds if stats.seconds is None else stats.seconds + EWMA_ALPHA * (seconds - stats.seconds)
+            stats.prompt_tokens += prompt_tokens
+            stats.output_tokens += output_tokens
+            stats.cost += cost
+        MODEL_CALLS.inc(tier.name, prompt_type, 'error' if error else 'ok')
+        if cost:
+            MODEL_COST.inc(tier.name, prompt_type, amount=cost)
+
+    def record_agreement(self, prompt_type: str, agreed: bool):
+        """Record whether a speculative fast answer matched its verification."""
+        with self._lock:
+            counts = self._agreement.setdefault(prompt_type, [0, 0])
+            counts[0] += 1
+            counts[1] += int(agreed)
+        SPECULATION.inc(prompt_type, 'agreed' if agreed else 'changed')
+
+    def get_stats(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        with self._lock:
+            tiers = {}
+            for (tier, prompt_type), stats in sorted(self._stats.items()):
+                tiers.setdefault(tier, {'model': self.tiers[tier].model, 'promptTypes': {}})['promptTypes'][prompt_type] = {
+                    'calls': stats.calls,
+                    'errors': stats.errors,
+                    'avgSeconds': round(stats.seconds, 3) if stats.seconds is not None else None,
+                    'errorRate': round(stats.current_error_rate(now), 3),
+                    'promptTokens': stats.prompt_tokens,
+                    'outputTokens': stats.output_tokens,
+                    'estimatedCostUsd': round(stats.cost, 6),
+                }
+            agreement = {
+                prompt_type: {'checks': checks, 'agreed': agreed, 'rate': round(agreed / checks, 3)}
+                for prompt_type, (checks, agreed) in self._agreement.items() if checks
+            }
+        return {'tiers': tiers, 'agreement': agreement}
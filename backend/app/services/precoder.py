@@ -0,0 +1,522 @@
+import os
+import re
+import csv
+import logging
+from collections import deque
+from typing import List, Dict, Any, Optional, Tuple, NamedTuple, Iterable, Iterator
+
+from app.services.code_catalog import CodeCatalog, CodeTable, DATA_DIR, tokenize, get_catalog
+from app.services.chart_chunker import split_sections
+
+logger = logging.getLogger(__name__)
+
+# --- Pre-coder settings ---
+PRECODER_ENABLED = os.getenv('PRECODER_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+# Let confident charts skip the model; off by default, so candidates are only hints
+PRECODER_ANSWERS = os.getenv('PRECODER_ANSWERS', 'false').lower() in ('1', 'true', 'yes')
+SYNONYMS_FILE = os.getenv('CODE_SYNONYMS_PATH', os.path.join(DATA_DIR, 'code_synonyms.tsv'))
+# Longer charts always go to the model; routine office visits are short
+PRECODER_MAX_CHART_CHARS = int(os.getenv('PRECODER_MAX_CHART_CHARS', '4000'))
+# Longer catalog descriptions are not matched verbatim (charts paraphrase them)
+PRECODER_MAX_PATTERN_TOKENS = int(os.getenv('PRECODER_MAX_PATTERN_TOKENS', '8'))
+# How many tokens before a term a negation, uncertainty or history cue reaches
+CUE_WINDOW_TOKENS = 6
+
+# NegEx-style cues, matched on the same tokens as the terms. A cue applies
+# to terms after it in the same clause unless a 'stop' cue comes between.
+CUES = {
+    'negated': ['no', 'not', 'denies', 'denied', 'negative for', 'without', 'free of', 'absence of',
+                'no evidence of', 'no signs of', 'no history of', 'ruled out'],
+    'uncertain': ['rule out', 'r o', 'possible', 'possibly', 'probable', 'probably', 'likely', 'suspected',
+                  'suspect', 'suspicious for', 'concern for', 'concerning for', 'question of', 'questionable',
+                  'presumed', 'versus', 'vs', 'differential'],
+    'history': ['history of', 'h o', 'hx of', 'past', 'prior', 'previous', 'remote', 'status post', 's p'],
+    'family': ['family history', 'family history of', 'fh', 'fhx', 'mother', 'father', 'sister', 'brother',
+               'maternal', 'paternal'],
+    'planned': ['will', 'plan', 'plan to', 'schedule', 'scheduled', 'order', 'ordered', 'refer', 'referred',
+                'consider', 'recommend', 'recommended'],
+    'stop': ['but', 'however', 'although', 'though', 'except', 'aside from', 'apart from', 'which',
+             'secondary to', 'due to', 'cause of', 'etiology of'],
+}
+# Cues written after the term ("pneumonia, resolved")
+POST_CUES = {
+    'negated': ['resolved', 'ruled out', 'excluded', 'unlikely'],
+    'uncertain': ['suspected', 'possible', 'questionable'],
+    'planned': ['ordered', 'scheduled', 'pending', 'to be done'],
+}
+POST_CUE_WINDOW_TOKENS = 2
+# Words an assessment line may carry besides its diagnoses without changing their codes
+ASSESSMENT_FILLER_WORDS = frozenset(('and', 'stable', 'well', 'controlled', 'improved', 'improving', 'unchanged'))
+# What may follow the comma of a description for the part before it to stand alone
+UNSPECIFIED_WORDS = frozenset(('unspecified', 'not', 'specified', 'site', 'organism'))
+
+# Sections whose current mentions are coded; others (ROS, exam, medication
+# lists, results) only support them
+ICD_SOURCE_SECTIONS = ('assessment_plan', 'chief_complaint', 'hpi', 'procedures', 'preamble', 'course')
+CPT_SOURCE_SECTIONS = ('procedures', 'assessment_plan', 'course', 'hpi', 'preamble')
+
+# ICD-10-CM categories of chronic illnesses, for the E/M problem count
+CHRONIC_CATEGORIES = frozenset((
+    'E03', 'E05', 'E10', 'E11', 'E55', 'E66', 'E78', 'F20', 'F31', 'F32', 'F33', 'F41', 'F90',
+    'G20', 'G35', 'G40', 'G43', 'G47', 'I10', 'I11', 'I12', 'I13', 'I20', 'I25', 'I48', 'I50',
+    'J30', 'J44', 'J45', 'K21', 'K50', 'K51', 'K58', 'M05', 'M06', 'M15', 'M16', 'M17', 'M81',
+    'N18', 'N40',
+))
+MDM_LEVELS = ('straightforward', 'low', 'moderate', 'high')
+SECTION_LABELS = {'assessment_plan': 'the assessment and plan', 'chief_complaint': 'the chief complaint',
+                  'hpi': 'the HPI', 'preamble': 'the note'}
+
+_CLAUSE_SPLIT_RE = re.compile(r'[.;!?](?:\s+|$)')
+_LIST_ITEM_RE = re.compile(r'^\s*(?:\d+[.)]|[-*•#])\s*')
+# Where the diagnosis of an assessment line ends and its plan begins
+_PLAN_SPLIT_RE = re.compile(r'\s[-–—]\s|:|[.;!?](?:\s+|$)')
+_PARENTHETICAL_RE = re.compile(r'\([^)]*\)')
+# "Office visit, est patient, 20-29 min" (short descriptors)
+_EM_SHORT_RE = re.compile(r'office visit,?\s*(new|est)\w*\s+patient,?\s*(\d+)\s*-\s*(\d+)\s*min')
+# "... established patient ... low level of medical decision making ... 20 minutes must be met ..."
+_EM_LONG_RE = re.compile(
+    r'outpatient visit .*?\b(new|established) patient\b.*?\b(straightforward|low|moderate|high)\b.*?'
+    r'(\d+) minutes must be met', re.DOTALL)
+_TIME_RE = re.compile(
+    r'\btime\b[^.\n]{0,40}?\b(\d{1,3})\s*(?:minutes|mins?)\b|\bspent\b[^.\n]{0,20}?\b(\d{1,3})\s*(?:minutes|mins?)\b',
+    re.IGNORECASE)
+_NEW_PATIENT_RE = re.compile(r'\bnew patient\b|\bnew to (?:the )?(?:clinic|practice)\b|\bestablish(?:ing)? care\b',
+                             re.IGNORECASE)
+_ESTABLISHED_RE = re.compile(r'\bestablished patient\b|\bfollow[- ]?up\b|\breturn visit\b|\breturns for\b',
+                             re.IGNORECASE)
+_PREVENTIVE_RE = re.compile(r'\b(?:annual|preventive|wellness|well[- ]adult) (?:exam|visit|physical)\b|'
+                            r'\bannual physical\b', re.IGNORECASE)
+_RX_RE = re.compile(
+    r'\b(?:continue[sd]?|start(?:ed)?|begin|increase[sd]?|decrease[sd]?|titrate|refill(?:ed)?|prescribed?|'
+    r'switch(?:ed)? to|change[sd]? to)\b[^.\n]*?\b\d+(?:\.\d+)?\s*(?:mg|mcg|g|units?|ml|puffs?)\b',
+    re.IGNORECASE)
+
+
+class PhraseMatcher:
+    """Aho-Corasick automaton over token sequences.
+
+    Every pattern occurring in a token list is found in one pass,
+    whatever the number of patterns. Patterns match whole tokens only,
+    so 'htn' never matches inside another word.
+    """
+
+    def __init__(self):
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._out: List[List[int]] = [[]]
+        self.patterns: List[Tuple[str, ...]] = []
+        self.values: List[Any] = []
+        self._ids: Dict[Tuple[str, ...], int] = {}
+
+    def __len__(self) -> int:
+        return len(self.patterns)
+
+    def add(self, tokens: Iterable[str], value: Any) -> int:
+        """Add a pattern; adding the same tokens again returns the existing pattern id."""
+        tokens = tuple(tokens)
+        if tokens in self._ids:
+            return self._ids[tokens]
+        node = 0
+        for token in tokens:
+            next_node = self._goto[node].get(token)
+            if next_node is None:
+                next_node = len(self._goto)
+                self._goto[node][token] = next_node
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append([])
+            node = next_node
+        pattern_id = len(self.patterns)
+        self._out[node].append(pattern_id)
+        self.patterns.append(tokens)
+        self.values.append(value)
+        self._ids[tokens] = pattern_id
+        return pattern_id
+
+    def build(self):
+        """Compute failure links; call once after the last ``add``."""
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for token, child in self._goto[node].items():
+                fail = self._fail[node]
+                while fail and token not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[child] = self._goto[fail].get(token, 0)
+                self._out[child] = self._out[child] + self._out[self._fail[child]]
+                queue.append(child)
+
+    def find(self, tokens: List[str]) -> Iterator[Tuple[int, int, int]]:
+        """Yield ``(start, end, pattern_id)`` for every occurrence, ``end`` exclusive."""
+        node = 0
+        for i, token in enumerate(tokens):
+            while node and token not in self._goto[node]:
+                node = self._fail[node]
+            node = self._goto[node].get(token, 0)
+            for pattern_id in self._out[node]:
+                yield i + 1 - len(self.patterns[pattern_id]), i + 1, pattern_id
+
+
+def _longest_matches(matches: Iterable[Tuple[int, int, int]]) -> List[Tuple[int, int, int]]:
+    """Leftmost-longest non-overlapping matches, so 'mild intermittent asthma' beats 'asthma'."""
+    kept, end = [], 0
+    for start, stop, pattern_id in sorted(matches, key=lambda m: (m[0], -(m[1] - m[0]))):
+        if start >= end:
+            kept.append((start, stop, pattern_id))
+            end = stop
+    return kept
+
+
+def description_phrases(description: str) -> List[str]:
+    """Ways a catalog description is commonly written in a chart.
+
+    "Essential (primary) hypertension" -> "essential hypertension";
+    "Hypothyroidism, unspecified" -> "hypothyroidism"; "Unspecified
+    atrial fibrillation" -> "atrial fibrillation"; "Pneumonia,
+    unspecified organism" -> "pneumonia". The part before a comma only
+    stands alone when the rest says nothing more specific, so "Chronic
+    kidney disease, stage 3" keeps its stage.
+    """
+    text = _PARENTHETICAL_RE.sub(' ', description.lower())
+    phrases = [text]
+    for separator in (',', ';'):
+        head, _, rest = text.partition(separator)
+        if rest and set(tokenize(rest)) <= UNSPECIFIED_WORDS:
+            phrases.append(head)
+    phrases += [re.sub(r'^unspecified\s+|,?\s*unspecified\b', ' ', phrase) for phrase in phrases]
+    return list(dict.fromkeys(' '.join(tokenize(phrase)) for phrase in phrases))
+
+
+def load_synonyms(filepath: str = SYNONYMS_FILE) -> List[Tuple[str, str, bool]]:
+    """``(code, synonym, hint_only)`` rows of the synonyms file, or none if it is missing.
+
+    ``hint_only`` synonyms name a condition whose code depends on more
+    than the words ("hypertension" may be I11 or O10); they are passed
+    to the model as candidates but never code a chart on their own.
+    """
+    try:
+        with open(filepath, 'r', encoding='utf-8') as f:
+            return [(row['code'].strip(), row['synonym'].strip(), (row.get('hint_only') or '').strip() == 'yes')
+                    for row in csv.DictReader(f, delimiter='\t') if row.get('code') and row.get('synonym')]
+    except Exception as e:
+        logger.error("Error loading code synonyms %s: %s", filepath, e)
+        return []
+
+
+class Mention(NamedTuple):
+    kind: str      # 'icd' or 'cpt'
+    code: str
+    term: str      # the matched words
+    section: str   # canonical section name from chart_chunker
+    status: str    # 'current', 'negated', 'uncertain', 'history', 'family' or 'planned'
+    line: int      # line number within the section
+    hint_only: bool = False  # the term is too generic to code without the model
+
+
+class Candidate(NamedTuple):
+    code: str
+    confidence: str  # 'high' or 'medium'
+    rationale: str
+
+
+class Precoding(NamedTuple):
+    icd: List[Candidate]
+    cpt: List[Candidate]
+    confident: bool
+    reasons: List[str]  # why the chart still needs the model
+
+    def as_model_output(self) -> Dict[str, Any]:
+        """The high-confidence codes in the shape of a ``ConfidentCode`` model answer."""
+        return {
+            'suggestedIcd': [{'code': c.code, 'rationale': c.rationale} for c in self.icd if c.confidence == 'high'],
+            'suggestedCpt': [{'code': c.code, 'modifiers': [], 'units': '1', 'rationale': c.rationale}
+                             for c in self.cpt if c.confidence == 'high'],
+        }
+
+    def hints(self) -> str:
+        """Candidate codes as a prompt block, or '' when there are none."""
+        if not (self.icd or self.cpt):
+            return ''
+        lines = ['', 'CANDIDATE CODES (from a dictionary pre-coder; confirm each against the chart, drop any the '
+                     'documentation does not support and add any it missed):']
+        for label, candidates in (('ICD-10-CM', self.icd), ('CPT', self.cpt)):
+            for c in candidates:
+                lines.append(f"- {label} {c.code} ({c.confidence}): {c.rationale}")
+        return '\n'.join(lines) + '\n'
+
+
+class _EMCode(NamedTuple):
+    code: str
+    patient: str  # 'new' or 'established'
+    min_minutes: int
+    max_minutes: Optional[int]
+    level: int    # index into MDM_LEVELS
+
+
+def _em_codes(table: CodeTable) -> List[_EMCode]:
+    """Office E/M codes with their patient type, time range and MDM level, read from the descriptions."""
+    found = []
+    for code, description in zip(table.codes, table.descriptions):
+        description = description.lower()
+        match = _EM_SHORT_RE.search(description)
+        if match:
+            patient = 'new' if match.group(1) == 'new' else 'established'
+            found.append((code, patient, int(match.group(2)), int(match.group(3)), None))
+            continue
+        match = _EM_LONG_RE.search(description)
+        if match:
+            found.append((code, match.group(1), int(match.group(3)), None, MDM_LEVELS.index(match.group(2))))
+    codes = []
+    for patient in ('new', 'established'):
+        rows = sorted((row for row in found if row[1] == patient), key=lambda row: row[2])
+        if len(rows) > len(MDM_LEVELS) and any(row[4] is None for row in rows):
+            logger.warning("Cannot assign MDM levels to %d %s patient E/M codes", len(rows), patient)
+            continue
+        for level, (code, _, low, high, mdm) in enumerate(rows):
+            # Short descriptors carry no MDM level; time ranges rise with it
+            codes.append(_EMCode(code, patient, low, high, level if mdm is None else mdm))
+    return codes
+
+
+def _section_body(text: str) -> Tuple[str, str]:
+    """(header, body) of a section from ``split_sections``; the preamble has no header."""
+    header, sep, body = text.partition(':')
+    if not sep or '\n' in header:
+        return '', text
+    return header.strip().lower(), body
+
+
+class PreCoder:
+    """Rule-based coder that finds candidate codes without calling the model.
+
+    Catalog descriptions (and the short forms charts use for them) plus
+    the synonyms file are compiled into one ``PhraseMatcher``; a chart is
+    tokenized clause by clause and every match is classed as current,
+    negated, uncertain, historical, family or planned from NegEx-style
+    cues and the section it is in, following the rules of the
+    confident_codes prompt: no 'history of' conditions except Z-codes,
+    no rule-out diagnoses. Office E/M levels come from documented time or
+    a conservative MDM estimate.
+
+    A chart is ``confident`` when it is short, every word of every
+    numbered assessment line's diagnosis and every procedure line maps
+    to a code, none of those terms is a generic (hint-only) synonym,
+    there is nothing uncertain in the assessment and exactly one E/M
+    level is supported; with ``PRECODER_ANSWERS`` those charts need no
+    model call. Otherwise the candidates are hints.
+    """
+
+    def __init__(self, catalog: CodeCatalog, synonyms_path: str = SYNONYMS_FILE,
+                 max_chart_chars: int = PRECODER_MAX_CHART_CHARS):
+        self.max_chart_chars = max_chart_chars
+        self.em_codes = _em_codes(catalog.cpt)
+        self.matcher = PhraseMatcher()
+        em = {e.code for e in self.em_codes}
+
+        derived: Dict[Tuple[str, Tuple[str, ...]], set] = {}
+        for kind, table in (('icd', catalog.icd), ('cpt', catalog.cpt)):
+            keys = table.keys
+            for i, (code, description) in enumerate(zip(table.codes, table.descriptions)):
+                if code in em or (kind == 'icd' and i + 1 < len(keys) and keys[i + 1].startswith(keys[i])):
+                    continue  # E/M is chosen by rule; ICD headers cannot be billed
+                for phrase in description_phrases(description):
+                    tokens = tuple(phrase.split())
+                    if 0 < len(tokens) <= PRECODER_MAX_PATTERN_TOKENS:
+                        derived.setdefault((kind, tokens), set()).add(code)
+        patterns: Dict[Tuple[str, ...], Dict[Tuple[str, str], bool]] = {}  # tokens -> {(kind, code): hint_only}
+        for (kind, tokens), codes in derived.items():
+            if len(codes) == 1:  # a short form shared by several codes says nothing
+                patterns.setdefault(tokens, {})[(kind, codes.pop())] = False
+
+        valid = {('icd', code) for code in catalog.icd.codes} | {('cpt', code) for code in catalog.cpt.codes}
+        for code, synonym, hint_only in load_synonyms(synonyms_path):
+            kind = 'cpt' if code[:1].isdigit() else 'icd'
+            tokens = tuple(tokenize(synonym))
+            if (kind, code) in valid and tokens:
+                codes = patterns.setdefault(tokens, {})
+                codes[(kind, code)] = codes.get((kind, code), False) or hint_only
+        for tokens, codes in patterns.items():
+            self.matcher.add(tokens, tuple(sorted((kind, code, hint_only)
+                                                  for (kind, code), hint_only in codes.items())))
+        self.matcher.build()
+
+        self.cues = PhraseMatcher()
+        self.post_cues = PhraseMatcher()
+        for matcher, cues in ((self.cues, CUES), (self.post_cues, POST_CUES)):
+            for status, phrases in cues.items():
+                for phrase in phrases:
+                    matcher.add(phrase.split(), status)
+            matcher.build()
+        logger.info("Pre-coder compiled %d patterns", len(self.matcher))
+
+    def _status(self, tokens: List[str], start: int, end: int, cues: List[Tuple[int, int, int]],
+                post_cues: List[Tuple[int, int, int]]) -> Optional[str]:
+        """The status the nearest cue before (or just after) a term gives it, or None."""
+        status = None
+        for _, cue_end, cue_id in cues:
+            if cue_end > start:
+                break
+            if start - cue_end <= CUE_WINDOW_TOKENS:
+                status = self.cues.values[cue_id]  # the nearest cue wins, so a 'stop' in between ends the scope
+        if status == 'stop':
+            return None
+        if status is None:
+            for cue_start, _, cue_id in post_cues:
+                if end <= cue_start <= end + POST_CUE_WINDOW_TOKENS:
+                    return self.post_cues.values[cue_id]
+        return status
+
+    def mentions(self, chart_text: str) -> List[Mention]:
+        """Every code mention in the chart with its section and status."""
+        mentions = []
+        offsets: Dict[str, int] = {}  # repeated sections are numbered as one
+        for section in split_sections(chart_text):
+            header, body = _section_body(section.text)
+            section_status = None
+            if section.name == 'history':
+                section_status = 'family' if header.startswith('family') else 'history'
+            elif header == 'orders':
+                section_status = 'planned'
+            lines = body.split('\n')
+            offset = offsets.get(section.name, 0)
+            offsets[section.name] = offset + len(lines)
+            for line_number, line in enumerate(lines, offset):
+                for clause in _CLAUSE_SPLIT_RE.split(line):
+                    tokens = tokenize(clause)
+                    if not tokens:
+                        continue
+                    matches = _longest_matches(self.matcher.find(tokens))
+                    if not matches:
+                        continue
+                    cues = _longest_matches(self.cues.find(tokens))
+                    post_cues = _longest_matches(self.post_cues.find(tokens))
+                    for start, end, pattern_id in matches:
+                        status = self._status(tokens, start, end, cues, post_cues)
+                        if status is None or (section_status and status not in ('negated', 'family')):
+                            status = section_status or 'current'
+                        term = ' '.join(tokens[start:end])
+                        for kind, code, hint_only in self.matcher.values[pattern_id]:
+                            mentions.append(Mention(kind, code, term, section.name, status, line_number,
+                                                    hint_only))
+        return mentions
+
+    def _evaluation_and_management(self, chart_text: str, problems: List[str],
+                                   plan_text: str) -> Tuple[Optional[Candidate], Optional[str]]:
+        """The office E/M code and why, or (None, reason it could not be chosen)."""
+        if _PREVENTIVE_RE.search(chart_text):
+            return None, 'preventive visit'
+        new, established = bool(_NEW_PATIENT_RE.search(chart_text)), bool(_ESTABLISHED_RE.search(chart_text))
+        if new == established:
+            return None, 'new or established patient not documented'
+        patient = 'new' if new else 'established'
+        codes = [e for e in self.em_codes if e.patient == patient]
+        if not codes:
+            return None, f'no {patient} patient E/M codes in the catalog'
+
+        choices = []
+        minutes = [int(a or b) for a, b in _TIME_RE.findall(chart_text)]
+        if minutes:
+            total = max(minutes)
+            by_time = [e for e in codes if e.min_minutes <= total]
+            if by_time:
+                choices.append((by_time[-1], f'{total} minutes total time documented'))
+        chronic = sum(1 for code in problems if code[:3] in CHRONIC_CATEGORIES)
+        other = len(problems) - chronic
+        if problems:
+            problem_level = 2 if chronic >= 2 else 1
+            rx = bool(_RX_RE.search(plan_text))
+            # With data review not assessed, MDM is the lower of problems and risk
+            level = min(problem_level, 2 if rx else 1)
+            by_mdm = [e for e in codes if e.level == level]
+            if by_mdm:
+                detail = f'{chronic} chronic and {other} other problem(s) addressed'
+                if rx:
+                    detail += ' with prescription drug management'
+                choices.append((by_mdm[0], f'{MDM_LEVELS[level]} MDM ({detail})'))
+        if not choices:
+            return None, 'E/M level not supported by documented time or assessment'
+        em, why = max(choices, key=lambda choice: choice[0].min_minutes)
+        return Candidate(em.code, 'high', f'{patient.capitalize()} patient office visit; {why} (rule-based).'), None
+
+    def precode(self, chart_text: str) -> Precoding:
+        """Candidate codes for a chart and whether they can stand without the model."""
+        mentions = self.mentions(chart_text)
+        reasons = []
+        if len(chart_text) > self.max_chart_chars:
+            reasons.append('chart too long for rule-based coding')
+
+        sections = {}
+        for section in split_sections(chart_text):
+            sections.setdefault(section.name, []).append(_section_body(section.text)[1])
+        plan_text = '\n'.join(sections.get('assessment_plan', []))
+
+        icd: Dict[str, Candidate] = {}
+        cpt: Dict[str, Candidate] = {}
+        covered = set()  # (section, line) with a current code
+        for m in mentions:
+            label = SECTION_LABELS.get(m.section, m.section.replace('_', ' '))
+            if m.status == 'current':
+                covered.add((m.kind, m.section, m.line))
+            if m.hint_only and m.status == 'current':
+                reasons.append(f'generic term "{m.term}" needs the model to pick a specific code')
+            if m.kind == 'icd':
+                if m.status == 'uncertain' and m.section == 'assessment_plan':
+                    reasons.append(f'uncertain diagnosis "{m.term}"')
+                z_history = m.status == 'history' and m.code.startswith('Z')
+                if m.status != 'current' and not z_history:
+                    continue
+                if m.section in ICD_SOURCE_SECTIONS or z_history:
+                    high = m.section == 'assessment_plan'
+                    if high or m.code not in icd:
+                        icd[m.code] = Candidate(m.code, 'high' if high else 'medium',
+                                                f'"{m.term}" documented in {label} (rule-based).')
+            elif m.status == 'current' and m.section in CPT_SOURCE_SECTIONS:
+                high = m.section == 'procedures'
+                if high or m.code not in cpt:
+                    cpt[m.code] = Candidate(m.code, 'high' if high else 'medium',
+                                            f'"{m.term}" documented in {label} (rule-based).')
+
+        plan_lines = plan_text.split('\n')
+        items = [i for i, line in enumerate(plan_lines) if _LIST_ITEM_RE.match(line) and line.strip(' \t-*#.)0123456789')]
+        if not plan_text.strip():
+            reasons.append('no assessment')
+        elif not items:
+            reasons.append('assessment is not a numbered problem list')
+        for i in items:
+            if ('icd', 'assessment_plan', i) not in covered:
+                reasons.append(f'unmatched assessment line "{plan_lines[i].strip()[:60]}"')
+                continue
+            # "with foot ulcer", "in pregnancy" or "moderate persistent" change the code the rest maps to
+            diagnosis = tokenize(_PLAN_SPLIT_RE.split(_LIST_ITEM_RE.sub('', plan_lines[i]), 1)[0])
+            matched = {j for start, end, _ in _longest_matches(self.matcher.find(diagnosis))
+                       for j in range(start, end)}
+            unmatched = [token for j, token in enumerate(diagnosis)
+                         if j not in matched and token not in ASSESSMENT_FILLER_WORDS]
+            if unmatched:
+                reasons.append(f'unmatched words "{" ".join(unmatched)}" in assessment line '
+                               f'"{plan_lines[i].strip()[:60]}"')
+        procedure_lines = '\n'.join(sections.get('procedures', [])).split('\n')
+        for i, line in enumerate(procedure_lines):
+            if tokenize(line) and ('cpt', 'procedures', i) not in covered:
+                reasons.append(f'unmatched procedure "{line.strip()[:60]}"')
+        for code, candidate in icd.items():
+            # Unexplained symptoms are left to the model, but other diagnoses outside the assessment are not
+            if candidate.confidence != 'high' and not code.startswith('R'):
+                reasons.append(f'{code} documented outside the assessment')
+        for code, candidate in cpt.items():
+            if candidate.confidence != 'high':
+                reasons.append(f'{code} documented outside the procedures')
+
+        problems = [code for code, c in icd.items() if c.confidence == 'high' and not code.startswith('Z')]
+        em, why_not = self._evaluation_and_management(chart_text, problems, plan_text)
+        if em is None:
+            reasons.append(why_not)
+        else:
+            cpt = {em.code: em, **cpt}
+
+        return Precoding(list(icd.values()), list(cpt.values()), not reasons, list(dict.fromkeys(reasons)))
+
+
+def get_precoder() -> PreCoder:
+    """The pre-coder of the process-wide catalog."""
+    return get_catalog().shared('precoder', PreCoder)
@@ -0,0 +1,39 @@
+import os
+import threading
+from typing import Callable, Generic, Optional, TypeVar
+
+T = TypeVar('T')
+
+
+class ProcessLocal(Generic[T]):
+    """A value built on first use in each process.
+
+    A forked child builds its own copy the first time it asks for the
+    value, so clients, sockets, threads and SQLite connections opened by a
+    parent (e.g. a gunicorn master with preloading) are never shared.
+    Read-only data meant to be shared across the fork belongs in
+    ``CodeCatalog.shared`` instead.
+    """
+
+    def __init__(self, factory: Callable[[], T]):
+        self.factory = factory
+        self._value: Optional[T] = None
+        self._pid = None
+        self._lock = threading.Lock()
+        # A fork while another thread held the lock would leave the child's copy held forever
+        os.register_at_fork(after_in_child=self._reset_lock)
+
+    def _reset_lock(self):
+        self._lock = threading.Lock()
+
+    def get(self) -> T:
+        pid = os.getpid()
+        if self._pid != pid:
+            with self._lock:
+                if self._pid != pid:
+                    self._value = self.factory()
+                    self._pid = pid
+        return self._value
+
+    def __call__(self) -> T:
+        return self.get()
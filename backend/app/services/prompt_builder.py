@@ -0,0 +1,277 @@
+import os
+import re
+import json
+import time
+import logging
+import threading
+from string import Formatter
+from typing import List, Dict, Any, Optional, Tuple
+
+from app.services.metrics import PROMPT_TOKENS
+
+logger = logging.getLogger(__name__)
+
+# --- Prompt settings ---
+PROMPT_DIR = os.path.join(os.path.dirname(__file__), '..', 'prompts')
+# How often a template file is checked for changes; 0 disables hot reload
+PROMPT_RELOAD_SECONDS = float(os.getenv('PROMPT_RELOAD_SECONDS', '2'))
+# Off until validated on real charts
+PROMPT_TRIM_CHARTS = os.getenv('PROMPT_TRIM_CHARTS', 'false').lower() in ('1', 'true', 'yes')
+# Flowsheet rows of a vitals table kept (the most recent ones)
+VITALS_TABLE_MAX_ROWS = int(os.getenv('VITALS_TABLE_MAX_ROWS', '3'))
+# A line found word for word in the same place at the top or bottom of this
+# many pages is a page header/footer and is kept only once
+REPEATED_LINE_MIN_COUNT = 3
+REPEATED_LINE_MIN_CHARS = 15
+# Lines at each end of a page that may be a header or footer
+PAGE_EDGE_LINES = 2
+
+# Rough size of a Gemini token in characters, for reporting only
+CHARS_PER_TOKEN = 4
+
+# Fields of the code dicts the model needs to judge a code; the rest is UI state
+RATIONALE_CODE_FIELDS = ('code', 'description', 'modifiers', 'units', 'unit', 'rationale')
+
+_HORIZONTAL_SPACE_RE = re.compile(r'[ \t\f\v\u00a0]+')
+_BLANK_LINES_RE = re.compile(r'\n{3,}')
+_DIGITS_RE = re.compile(r'\d+')
+_PAGE_LINE_RE = re.compile(r'^\s*(?:page\s+\d+(?:\s+of\s+\d+)?|-+\s*\d+\s*-+)\s*$', re.IGNORECASE)
+_SIGNATURE_LINE_RE = re.compile(
+    r'^\s*(?:electronically signed|e-signed|digitally signed|signed by|dictated by|transcribed by|'
+    r'dictated but not read|this (?:note|document) (?:was|has been) (?:electronically )?(?:signed|generated))',
+    re.IGNORECASE,
+)
+_TABLE_SPLIT_RE = re.compile(r'\t|\s{2,}|\|')
+_VITALS_HEADER_RE = re.compile(r'\b(?:BP|HR|pulse|temp|SpO2|O2 sat|RR|resp|weight|wt)\b', re.IGNORECASE)
+
+
+def _cell_count(line: str) -> int:
+    return len([cell for cell in _TABLE_SPLIT_RE.split(line.strip()) if cell.strip()])
+
+
+def _trim_vitals_tables(lines: List[str]) -> List[Tuple[str, bool]]:
+    """Keep the header and the latest rows of long vitals flowsheets.
+
+    A flowsheet is a header naming at least two vital signs followed by
+    rows with about the same number of cells that contain measurements.
+    Returns ``(line, in_table)`` pairs.
+    """
+    result = []
+    i = 0
+    while i < len(lines):
+        line = lines[i]
+        cells = _cell_count(line)
+        if cells >= 3 and len(_VITALS_HEADER_RE.findall(line)) >= 2:
+            end = i + 1
+            while (end < len(lines) and abs(_cell_count(lines[end]) - cells) <= 1
+                   and _DIGITS_RE.search(lines[end])):
+                end += 1
+            rows = lines[i + 1:end]
+            result.append((line, True))
+            omitted = max(0, len(rows) - VITALS_TABLE_MAX_ROWS)
+            result.extend((row, True) for row in rows[omitted:])
+            if omitted:
+                # After the rows, so trimming the output again leaves it unchanged
+                result.append((f'[{omitted} earlier rows omitted]', True))
+            i = end
+            continue
+        result.append((line, False))
+        i += 1
+    return result
+
+
+def trim_chart(text: str) -> str:
+    """Drop chart content that costs tokens without informing coding.
+
+    Long vitals flowsheets are cut to their most recent rows, whitespace
+    is normalized, page markers and signature/attestation lines are
+    removed, and page headers and footers (lines repeated word for word
+    in the same place at the top or bottom of several pages) are kept
+    once. Every other line, including repeated ones, is kept as written.
+    """
+    text = text.replace('\r\n', '\n').replace('\r', '\n').replace('\f', '\n\f\n')
+    lines = [line.rstrip() for line in text.split('\n')]
+
+    entries = []  # (line, page it is on, or None for flowsheet rows)
+    page = 0
+    for line, in_table in _trim_vitals_tables(lines):
+        if in_table:
+            # Flowsheet rows keep their column spacing and are never deduplicated
+            entries.append((line, None))
+            continue
+        if line == '\f':
+            page += 1
+            continue
+        line = _HORIZONTAL_SPACE_RE.sub(' ', line).strip()
+        if _PAGE_LINE_RE.match(line):
+            page += 1
+            continue
+        if _SIGNATURE_LINE_RE.match(line):
+            continue
+        entries.append((line, page))
+
+    # The same line in the same place (e.g. first, or second to last) on several pages is a header/footer
+    edges: Dict[int, Tuple[str, str, int]] = {}
+    pages_of: Dict[Tuple[str, str, int], set] = {}
+    by_page: Dict[int, List[int]] = {}
+    for i, (line, page) in enumerate(entries):
+        if page is not None and line:
+            by_page.setdefault(page, []).append(i)
+    for page, indexes in by_page.items():
+        places = [(i, 'top', n) for n, i in enumerate(indexes[:PAGE_EDGE_LINES])]
+        places += [(i, 'bottom', n) for n, i in enumerate(reversed(indexes[-PAGE_EDGE_LINES:]))]
+        for i, edge, n in places:
+            if i not in edges:
+                edges[i] = (entries[i][0], edge, n)
+                pages_of.setdefault(edges[i], set()).add(page)
+
+    kept, seen = [], set()
+    for i, (line, _) in enumerate(entries):
+        place = edges.get(i)
+        if (place is not None and len(line) >= REPEATED_LINE_MIN_CHARS
+                and len(pages_of[place]) >= REPEATED_LINE_MIN_COUNT):
+            if line in seen:
+                continue
+            seen.add(line)
+        kept.append(line)
+
+    return _BLANK_LINES_RE.sub('\n\n', '\n'.join(kept)).strip()
+
+
+def compact_codes(codes: List[Dict[str, Any]]) -> str:
+    """Minified JSON of the code fields the model needs, without empty values."""
+    compact = [
+        {field: code[field] for field in RATIONALE_CODE_FIELDS if code.get(field) not in (None, '', [], '#')}
+        for code in codes if isinstance(code, dict)
+    ]
+    return json.dumps(compact, separators=(',', ':'), ensure_ascii=False)
+
+
+class PromptTemplate:
+    """A prompt file compiled into literal pieces and field names, reloaded when the file changes.
+
+    Rendering is a single join; ``{{``/``}}`` escapes are resolved once at
+    compile time rather than on every call as ``str.format`` does.
+    """
+
+    def __init__(self, path: str, reload_seconds: float = PROMPT_RELOAD_SECONDS):
+        self.path = path
+        self.reload_seconds = reload_seconds
+        self._compiled: Tuple[List[str], List[Optional[str]]] = ([], [])
+        self._mtime = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+        self.loaded = self._load()
+
+    def _load(self) -> bool:
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+            with open(self.path, 'r', encoding='utf-8') as f:
+                source = f.read()
+            literals, fields = [], []
+            for literal, field, _, _ in Formatter().parse(source):
+                literals.append(literal)
+                fields.append(field)
+        except Exception as e:
+            logger.error("Error loading prompt template %s: %s", self.path, e)
+            return False
+        # Swapped as one tuple so concurrent renders never see a half-built template
+        self._compiled = (literals, fields)
+        self._mtime = mtime
+        return True
+
+    def _maybe_reload(self):
+        now = time.monotonic()
+        if not self.reload_seconds or now - self._checked_at < self.reload_seconds:
+            return
+        with self._lock:
+            if now - self._checked_at < self.reload_seconds:
+                return
+            self._checked_at = now
+            try:
+                changed = os.stat(self.path).st_mtime_ns != self._mtime
+            except OSError:
+                return
+            if changed and self._load():
+                self.loaded = True
+                logger.info("Reloaded prompt template %s", self.path)
+
+    def split(self, field: str) -> Tuple[str, str]:
+        """The rendered text before ``field`` (which must occur once and be the first field)
+        and the literal text right after it, up to the next field."""
+        self._maybe_reload()
+        literals, fields = self._compiled
+        index = fields.index(field)
+        return ''.join(literals[:index + 1]), literals[index + 1] if index + 1 < len(literals) else ''
+
+    def render(self, **values: str) -> str:
+        self._maybe_reload()
+        literals, fields = self._compiled
+        parts = []
+        for literal, field in zip(literals, fields):
+            parts.append(literal)
+            if field is not None:
+                parts.append(str(values[field]))
+        return ''.join(parts)
+
+
+class PromptBuilder:
+    """Builds every model prompt from the precompiled templates in ``prompt_dir``.
+
+    Chart text is trimmed of boilerplate and code payloads are reduced to
+    compact JSON of the fields the model uses. The estimated prompt size
+    before and after is counted per prompt type in
+    ``prompt_estimated_tokens_total``.
+    """
+
+    def __init__(self, prompt_dir: str = PROMPT_DIR, trim_charts: bool = PROMPT_TRIM_CHARTS):
+        self.trim_charts = trim_charts
+        self.templates: Dict[str, PromptTemplate] = {}
+        for filename in sorted(os.listdir(prompt_dir)):
+            if filename.endswith('.txt'):
+                self.templates[filename[:-4]] = PromptTemplate(os.path.join(prompt_dir, filename))
+
+    def is_loaded(self, name: str) -> bool:
+        template = self.templates.get(name)
+        return template is not None and template.loaded
+
+    def chart_parts(self, name: str) -> Tuple[str, str]:
+        """The instructions before the chart in template ``name`` and the text that closes the chart."""
+        return self.templates[name].split('emr_text')
+
+    def chart_context(self, chart_text: str) -> str:
+        """A trimmed chart as a standalone message, for sharing between prompts via the context cache."""
+        return f"EMR CHART:\n--- START ---\n{chart_text}\n--- END ---"
+
+    def trim_chart(self, chart_text: str) -> str:
+        return trim_chart(chart_text) if self.trim_charts else chart_text
+
+    def record(self, prompt_type: str, original_chars: int, sent_chars: int):
+        """Count the estimated tokens a prompt would have had without reduction and the tokens sent."""
+        before = (original_chars + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+        after = (sent_chars + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+        PROMPT_TOKENS.inc(prompt_type, 'before', amount=before)
+        PROMPT_TOKENS.inc(prompt_type, 'after', amount=after)
+        logger.debug("%s prompt: ~%d -> ~%d tokens", prompt_type, before, after)
+
+    def chart_prompt(self, name: str, prompt_type: str, chart_text: str, trimmed: bool = False,
+                     original_chars: Optional[int] = None, **fields: str) -> str:
+        """Render template ``name`` around a chart, with any other ``fields`` it has.
+
+        Pass ``trimmed=True`` for text already run through ``trim_chart``,
+        with ``original_chars`` the untrimmed length it stood for.
+        """
+        text = chart_text if trimmed else self.trim_chart(chart_text)
+        prompt = self.templates[name].render(emr_text=text, **fields)
+        if original_chars is None:
+            original_chars = len(chart_text)
+        self.record(prompt_type, len(prompt) - len(text) + original_chars, len(prompt))
+        return prompt
+
+    def rationale_prompt(self, cpt_codes: List[Dict[str, Any]], icd_codes: List[Dict[str, Any]]) -> str:
+        """Render the rationale prompt with compact code payloads."""
+        cpt, icd = compact_codes(cpt_codes), compact_codes(icd_codes)
+        prompt = self.templates['rationale'].render(cpt_codes=cpt, icd_codes=icd)
+        original = len(json.dumps(cpt_codes, indent=2)) + len(json.dumps(icd_codes, indent=2))
+        self.record('Rationale', len(prompt) - len(cpt) - len(icd) + original, len(prompt))
+        return prompt
@@ -0,0 +1,163 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, Optional
+
+logger = logging.getLogger(__name__)
+
+# --- Cache settings ---
+CACHE_MAX_ENTRIES = int(os.getenv('AI_CACHE_MAX_ENTRIES', '512'))
+CACHE_TTL_SECONDS = float(os.getenv('AI_CACHE_TTL_SECONDS', '3600'))
+CACHE_DB_PATH = os.getenv('AI_CACHE_DB_PATH', '')
+# Expired entries are kept this much longer to answer with while the model is unavailable
+CACHE_STALE_SECONDS = float(os.getenv('AI_CACHE_STALE_SECONDS', '86400'))
+
+
+def cache_key(prompt_type: str, prompt_text: str, model: str, config: Dict[str, Any]) -> str:
+    """Content address of a model call: same inputs, same key."""
+    payload = json.dumps(
+        {'type': prompt_type, 'prompt': prompt_text, 'model': model, 'config': config},
+        sort_keys=True, default=str,
+    )
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class ResponseCache:
+    """Two-tier cache of parsed model responses.
+
+    The memory tier is an LRU bounded by entry count; the optional SQLite
+    tier is shared by every worker process on the host and survives
+    restarts. Both tiers honour the same TTL; expired entries linger for
+    ``stale_seconds`` so ``get_stale`` can still answer when the model
+    cannot. Values are stored as JSON text so callers always get a
+    private copy.
+    """
+
+    def __init__(self, max_entries: int = CACHE_MAX_ENTRIES, ttl_seconds: float = CACHE_TTL_SECONDS,
+                 db_path: str = CACHE_DB_PATH, stale_seconds: float = CACHE_STALE_SECONDS):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.db_path = db_path
+        self.stale_seconds = stale_seconds
+        self._entries: 'OrderedDict[str, tuple]' = OrderedDict()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.stats = {'hits': 0, 'disk_hits': 0, 'misses': 0, 'stores': 0, 'evictions': 0, 'stale_hits': 0}
+        if self.db_path:
+            self._connection().execute(
+                'CREATE TABLE IF NOT EXISTS responses ('
+                ' key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)'
+            )
+            self._connection().execute(
+                'CREATE INDEX IF NOT EXISTS responses_expires_at ON responses (expires_at)'
+            )
+
+    def _connection(self) -> sqlite3.Connection:
+        # One connection per thread, opened lazily so forked workers never share one
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=5, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def _count(self, name: str):
+        with self._lock:
+            self.stats[name] += 1
+
+    def _remember(self, key: str, value: str, expires_at: float):
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.stats['evictions'] += 1
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Return the cached value for ``key`` or None on a miss."""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[1] > now:
+                    self._entries.move_to_end(key)
+                    self.stats['hits'] += 1
+                    return json.loads(entry[0])
+                if entry[1] + self.stale_seconds <= now:
+                    del self._entries[key]
+
+        if self.db_path:
+            try:
+                row = self._connection().execute(
+                    'SELECT value, expires_at FROM responses WHERE key = ?', (key,)
+                ).fetchone()
+            except sqlite3.Error as e:
+                logger.error("Error reading response cache: %s", e)
+                row = None
+            if row is not None and row[1] > now:
+                self._remember(key, row[0], row[1])
+                self._count('disk_hits')
+                return json.loads(row[0])
+
+        self._count('misses')
+        return None
+
+    def set(self, key: str, value: Dict[str, Any]):
+        """Store ``value`` under ``key`` in every tier."""
+        serialized = json.dumps(value)
+        expires_at = time.time() + self.ttl_seconds
+        self._remember(key, serialized, expires_at)
+        self._count('stores')
+        if self.db_path:
+            try:
+                conn = self._connection()
+                conn.execute(
+                    'INSERT OR REPLACE INTO responses (key, value, expires_at) VALUES (?, ?, ?)',
+                    (key, serialized, expires_at),
+                )
+                conn.execute('DELETE FROM responses WHERE expires_at <= ?', (time.time() - self.stale_seconds,))
+            except sqlite3.Error as e:
+                logger.error("Error writing response cache: %s", e)
+
+    def get_stale(self, key: str) -> Optional[Dict[str, Any]]:
+        """Return the value for ``key`` even if expired (within ``stale_seconds``), or None."""
+        cutoff = time.time() - self.stale_seconds
+        with self._lock:
+            entry = self._entries.get(key)
+        value = entry[0] if entry is not None and entry[1] > cutoff else None
+        if value is None and self.db_path:
+            try:
+                row = self._connection().execute(
+                    'SELECT value FROM responses WHERE key = ? AND expires_at > ?', (key, cutoff)
+                ).fetchone()
+            except sqlite3.Error as e:
+                logger.error("Error reading response cache: %s", e)
+                row = None
+            value = row[0] if row is not None else None
+        if value is None:
+            return None
+        self._count('stale_hits')
+        return json.loads(value)
+
+    def clear(self):
+        """Drop every entry from both tiers."""
+        with self._lock:
+            self._entries.clear()
+        if self.db_path:
+            self._connection().execute('DELETE FROM responses')
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Hit/miss counters plus the current memory tier size."""
+        with self._lock:
+            stats = dict(self.stats)
+            stats['entries'] = len(self._entries)
+        lookups = stats['hits'] + stats['disk_hits'] + stats['misses']
+        stats['hit_rate'] = (stats['hits'] + stats['disk_hits']) / lookups if lookups else 0.0
+        stats['disk_tier'] = bool(self.db_path)
+        return stats
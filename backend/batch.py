@@ -0,0 +1,48 @@
+import os
+import sys
+import json
+import logging
+import argparse
+from dotenv import load_dotenv
+
+from app.services.batch_runner import (
+    BatchRunner, read_charts, completed_ids,
+    BATCH_CONCURRENCY, BATCH_RATE_PER_MINUTE, BATCH_MAX_RETRIES,
+)
+
+PROGRESS_EVERY = 25
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Code a batch of charts with AI suggestions.')
+    parser.add_argument('input', help='JSONL file (or JSON array) of {"id", "chartText"} charts')
+    parser.add_argument('output', help='JSONL file results are appended to')
+    parser.add_argument('--concurrency', type=int, default=BATCH_CONCURRENCY)
+    parser.add_argument('--rate', type=float, default=BATCH_RATE_PER_MINUTE, help='Max model calls per minute')
+    parser.add_argument('--max-retries', type=int, default=BATCH_MAX_RETRIES)
+    parser.add_argument('--no-resume', action='store_true', help='Ignore charts already in the output file')
+    args = parser.parse_args()
+
+    load_dotenv()
+    logging.basicConfig(level=os.getenv('LOG_LEVEL', 'WARNING').upper())
+    from app.services.ai_service import AIService
+
+    skip_ids = set() if args.no_resume else completed_ids(args.output)
+    if skip_ids:
+        print(f"Resuming: {len(skip_ids)} charts already coded", file=sys.stderr)
+
+    runner = BatchRunner(AIService(), args.concurrency, args.rate, args.max_retries)
+    mode = 'w' if args.no_resume else 'a'
+    with open(args.output, mode, encoding='utf-8') as out:
+        for count, record in enumerate(runner.run(read_charts(args.input), skip_ids), 1):
+            out.write(json.dumps(record) + '\n')
+            out.flush()
+            if count % PROGRESS_EVERY == 0:
+                stats = runner.get_stats()
+                print(f"{count} charts, {stats['charts_per_minute']} charts/min", file=sys.stderr)
+
+    print(json.dumps(runner.get_stats()), file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+"""Seeded generator of synthetic (de-identified, made-up) clinical charts."""
+import random
+from typing import List
+
+PROBLEMS = [
+    ('hypertension', 'lisinopril 10 mg daily'),
+    ('type 2 diabetes mellitus without complications', 'metformin 500 mg twice daily'),
+    ('hyperlipidemia', 'atorvastatin 40 mg nightly'),
+    ('acute bronchitis', 'benzonatate 100 mg three times daily as needed'),
+    ('low back pain', 'ibuprofen 600 mg every 8 hours as needed'),
+    ('major depressive disorder, single episode', 'sertraline 50 mg daily'),
+    ('gastroesophageal reflux disease', 'omeprazole 20 mg daily'),
+    ('asthma, mild intermittent', 'albuterol inhaler 2 puffs every 4 hours as needed'),
+    ('hypothyroidism', 'levothyroxine 75 mcg daily'),
+    ('urinary tract infection', 'nitrofurantoin 100 mg twice daily for 5 days'),
+]
+
+SYMPTOMS = ['cough', 'fatigue', 'headache', 'dysuria', 'shortness of breath', 'chest tightness',
+            'intermittent dizziness', 'lower back pain radiating to the left leg', 'heartburn after meals']
+
+PROCEDURES = ['EKG performed in office, normal sinus rhythm.', 'Urinalysis dipstick performed.',
+              'Spirometry performed, mild obstruction.', 'Influenza vaccine administered, left deltoid.',
+              'Venipuncture for CMP and lipid panel.']
+
+
+def make_chart(rng: random.Random, problems: int = 2, filler_paragraphs: int = 0) -> str:
+    """One outpatient note; ``filler_paragraphs`` pads the interval history to lengthen it."""
+    chosen = rng.sample(PROBLEMS, min(problems, len(PROBLEMS)))
+    age = rng.randint(24, 88)
+    sex = rng.choice(['male', 'female'])
+    symptoms = rng.sample(SYMPTOMS, 2)
+    lines = [
+        f"Chief Complaint: follow-up of {chosen[0][0]}, {symptoms[0]}",
+        "",
+        f"HPI: {age} year old {sex} presents for follow-up. Reports {symptoms[0]} for "
+        f"{rng.randint(2, 14)} days and {symptoms[1]}. Adherent to medications.",
+    ]
+    for _ in range(filler_paragraphs):
+        problem = rng.choice(chosen)[0]
+        lines.append(
+            f"Interval history: patient was seen for {problem} on {rng.randint(1, 12)}/{rng.randint(1, 28)}; "
+            f"symptoms {rng.choice(['improved', 'unchanged', 'slightly worse'])} since then. "
+            f"Home readings reviewed with patient. No new complaints related to {problem}."
+        )
+    lines += [
+        "",
+        "Past Medical History: " + ', '.join(p for p, _ in chosen),
+        "",
+        "Medications:",
+        *(f"- {med}" for _, med in chosen),
+        "",
+        "Allergies: NKDA",
+        "",
+        f"Vitals: BP {rng.randint(110, 165)}/{rng.randint(68, 98)}, HR {rng.randint(58, 104)}, "
+        f"T {rng.choice(['98.2', '98.6', '99.1', '100.4'])} F",
+        "",
+        "Procedures: " + rng.choice(PROCEDURES),
+        "",
+        "Assessment and Plan:",
+    ]
+    for i, (problem, med) in enumerate(chosen, 1):
+        lines.append(f"{i}. {problem.capitalize()} - continue {med}. Recheck in {rng.choice([4, 6, 12])} weeks.")
+    return '\n'.join(lines) + '\n'
+
+
+def make_corpus(count: int, seed: int = 0, long_fraction: float = 0.1) -> List[str]:
+    """``count`` charts of mixed length; about ``long_fraction`` are long enough to be chunked."""
+    rng = random.Random(seed)
+    charts = []
+    for _ in range(count):
+        if rng.random() < long_fraction:
+            charts.append(make_chart(rng, problems=rng.randint(3, 5), filler_paragraphs=rng.randint(60, 120)))
+        else:
+            charts.append(make_chart(rng, problems=rng.randint(1, 3), filler_paragraphs=rng.randint(0, 4)))
+    return charts
@@ -0,0 +1,281 @@
+"""Local stand-in for the Gemini REST API.
+
+Serves ``:generateContent`` and ``:streamGenerateContent`` with canned but
+schema-valid answers for each of the service's prompts, so the real
+``genai.Client`` (pointed here through GEMINI_BASE_URL) and the whole
+HTTP stack are exercised without network access or quota.
+
+It also implements the ``cachedContents`` API (create, get, update,
+delete) with real expiry, so context caching and its fallback can be
+exercised: a request naming an expired or unknown cache gets a 404.
+
+Latency (including a share of stalled requests), prompt and output
+token rates, truncation and error injection are set per server and can
+be changed while it runs, so retries, hedging and the circuit breaker
+can be driven through their states.
+
+    python -m bench.fake_gemini --port 8089 --latency 0.5 --token-rate 200
+"""
+import sys
+import json
+import time
+import uuid
+import random
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class FakeModelSettings:
+    def __init__(self, latency=0.2, token_rate=400.0, truncate_rate=0.0, error_rate=0.0,
+                 error_status=503, seed=None, prefill_rate=0.0, slow_rate=0.0, slow_latency=5.0):
+        self.latency = latency              # seconds before the first token
+        self.slow_rate = slow_rate          # share of requests that stall (tail latency)
+        self.slow_latency = slow_latency    # extra seconds a stalled request waits
+        self.prefill_rate = prefill_rate    # uncached prompt tokens read per second, 0 for instant
+        self.token_rate = token_rate        # output tokens per second, 0 for instant
+        self.truncate_rate = truncate_rate  # fraction of responses cut off mid-JSON
+        self.error_status = error_status    # HTTP status of injected errors (429, 500, 503...)
+        self.error_rate = error_rate        # fraction of requests that fail
+        self.random = random.Random(seed)
+
+
+ERROR_STATUSES = {429: 'RESOURCE_EXHAUSTED', 500: 'INTERNAL', 503: 'UNAVAILABLE', 504: 'DEADLINE_EXCEEDED'}
+
+
+def _contents_text(body):
+    parts = []
+    instruction = body.get('systemInstruction') or {}
+    for content in [instruction] + body.get('contents', []):
+        for part in content.get('parts', []):
+            parts.append(part.get('text', ''))
+    return ''.join(parts)
+
+
+def _ttl_seconds(ttl: str) -> float:
+    return float(ttl.rstrip('s')) if ttl else 3600.0
+
+
+def _rfc3339(timestamp: float) -> str:
+    return time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(timestamp))
+
+
+def canned_response(prompt: str, rng: random.Random) -> dict:
+    """A plausible answer for whichever of the service's prompts this is."""
+    if '"suggestedIcd"' in prompt:
+        return {
+            'suggestedIcd': [
+                {'code': 'I10', 'rationale': 'Hypertension documented in assessment.'},
+                {'code': 'E11.9', 'rationale': 'Type 2 diabetes noted in plan.'},
+            ][:rng.randint(1, 2)],
+            'suggestedCpt': [
+                {'code': rng.choice(['99213', '99214']), 'modifiers': [], 'units': '1',
+                 'rationale': 'Established patient visit with moderate MDM.'},
+            ],
+        }
+    if '"alerts"' in prompt:
+        return {'alerts': ['Consider querying provider for higher specificity for diabetes.']}
+    if '"text_mention"' in prompt:
+        item = lambda mention, code, snippet: {
+            'text_mention': mention, 'related_codes': [code], 'rationale': 'Assessment', 'source_snippet': snippet,
+        }
+        return {
+            'diagnoses': [item('Hypertension', 'I10', 'Assessment: hypertension')],
+            'symptoms': [item('Cough', 'R05.9', 'HPI: cough for 3 days')],
+            'medications': [item('Lisinopril 10mg', 'RxNorm:314076', 'takes lisinopril 10mg daily')],
+            'procedures': [item('EKG', 'CPT:93000', 'EKG performed in office')],
+        }
+    return {
+        'overallRationale': 'Codes are supported by the documented assessment and plan.',
+        'codeRationales': {'cpt': {}, 'icd': {}},
+    }
+
+
+def _usage(prompt: str, text: str, cached: str = '') -> dict:
+    prompt_tokens, output_tokens = (len(cached) + len(prompt)) // 4, len(text) // 4
+    usage = {'promptTokenCount': prompt_tokens, 'candidatesTokenCount': output_tokens,
+             'totalTokenCount': prompt_tokens + output_tokens}
+    if cached:
+        usage['cachedContentTokenCount'] = len(cached) // 4
+    return usage
+
+
+def _payload(text: str, finish_reason: str, usage: dict) -> bytes:
+    return json.dumps({
+        'candidates': [{'content': {'parts': [{'text': text}], 'role': 'model'}, 'finishReason': finish_reason}],
+        'usageMetadata': usage,
+    }).encode('utf-8')
+
+
+class FakeGeminiHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    server: 'FakeGeminiServer'
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status: int, body: bytes, content_type='application/json'):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _body(self) -> dict:
+        return json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+
+    def _error(self, status: int, message: str):
+        error = {'error': {'code': status, 'message': message, 'status': ERROR_STATUSES.get(status, 'UNKNOWN')}}
+        self._send(status, json.dumps(error).encode('utf-8'))
+
+    def _cache_name(self):
+        return self.path.split('?')[0].split('/v1beta/', 1)[-1]
+
+    def do_GET(self):
+        cache = self.server.get_cache(self._cache_name())
+        if cache is None:
+            self._error(404, 'CachedContent not found')
+        else:
+            self._send(200, json.dumps(cache['resource']).encode('utf-8'))
+
+    def do_PATCH(self):
+        body = self._body()
+        cache = self.server.get_cache(self._cache_name())
+        if cache is None:
+            self._error(404, 'CachedContent not found')
+            return
+        cache['expires_at'] = time.time() + _ttl_seconds(body.get('ttl'))
+        cache['resource']['expireTime'] = _rfc3339(cache['expires_at'])
+        self._send(200, json.dumps(cache['resource']).encode('utf-8'))
+
+    def do_DELETE(self):
+        self.server.caches.pop(self._cache_name(), None)
+        self._send(200, b'{}')
+
+    def do_POST(self):
+        settings = self.server.settings
+        body = self._body()
+        if self.path.split('?')[0].endswith('/cachedContents'):
+            self._send(200, json.dumps(self.server.create_cache(body)).encode('utf-8'))
+            return
+        self.server.count_request()
+        prompt = _contents_text(body)
+        cached = ''
+        if body.get('cachedContent'):
+            cache = self.server.get_cache(body['cachedContent'])
+            if cache is None:
+                self._error(404, 'CachedContent not found (or permission denied)')
+                return
+            cached = cache['text']
+
+        time.sleep(settings.latency)
+        if settings.random.random() < settings.slow_rate:
+            time.sleep(settings.slow_latency)
+        if settings.prefill_rate:
+            # Cached tokens are already processed; only the rest costs time to first token
+            time.sleep(len(prompt) / 4 / settings.prefill_rate)
+        if settings.random.random() < settings.error_rate:
+            self._error(settings.error_status, 'Injected fault')
+            return
+
+        text = json.dumps(canned_response(cached + prompt, settings.random), indent=2)
+        finish_reason = 'STOP'
+        if settings.random.random() < settings.truncate_rate:
+            text = text[:settings.random.randint(1, len(text) - 1)]
+            finish_reason = 'MAX_TOKENS'
+        usage = _usage(prompt, text, cached)
+
+        if ':streamGenerateContent' in self.path:
+            self._stream(text, finish_reason, usage)
+            return
+        if settings.token_rate:
+            time.sleep(usage['candidatesTokenCount'] / settings.token_rate)
+        self._send(200, _payload(text, finish_reason, usage))
+
+    def _stream(self, text: str, finish_reason: str, usage: dict):
+        settings = self.server.settings
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        chunk_chars = 64
+        for start in range(0, len(text), chunk_chars):
+            piece = text[start:start + chunk_chars]
+            if settings.token_rate:
+                time.sleep(len(piece) / 4 / settings.token_rate)
+            last = start + chunk_chars >= len(text)
+            event = b'data: ' + _payload(piece, finish_reason if last else None, usage) + b'\r\n\r\n'
+            self.wfile.write(f'{len(event):x}\r\n'.encode() + event + b'\r\n')
+            self.wfile.flush()
+        self.wfile.write(b'0\r\n\r\n')
+
+
+class FakeGeminiServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, host='127.0.0.1', port=0, settings: FakeModelSettings = None):
+        super().__init__((host, port), FakeGeminiHandler)
+        self.settings = settings or FakeModelSettings()
+        self.requests = 0
+        self.caches = {}
+        self._lock = threading.Lock()
+
+    def handle_error(self, request, client_address):
+        # Clients that gave up (deadlines, hedged duplicates) close the connection mid-response
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+    def count_request(self):
+        with self._lock:
+            self.requests += 1
+
+    def create_cache(self, body: dict) -> dict:
+        name = f'cachedContents/{uuid.uuid4().hex[:12]}'
+        expires_at = time.time() + _ttl_seconds(body.get('ttl'))
+        text = _contents_text(body)
+        resource = {
+            'name': name, 'model': body.get('model'), 'displayName': body.get('displayName', ''),
+            'expireTime': _rfc3339(expires_at), 'usageMetadata': {'totalTokenCount': len(text) // 4},
+        }
+        with self._lock:
+            self.caches[name] = {'text': text, 'expires_at': expires_at, 'resource': resource}
+        return resource
+
+    def get_cache(self, name: str):
+        cache = self.caches.get(name)
+        if cache is None or cache['expires_at'] <= time.time():
+            return None
+        return cache
+
+    @property
+    def base_url(self) -> str:
+        return f'http://{self.server_address[0]}:{self.server_address[1]}'
+
+    def start(self) -> 'FakeGeminiServer':
+        """Serve from a daemon thread and return self."""
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run a local fake Gemini API server.')
+    parser.add_argument('--port', type=int, default=8089)
+    parser.add_argument('--latency', type=float, default=0.2)
+    parser.add_argument('--token-rate', type=float, default=400.0)
+    parser.add_argument('--truncate-rate', type=float, default=0.0)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--error-status', type=int, default=503)
+    parser.add_argument('--prefill-rate', type=float, default=0.0)
+    parser.add_argument('--slow-rate', type=float, default=0.0)
+    parser.add_argument('--slow-latency', type=float, default=5.0)
+    args = parser.parse_args()
+    settings = FakeModelSettings(args.latency, args.token_rate, args.truncate_rate, args.error_rate, args.error_status,
+                                 prefill_rate=args.prefill_rate, slow_rate=args.slow_rate,
+                                 slow_latency=args.slow_latency)
+    server = FakeGeminiServer(port=args.port, settings=settings)
+    print(f"Fake Gemini listening on {server.base_url} (set GEMINI_BASE_URL to use it)")
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
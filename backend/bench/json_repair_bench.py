@@ -0,0 +1,92 @@
+"""Fuzz and benchmark the model-response JSON extractor.
+
+Builds realistic ConfidentCode / SectionalAnalysis responses, then
+truncates them at every position and applies common model corruptions
+(code fences, prose, trailing commas). Checks that extraction never
+raises, that whatever is recovered validates against the schema and
+is a prefix of the original items, and reports timings by response size.
+
+    python -m bench.json_repair_bench [--items 200] [--fuzz 2000]
+"""
+import sys
+import json
+import time
+import random
+import argparse
+
+from app.services.ai_service import ConfidentCode, SectionalAnalysis
+from app.services.json_repair import parse_model_json
+
+
+def confident_codes(n):
+    return {
+        'suggestedIcd': [{'code': f'E11.{i}', 'rationale': f'Noted in plan, item "{i}" {{braces}} [x]'} for i in range(n)],
+        'suggestedCpt': [{'code': f'9921{i % 6}', 'modifiers': ['25'], 'units': '1', 'rationale': f'Visit {i}'} for i in range(n)],
+    }
+
+
+def sectional_analysis(n):
+    item = lambda i: {'text_mention': f'mention {i}', 'related_codes': ['I10'], 'rationale': 'HPI',
+                      'source_snippet': f'...line {i}, with \\\\ escapes \\" ...'}
+    return {section: [item(i) for i in range(n)] for section in ('diagnoses', 'symptoms', 'medications', 'procedures')}
+
+
+def corruptions(text):
+    yield text
+    yield f"```json\n{text}\n```"
+    yield f"Here is the JSON you asked for:\n{text}\nLet me know if you need more."
+    yield text.replace('}]', '},]', 1)
+
+
+def check(text, schema, original):
+    result, complete = parse_model_json(text, schema)
+    if result is None:
+        return None
+    for key, items in result.items():
+        if items != original[key][:len(items)]:
+            raise AssertionError(f"{key} is not a prefix of the original items")
+    return complete
+
+
+def fuzz(rounds, rng):
+    recovered = 0
+    for schema, build in ((ConfidentCode, confident_codes), (SectionalAnalysis, sectional_analysis)):
+        original = schema.model_validate(build(5)).model_dump()
+        full = json.dumps(original)
+        for text in corruptions(full):
+            assert check(text, schema, original) is not None, 'a complete response must parse'
+        for _ in range(rounds):
+            cut = rng.randrange(len(full))
+            if check(full[:cut], schema, original) is not None:
+                recovered += 1
+    return recovered
+
+
+def benchmark(items):
+    for schema, build in ((ConfidentCode, confident_codes), (SectionalAnalysis, sectional_analysis)):
+        for n in (items // 10, items, items * 5):
+            full = json.dumps(build(n), indent=2)
+            for label, text in (('complete', full), ('truncated', full[:int(len(full) * 0.9)])):
+                runs = 20
+                start = time.perf_counter()
+                for _ in range(runs):
+                    parse_model_json(text, schema)
+                elapsed = (time.perf_counter() - start) / runs
+                print(f"{schema.__name__:18} {label:9} {len(text):>9,} chars  {elapsed * 1000:8.2f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--items', type=int, default=200)
+    parser.add_argument('--fuzz', type=int, default=2000)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    recovered = fuzz(args.fuzz, random.Random(args.seed))
+    print(f"fuzz: {args.fuzz * 2} truncations checked, {recovered} recovered a usable prefix")
+    benchmark(args.items)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,264 @@
+"""Load test of the API against the local fake Gemini server.
+
+Starts ``bench.fake_gemini`` and the Flask app (werkzeug dev server in this
+process, or gunicorn in a subprocess), then drives each route with a
+closed loop of ``concurrency`` clients for every concurrency level and
+reports latency percentiles and throughput. Run from ``backend/``:
+
+    python -m bench.loadtest --concurrency 1,4,16 --requests 200
+    python -m bench.loadtest --server gunicorn --workers 4 --output run.json
+    python -m bench.loadtest --baseline run.json   # exit 1 on regression
+
+The model response cache and the audit store's reuse of stored answers are
+disabled unless ``--cache`` is given, so every request reaches the fake model.
+Admission control is off unless ``--admission`` is given; with it, each
+simulated client sends its own Authorization header and 429s count as errors.
+"""
+import os
+import sys
+import json
+import time
+import random
+import socket
+import argparse
+import threading
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Any, Tuple
+
+import requests
+
+from bench.charts import make_corpus
+from bench.fake_gemini import FakeGeminiServer, FakeModelSettings
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SEARCH_TERMS = ['hypertension', 'diabetes', 'diabtes', 'cough', 'E11', 'office visit', '992', 'knee pain',
+                'injection', 'back pain']
+RATIONALE_CODES = {
+    'cptCodes': [{'id': 'cpt-ai-1', 'code': '99214', 'description': 'Office visit, established patient, moderate',
+                  'modifiers': [], 'units': 1, 'rationale': 'Moderate MDM'}],
+    'icdCodes': [{'id': 'icd-ai-1', 'code': 'I10', 'description': 'Essential (primary) hypertension',
+                  'rationale': 'Documented in assessment'}],
+}
+
+ALL_ROUTES = ['suggestions', 'analysis', 'rationale', 'icd_search', 'cpt_search']
+
+
+def _request_factories(charts: List[str]) -> Dict[str, Callable[[random.Random], Tuple[str, str, dict]]]:
+    """Route name -> function returning (method, path, kwargs) for one request."""
+    return {
+        'suggestions': lambda rng: ('POST', '/api/suggestions', {'json': {'chartText': rng.choice(charts)}}),
+        'analysis': lambda rng: ('POST', '/api/analysis', {'json': {'chartText': rng.choice(charts)}}),
+        'rationale': lambda rng: ('POST', '/api/rationale', {'json': RATIONALE_CODES}),
+        'icd_search': lambda rng: ('GET', '/api/icd/search', {'params': {'query': rng.choice(SEARCH_TERMS)}}),
+        'cpt_search': lambda rng: ('GET', '/api/cpt/search', {'params': {'query': rng.choice(SEARCH_TERMS)}}),
+    }
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def _wait_until_up(base_url: str, timeout: float = 30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            requests.get(base_url + '/metrics', timeout=5)
+            return
+        except (requests.ConnectionError, requests.Timeout):
+            time.sleep(0.1)
+    raise RuntimeError(f'App did not start at {base_url}')
+
+
+def start_dev_server(port: int):
+    """Serve the app from a threaded werkzeug server in this process; returns a stop function."""
+    from werkzeug.serving import make_server
+    from app import create_app
+
+    server = make_server('127.0.0.1', port, create_app(), threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server.shutdown
+
+
+def start_gunicorn(port: int, workers: int, threads: int, env: Dict[str, str]):
+    """Serve ``run:app`` from gunicorn (gthread workers); returns a stop function."""
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '--workers', str(workers), '--threads', str(threads),
+         '--worker-class', 'gthread', '--timeout', '120', '--bind', f'127.0.0.1:{port}', 'run:app'],
+        cwd=BACKEND_DIR, env=env,
+    )
+
+    def stop():
+        process.terminate()
+        process.wait(timeout=30)
+    return stop
+
+
+def percentile(sorted_values: List[float], fraction: float) -> float:
+    """Nearest-rank percentile of an ascending list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, int(round(fraction * len(sorted_values) + 0.5)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def run_level(base_url: str, make_request, concurrency: int, total: int, seed: int) -> Dict[str, Any]:
+    """Send ``total`` requests from ``concurrency`` closed-loop clients."""
+    latencies: List[float] = []
+    errors = 0
+    remaining = [total]
+    lock = threading.Lock()
+
+    def client(worker: int):
+        nonlocal errors
+        rng = random.Random(seed * 1000 + worker)
+        session = requests.Session()
+        session.headers['Authorization'] = f'Bearer loadtest-{seed}-{worker}'
+        while True:
+            with lock:
+                if remaining[0] <= 0:
+                    return
+                remaining[0] -= 1
+            method, path, kwargs = make_request(rng)
+            start = time.perf_counter()
+            try:
+                ok = session.request(method, base_url + path, timeout=120, **kwargs).ok
+            except requests.RequestException:
+                ok = False
+            elapsed = time.perf_counter() - start
+            with lock:
+                latencies.append(elapsed)
+                errors += not ok
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(client, range(concurrency)))
+    wall = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        'concurrency': concurrency,
+        'requests': len(latencies),
+        'errors': errors,
+        'rps': round(len(latencies) / wall, 2) if wall else 0.0,
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 1),
+        'p95_ms': round(percentile(latencies, 0.95) * 1000, 1),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 1),
+    }
+
+
+def compare(results: Dict[str, List[Dict]], baseline: Dict[str, List[Dict]], tolerance: float) -> List[str]:
+    """Regressions of p95 latency or throughput beyond ``tolerance`` relative to ``baseline``."""
+    problems = []
+    for route, rows in results.items():
+        previous = {row['concurrency']: row for row in baseline.get(route, [])}
+        for row in rows:
+            before = previous.get(row['concurrency'])
+            if before is None:
+                continue
+            label = f"{route} @ {row['concurrency']}"
+            if before['p95_ms'] and row['p95_ms'] > before['p95_ms'] * (1 + tolerance):
+                problems.append(f"{label}: p95 {before['p95_ms']}ms -> {row['p95_ms']}ms")
+            if before['rps'] and row['rps'] < before['rps'] * (1 - tolerance):
+                problems.append(f"{label}: rps {before['rps']} -> {row['rps']}")
+            if row['errors'] > before['errors']:
+                problems.append(f"{label}: errors {before['errors']} -> {row['errors']}")
+    return problems
+
+
+def print_table(results: Dict[str, List[Dict]]):
+    print(f"{'route':<12} {'conc':>5} {'reqs':>6} {'errs':>5} {'rps':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for route, rows in results.items():
+        for row in rows:
+            print(f"{route:<12} {row['concurrency']:>5} {row['requests']:>6} {row['errors']:>5} {row['rps']:>9} "
+                  f"{row['p50_ms']:>9} {row['p95_ms']:>9} {row['p99_ms']:>9}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load-test the API against a local fake Gemini server.')
+    parser.add_argument('--server', choices=['dev', 'gunicorn'], default='dev')
+    parser.add_argument('--workers', type=int, default=2, help='gunicorn worker processes')
+    parser.add_argument('--threads', type=int, default=16, help='gunicorn threads per worker')
+    parser.add_argument('--routes', default=','.join(ALL_ROUTES), help='comma-separated: ' + ', '.join(ALL_ROUTES))
+    parser.add_argument('--concurrency', default='1,4,16', help='comma-separated concurrency levels')
+    parser.add_argument('--requests', type=int, default=100, help='requests per route and level')
+    parser.add_argument('--charts', type=int, default=200, help='size of the synthetic chart corpus')
+    parser.add_argument('--long-fraction', type=float, default=0.1, help='share of charts long enough to chunk')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--latency', type=float, default=0.2, help='fake model time to first token (s)')
+    parser.add_argument('--token-rate', type=float, default=400.0, help='fake model output tokens/s, 0 = instant')
+    parser.add_argument('--truncate-rate', type=float, default=0.0)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--error-status', type=int, default=503)
+    parser.add_argument('--slow-rate', type=float, default=0.0, help='share of fake model calls that stall')
+    parser.add_argument('--slow-latency', type=float, default=5.0, help='seconds a stalled call waits')
+    parser.add_argument('--cache', action='store_true', help='keep the model response cache enabled')
+    parser.add_argument('--admission', action='store_true', help='keep per-client admission control enabled')
+    parser.add_argument('--output', help='write results as JSON to this file')
+    parser.add_argument('--baseline', help='JSON results of an earlier run to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='allowed relative regression')
+    args = parser.parse_args()
+
+    routes = [r.strip() for r in args.routes.split(',') if r.strip()]
+    unknown = set(routes) - set(ALL_ROUTES)
+    if unknown:
+        parser.error(f"unknown routes: {', '.join(sorted(unknown))}")
+    levels = [int(c) for c in args.concurrency.split(',')]
+
+    fake = FakeGeminiServer(settings=FakeModelSettings(
+        args.latency, args.token_rate, args.truncate_rate, args.error_rate, args.error_status, seed=args.seed,
+        slow_rate=args.slow_rate, slow_latency=args.slow_latency,
+    )).start()
+
+    # Must be set before the app's service modules read their settings on import
+    os.environ['GEMINI_BASE_URL'] = fake.base_url
+    os.environ.setdefault('GEMINI_API_KEY', 'fake')
+    os.environ.setdefault('LOG_LEVEL', 'WARNING')
+    if not args.cache:
+        os.environ['AI_CACHE_MAX_ENTRIES'] = '0'
+        os.environ['AI_CACHE_DB_PATH'] = ''
+        os.environ['AUDIT_DEDUPE_SECONDS'] = '0'
+    if not args.admission:
+        os.environ['ADMISSION_ENABLED'] = 'false'
+
+    port = _free_port()
+    base_url = f'http://127.0.0.1:{port}'
+    if args.server == 'gunicorn':
+        stop = start_gunicorn(port, args.workers, args.threads, dict(os.environ))
+    else:
+        stop = start_dev_server(port)
+
+    results: Dict[str, List[Dict]] = {}
+    try:
+        _wait_until_up(base_url)
+        factories = _request_factories(make_corpus(args.charts, args.seed, args.long_fraction))
+        for route in routes:
+            results[route] = [
+                run_level(base_url, factories[route], level, args.requests, args.seed) for level in levels
+            ]
+    finally:
+        stop()
+        fake.shutdown()
+
+    print_table(results)
+    print(f"fake model calls: {fake.requests}")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({'settings': vars(args), 'results': results}, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)['results']
+        problems = compare(results, baseline, args.tolerance)
+        for problem in problems:
+            print('REGRESSION ' + problem)
+        if problems:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,183 @@
+"""Startup benchmark: app import time, first-request latency and gunicorn worker boot time and memory.
+
+Each measurement runs in fresh processes against ``bench.fake_gemini``:
+
+* ``import`` imports ``run:app`` in a new interpreter and times the
+  first search and the first suggestions request (which builds the model
+  client);
+* ``gunicorn`` starts gunicorn with and without preloading, reads each
+  worker's boot time from the log and, once every worker has served
+  model requests, its RSS, PSS (shared pages split between the processes
+  sharing them) and private memory from /proc (Linux only).
+
+Run from ``backend/``:
+
+    python -m bench.startup_bench --runs 5 --workers 4
+"""
+import os
+import re
+import sys
+import json
+import time
+import socket
+import argparse
+import tempfile
+import statistics
+import subprocess
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Any
+
+import requests
+
+from bench.charts import make_corpus
+from bench.fake_gemini import FakeGeminiServer, FakeModelSettings
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PROBE = '''
+import json, time
+started = time.perf_counter()
+from run import app
+imported = time.perf_counter()
+client = app.test_client()
+client.get('/api/icd/search?query=hypertension')
+searched = time.perf_counter()
+client.post('/api/suggestions', json={'chartText': %r, 'speculative': False})
+suggested = time.perf_counter()
+print(json.dumps({'import_ms': (imported - started) * 1000, 'first_search_ms': (searched - imported) * 1000,
+                  'first_suggestions_ms': (suggested - searched) * 1000}))
+'''
+
+BOOTED_RE = re.compile(r'Worker (\d+) booted in ([\d.]+)s')
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def _env(fake_url: str, tmpdir: str) -> Dict[str, str]:
+    env = dict(os.environ)
+    env.update({
+        'GEMINI_BASE_URL': fake_url,
+        'GEMINI_API_KEY': env.get('GEMINI_API_KEY', 'fake'),
+        'LOG_LEVEL': 'WARNING',
+        'AI_CACHE_MAX_ENTRIES': '0',
+        'AI_CACHE_DB_PATH': '',
+        'JOB_DB_PATH': os.path.join(tmpdir, 'jobs.db'),
+        'ENCOUNTER_DB_PATH': os.path.join(tmpdir, 'encounters.db'),
+        'AUDIT_DB_URL': 'sqlite:///' + os.path.join(tmpdir, 'audit.db'),
+        'AUDIT_DEDUPE_SECONDS': '0',
+        # The warm-up requests all come from one client
+        'ADMISSION_ENABLED': 'false',
+    })
+    return env
+
+
+def bench_import(env: Dict[str, str], chart_text: str, runs: int) -> Dict[str, float]:
+    """Median import and first-request timings over ``runs`` fresh interpreters."""
+    samples: Dict[str, List[float]] = {}
+    for _ in range(runs):
+        output = subprocess.run([sys.executable, '-c', PROBE % chart_text], cwd=BACKEND_DIR, env=env,
+                                capture_output=True, text=True, check=True).stdout
+        for name, value in json.loads(output.strip().splitlines()[-1]).items():
+            samples.setdefault(name, []).append(value)
+    return {name: round(statistics.median(values), 1) for name, values in samples.items()}
+
+
+def _memory_kb(pid: int) -> Dict[str, int]:
+    fields = {}
+    with open(f'/proc/{pid}/smaps_rollup') as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) >= 2 and parts[0].endswith(':') and parts[1].isdigit():
+                fields[parts[0][:-1]] = int(parts[1])
+    return {'rss_kb': fields.get('Rss', 0), 'pss_kb': fields.get('Pss', 0),
+            'private_kb': fields.get('Private_Clean', 0) + fields.get('Private_Dirty', 0)}
+
+
+def _children(pid: int) -> List[int]:
+    with open(f'/proc/{pid}/task/{pid}/children') as f:
+        return [int(child) for child in f.read().split()]
+
+
+def bench_gunicorn(env: Dict[str, str], charts: List[str], workers: int, preload: bool) -> Dict[str, Any]:
+    """Start gunicorn, wait for every worker to boot and serve model requests, then measure it."""
+    port = _free_port()
+    env = {**env, 'GUNICORN_PRELOAD': 'true' if preload else 'false'}
+    started = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '--workers', str(workers), '--log-level', 'info',
+         '--bind', f'127.0.0.1:{port}', 'run:app'],
+        cwd=BACKEND_DIR, env=env, stderr=subprocess.PIPE, text=True,
+    )
+    boot_seconds: Dict[int, float] = {}
+    all_booted = threading.Event()
+
+    def read_log():
+        for line in process.stderr:
+            match = BOOTED_RE.search(line)
+            if match:
+                boot_seconds[int(match.group(1))] = float(match.group(2))
+                if len(boot_seconds) == workers:
+                    all_booted.set()
+
+    threading.Thread(target=read_log, daemon=True).start()
+    base_url = f'http://127.0.0.1:{port}'
+    try:
+        if not all_booted.wait(120):
+            raise RuntimeError('gunicorn workers did not boot')
+        ready_seconds = time.perf_counter() - started
+        # Enough concurrent model requests that every worker builds its services
+        with ThreadPoolExecutor(max_workers=workers * 8) as pool:
+            list(pool.map(lambda chart: requests.post(f'{base_url}/api/suggestions', timeout=60,
+                                                      json={'chartText': chart, 'speculative': False}),
+                          charts[:workers * 16]))
+            list(pool.map(lambda _: requests.get(f'{base_url}/api/icd/search?query=diabetes', timeout=60),
+                          range(workers * 16)))
+        memory = [_memory_kb(pid) for pid in _children(process.pid)]
+        master = _memory_kb(process.pid)
+    finally:
+        process.terminate()
+        process.wait(timeout=30)
+    return {
+        'preload': preload,
+        'ready_s': round(ready_seconds, 3),
+        'worker_boot_ms': round(statistics.mean(boot_seconds.values()) * 1000, 1),
+        'master_rss_kb': master['rss_kb'],
+        **{f'worker_{name}': round(statistics.mean(m[name] for m in memory)) for name in memory[0]},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure app startup time and gunicorn worker boot time and memory.')
+    parser.add_argument('--runs', type=int, default=5, help='fresh interpreters for the import benchmark')
+    parser.add_argument('--workers', type=int, default=4, help='gunicorn worker processes')
+    parser.add_argument('--skip-gunicorn', action='store_true')
+    parser.add_argument('--output', help='write results as JSON to this file')
+    args = parser.parse_args()
+
+    fake = FakeGeminiServer(settings=FakeModelSettings(latency=0.05, token_rate=0)).start()
+    charts = make_corpus(200, 0, 0.0)
+    results: Dict[str, Any] = {}
+    with tempfile.TemporaryDirectory() as tmpdir:
+        env = _env(fake.base_url, tmpdir)
+        results['import'] = bench_import(env, charts[0], args.runs)
+        print('import:', json.dumps(results['import']))
+        if not args.skip_gunicorn:
+            results['gunicorn'] = []
+            for preload in (False, True):
+                row = bench_gunicorn(env, charts, args.workers, preload)
+                results['gunicorn'].append(row)
+                print('gunicorn:', json.dumps(row))
+    fake.shutdown()
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
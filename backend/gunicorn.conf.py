@@ -0,0 +1,57 @@
+"""Gunicorn settings: ``gunicorn run:app`` picks this file up from backend/.
+
+The master imports the app and builds the code catalog and its search
+indexes once, before forking; workers share those pages copy-on-write
+and create their own model client, thread pools and database
+connections on first use. Workers write their metrics to a shared
+directory so that /metrics on any worker reports the whole server.
+"""
+import os
+import glob
+import time
+import shutil
+import tempfile
+
+bind = os.getenv('GUNICORN_BIND', '127.0.0.1:5000')
+workers = int(os.getenv('GUNICORN_WORKERS', '2'))
+worker_class = 'gthread'
+threads = int(os.getenv('GUNICORN_THREADS', '16'))
+timeout = 120
+# Load run:app in the master so workers fork with it already imported
+preload_app = os.getenv('GUNICORN_PRELOAD', 'true').lower() in ('1', 'true', 'yes')
+# Set before the app is loaded so the master and every worker agree on it
+_default_metrics_dir = os.path.join(tempfile.gettempdir(), f'medical-coding-metrics-{os.getpid()}')
+os.environ.setdefault('METRICS_MULTIPROC_DIR', _default_metrics_dir)
+
+
+def on_starting(server):
+    # Counts of a previous run in the same directory would be added to this one's
+    directory = os.environ['METRICS_MULTIPROC_DIR']
+    os.makedirs(directory, exist_ok=True)
+    for path in glob.glob(os.path.join(directory, '*.json')):
+        os.remove(path)
+
+
+def when_ready(server):
+    if preload_app:
+        from app import preload_shared_state
+        started = time.perf_counter()
+        preload_shared_state()
+        server.log.info("Preloaded shared state in %.3fs", time.perf_counter() - started)
+
+
+def post_fork(server, worker):
+    worker.fork_time = time.perf_counter()
+    # Each worker admits its share of the server-wide model capacity
+    os.environ['ADMISSION_PROCESSES'] = str(server.cfg.workers)
+
+
+def post_worker_init(worker):
+    worker.log.info("Worker %s booted in %.3fs", worker.pid, time.perf_counter() - worker.fork_time)
+    from app.services.metrics import registry
+    registry.start_sharing()
+
+
+def on_exit(server):
+    if os.environ['METRICS_MULTIPROC_DIR'] == _default_metrics_dir:
+        shutil.rmtree(_default_metrics_dir, ignore_errors=True)
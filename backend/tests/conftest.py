@@ -0,0 +1,24 @@
+"""Shared test setup.
+
+Settings are read from the environment when the service modules are
+imported, so test defaults are set here, before any test imports them.
+"""
+import os
+import tempfile
+
+# Databases and caches go to a throwaway directory, never the app's data directory
+os.environ.setdefault('APP_DATA_DIR', tempfile.mkdtemp(prefix='medical-coding-tests-'))
+os.environ.setdefault('LOG_LEVEL', 'WARNING')
+
+import pytest
+
+from bench.fake_gemini import FakeGeminiServer, FakeModelSettings
+
+
+@pytest.fixture
+def fake_gemini():
+    """A local fake Gemini API answering instantly; change ``.settings`` to inject faults."""
+    server = FakeGeminiServer(settings=FakeModelSettings(latency=0, token_rate=0, seed=0)).start()
+    yield server
+    server.shutdown()
+    server.server_close()
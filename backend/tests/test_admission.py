@@ -0,0 +1,128 @@
+import threading
+import time
+
+import pytest
+
+from app import create_app
+from app.api import routes
+from app.services.admission import (
+    BATCH, INTERACTIVE, PROMPT_OVERHEAD_TOKENS, AdmissionController, PrioritySemaphore, Rejected,
+    estimate_prompt_tokens)
+from app.services.batch_runner import TokenBucket
+from app.services.job_queue import JOB_PRIORITIES
+
+
+def test_bucket_takes_refunds_and_refills_up_to_capacity():
+    bucket = TokenBucket(rate_per_minute=600, burst=10)  # 10 tokens a second
+    assert bucket.try_acquire(8) == 0
+    assert bucket.try_acquire(8) == pytest.approx(0.6, abs=0.05)
+    bucket.refund(100)
+    assert bucket.tokens == 10
+    assert bucket.try_acquire(50) == 0  # more than the capacity costs the capacity
+    time.sleep(0.2)
+    assert bucket.try_acquire(1) == 0
+
+
+def test_estimate_counts_overhead_per_prompt():
+    assert estimate_prompt_tokens(0) == PROMPT_OVERHEAD_TOKENS
+    assert estimate_prompt_tokens(4000, prompts=3) == 3 * estimate_prompt_tokens(4000)
+
+
+def test_semaphore_hands_freed_slots_to_interactive_waiters_first():
+    slots = PrioritySemaphore(1)
+    assert slots.acquire(BATCH)
+    order = []
+
+    def wait_for_slot(priority, name):
+        assert slots.acquire(priority, timeout=5)
+        order.append(name)
+        slots.release()
+
+    threads = [threading.Thread(target=wait_for_slot, args=args)
+               for args in ((BATCH, 'batch-1'), (BATCH, 'batch-2'), (INTERACTIVE, 'interactive'))]
+    for thread in threads:
+        thread.start()
+        time.sleep(0.05)  # arrive in this order
+    assert slots.waiting() == {'interactive': 1, 'batch': 2}
+    slots.release()
+    for thread in threads:
+        thread.join()
+    assert order == ['interactive', 'batch-1', 'batch-2']
+    assert slots.in_use == 0
+
+
+def test_waiter_that_gives_up_is_skipped():
+    slots = PrioritySemaphore(1)
+    assert slots.acquire(INTERACTIVE)
+    assert not slots.acquire(INTERACTIVE, timeout=0.05)
+    slots.release()
+    assert slots.in_use == 0
+    assert slots.acquire(BATCH, timeout=0)
+
+
+def test_new_request_does_not_jump_ahead_of_waiters():
+    slots = PrioritySemaphore(1)
+    assert slots.acquire(BATCH)
+    waiter = threading.Thread(target=slots.acquire, args=(INTERACTIVE, 5))
+    waiter.start()
+    time.sleep(0.05)
+    slots.release()
+    waiter.join()
+    assert not slots.acquire(BATCH, timeout=0.05)
+
+
+def test_client_over_its_tokens_is_rejected_with_retry_after():
+    controller = AdmissionController(tokens_per_minute=60, burst_tokens=100)
+    controller.charge('a', 100)
+    with pytest.raises(Rejected) as rejected:
+        controller.charge('a', 30)
+    assert rejected.value.retry_after == 30
+    controller.charge('b', 100)  # every client has its own bucket
+
+
+def test_busy_server_rejects_interactive_requests_and_refunds_them():
+    controller = AdmissionController(tokens_per_minute=60, burst_tokens=100, max_concurrency=1, max_wait_seconds=0.05)
+    with controller.admit('a', 10):
+        with pytest.raises(Rejected):
+            controller.admit('b', 60)
+        assert controller.get_stats()['inUse'] == 1
+    controller.charge('b', 100)  # the rejected request's tokens were given back
+    with controller.admit('c', 10) as lease:
+        lease.release()
+    assert controller.get_stats()['inUse'] == 0
+
+
+def test_limits_are_split_between_processes():
+    controller = AdmissionController(tokens_per_minute=400, burst_tokens=100, max_concurrency=16, processes=4)
+    stats = controller.get_stats()
+    assert (stats['tokensPerMinute'], stats['burstTokens'], stats['slots']) == (100, 25, 4)
+
+
+def test_high_priority_jobs_use_interactive_slots():
+    assert routes._job_slot_class(JOB_PRIORITIES['high']) == INTERACTIVE
+    assert routes._job_slot_class(JOB_PRIORITIES['normal']) == BATCH
+
+
+@pytest.fixture
+def client():
+    return create_app().test_client()
+
+
+def test_throttled_client_gets_429(client, monkeypatch):
+    controller = AdmissionController(tokens_per_minute=60, burst_tokens=1000)
+    monkeypatch.setattr(routes, 'admission', lambda: controller)
+    controller.charge('ip:127.0.0.1', 1000)
+
+    response = client.post('/api/suggestions', json={'chartText': 'Assessment: hypertension'})
+    assert response.status_code == 429
+    assert int(response.headers['Retry-After']) >= 1
+    assert response.get_json()['retryAfter'] == int(response.headers['Retry-After'])
+
+
+def test_busy_server_gets_429(client, monkeypatch):
+    controller = AdmissionController(max_concurrency=1, max_wait_seconds=0.05)
+    monkeypatch.setattr(routes, 'admission', lambda: controller)
+    with controller.slot(BATCH):
+        response = client.post('/api/analysis', json={'chartText': 'Assessment: hypertension'})
+    assert response.status_code == 429
+    assert 'Retry-After' in response.headers
@@ -0,0 +1,139 @@
+import os
+import stat
+import time
+from datetime import timedelta
+from types import SimpleNamespace
+
+import pytest
+
+from app import create_app
+from app.api import routes
+from app.services.audit_store import AuditStore, AuditTrace, result_codes, utcnow
+
+SUGGESTIONS = {'cptCodes': [{'code': '99213'}], 'icdCodes': [{'code': 'e11.9'}, {'code': 'I10'}]}
+
+
+@pytest.fixture
+def store(tmp_path):
+    return AuditStore('sqlite:///' + str(tmp_path / 'audit.db'), flush_seconds=0.05)
+
+
+def trace(prompt_type='Suggestions', encounter_id='enc-1', created_at=None, **call):
+    trace = AuditTrace(prompt_type, 'chart', encounter_id)
+    if created_at is not None:
+        trace.created_at = created_at
+    if call:
+        trace.add_call(prompt_type, 'gemini-test', **call)
+    return trace
+
+
+def test_result_codes_cover_every_result_shape():
+    assert result_codes(SUGGESTIONS) == [('cpt', '99213'), ('icd', 'E119'), ('icd', 'I10')]
+    analysis = {'diagnoses': [{'code': 'ICD-10: E11.65', 'valid': True}, {'code': 'X99', 'valid': False}],
+                'procedures': [{'code': 'CPT:93000', 'valid': True}]}
+    assert result_codes(analysis) == [('icd', 'E1165'), ('cpt', '93000')]
+    assert result_codes({'codeRationales': {'cpt': {'99213': 'ok'}, 'icd': {}}}) == [('cpt', '99213')]
+    assert result_codes(['not', 'a', 'dict']) == []
+
+
+def test_records_are_written_in_batches(tmp_path):
+    store = AuditStore('sqlite:///' + str(tmp_path / 'audit.db'), batch_size=2, flush_seconds=0.5)
+    batches = []
+    insert = store._insert
+    store._insert = lambda batch: batches.append(len(batch)) or insert(batch)
+    for _ in range(5):
+        store.record(trace(source='model', latency=0.1), SUGGESTIONS)
+    assert store.flush(timeout=5)
+    assert batches == [2, 2, 1]
+    [row] = store.latency_by_prompt_type(utcnow() - timedelta(minutes=1), utcnow() + timedelta(minutes=1))
+    assert row['results'] == 5
+
+
+def test_flush_gives_up_at_its_timeout(store):
+    store._insert = lambda batch: time.sleep(0.3)
+    store.record(trace(), SUGGESTIONS)
+    assert not store.flush(timeout=0.05)
+    assert store.flush(timeout=5)
+
+
+def test_find_response_returns_the_latest_complete_answer(store):
+    store.record(trace(source='model', request_key='k', response={'n': 1}), {'n': 1})
+    store.record(trace(source='model', request_key='k', error='bad JSON'), None, error='bad JSON')
+    store.record(trace(source='model', request_key='k', response={'n': 2}), {'n': 2})
+    store.flush()
+    assert store.find_response('k') == {'n': 2}
+    assert store.find_response('other') is None
+
+
+def test_find_response_ignores_answers_older_than_the_dedupe_window(tmp_path):
+    store = AuditStore('sqlite:///' + str(tmp_path / 'audit.db'), flush_seconds=0.01, dedupe_seconds=0.1)
+    store.record(trace(source='model', request_key='k', response={'n': 1}), {'n': 1})
+    store.flush()
+    assert store.find_response('k') == {'n': 1}
+    time.sleep(0.15)
+    assert store.find_response('k') is None
+    store.dedupe_seconds = 0
+    assert store.find_response('k') is None
+
+
+def test_encounters_with_code(store):
+    now = utcnow()
+    store.record(trace(encounter_id='enc-1', created_at=now - timedelta(hours=2)), SUGGESTIONS)
+    store.record(trace(encounter_id='enc-1', created_at=now - timedelta(hours=1)), SUGGESTIONS)
+    store.record(trace(encounter_id='enc-2', created_at=now - timedelta(minutes=30)), SUGGESTIONS)
+    store.record(trace(encounter_id='enc-3', created_at=now - timedelta(days=3)), SUGGESTIONS)   # too old
+    store.record(trace(encounter_id=None, created_at=now), SUGGESTIONS)                          # no encounter
+    store.record(trace(encounter_id='enc-4', created_at=now), SUGGESTIONS, error='failed')      # no codes
+    store.flush()
+
+    found = store.encounters_with_code('E11.9', now - timedelta(days=1), now + timedelta(minutes=1))
+    assert [(row['encounterId'], row['results']) for row in found] == [('enc-2', 1), ('enc-1', 2)]
+    assert found[1]['lastCodedAt'].startswith((now - timedelta(hours=1)).isoformat()[:16])
+    assert store.encounters_with_code('E11.9', now - timedelta(days=1), now, limit=1)[0]['encounterId'] == 'enc-2'
+    assert store.encounters_with_code('Z00.00', now - timedelta(days=1), now) == []
+
+
+def test_latency_by_prompt_type(store):
+    usage = SimpleNamespace(prompt_token_count=100, candidates_token_count=20, cached_content_token_count=None)
+    for prompt_type, source in (('Alerts', 'model'), ('Alerts', 'model'), ('Alerts', 'cache'), ('Analysis', 'model')):
+        store.record(trace(prompt_type, source=source, usage=usage if source == 'model' else None), {})
+    store.flush()
+
+    rows = store.latency_by_prompt_type(utcnow() - timedelta(minutes=1), utcnow() + timedelta(minutes=1))
+    assert [(r['promptType'], r['source'], r['results']) for r in rows] == [
+        ('Alerts', 'cache', 1), ('Alerts', 'model', 2), ('Analysis', 'model', 1)]
+    assert rows[1]['promptTokens'] == 200 and rows[1]['responseTokens'] == 40
+    assert rows[0]['promptTokens'] == 0
+    assert store.latency_by_prompt_type(utcnow() + timedelta(minutes=1), utcnow() + timedelta(minutes=2)) == []
+
+
+def test_trace_source_is_the_most_expensive_call():
+    assert trace().source() == 'none'
+    mixed = trace(source='cache')
+    mixed.add_call('Suggestions', 'gemini-test', 'model')
+    assert mixed.source() == 'model'
+    rules = trace()
+    rules.rules = True
+    assert rules.source() == 'rules'
+
+
+def test_sqlite_database_is_private(tmp_path):
+    path = tmp_path / 'private' / 'audit.db'
+    store = AuditStore('sqlite:///' + str(path))
+    assert store.find_response('k') is None
+    assert stat.S_IMODE(os.stat(path).st_mode) == 0o600
+    assert stat.S_IMODE(os.stat(path.parent).st_mode) == 0o700
+
+
+def test_history_routes_default_to_the_last_30_days():
+    with create_app().test_request_context('/api/audit/latency'):
+        since, until = routes._period_args()
+    assert until.tzinfo is None and abs(until - utcnow()) < timedelta(seconds=5)
+    assert until - since == timedelta(days=30)
+
+
+@pytest.mark.parametrize('query', ['since=yesterday', 'until=2025-01-01T00:00:00%2B02:00'])
+def test_history_routes_reject_bad_periods(query):
+    with create_app().test_request_context(f'/api/audit/latency?{query}'):
+        with pytest.raises(ValueError):
+            routes._period_args()
@@ -0,0 +1,159 @@
+import json
+import threading
+import time
+
+import pytest
+
+from app import create_app
+from app.api import routes
+from app.services import batch_runner
+from app.services.batch_runner import (
+    BatchRunner, TokenBucket, backoff_delay, completed_ids, is_quota_error, normalize_chart, read_charts)
+
+
+class FakeAIService:
+    """Answers ``generate_suggestions`` from a list of results (or exceptions) per chart text."""
+
+    def __init__(self, answers=None, delay=0.0):
+        self.answers = {text: list(results) for text, results in (answers or {}).items()}
+        self.delay = delay
+        self.calls = []
+        self.in_flight = self.max_in_flight = 0
+        self._lock = threading.Lock()
+
+    def generate_suggestions(self, chart_text):
+        with self._lock:
+            self.calls.append(chart_text)
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        time.sleep(self.delay)
+        with self._lock:
+            self.in_flight -= 1
+            results = self.answers.get(chart_text)
+            result = results.pop(0) if results else {'cptCodes': [], 'icdCodes': [{'code': chart_text}]}
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+
+@pytest.fixture(autouse=True)
+def fast_backoff(monkeypatch):
+    monkeypatch.setattr(batch_runner, 'BATCH_BACKOFF_BASE_SECONDS', 0.001)
+
+
+def charts(*texts):
+    return [normalize_chart({'chartText': text}, i) for i, text in enumerate(texts)]
+
+
+def test_bucket_allows_a_burst_then_paces():
+    bucket = TokenBucket(rate_per_minute=1200, burst=2)  # one token every 50 ms
+    start = time.monotonic()
+    for _ in range(4):
+        bucket.acquire()
+    elapsed = time.monotonic() - start
+    assert 0.08 <= elapsed < 0.3
+
+
+def test_quota_errors_are_recognized():
+    assert is_quota_error('429 RESOURCE_EXHAUSTED')
+    assert is_quota_error('Quota exceeded for model')
+    assert not is_quota_error('Failed to parse JSON response')
+
+
+def test_backoff_is_jittered_and_capped():
+    delays = [backoff_delay(attempt) for attempt in range(30)]
+    assert all(0 <= delay <= batch_runner.BATCH_BACKOFF_MAX_SECONDS for delay in delays)
+
+
+def test_read_charts_accepts_jsonl_and_arrays(tmp_path):
+    jsonl = tmp_path / 'charts.jsonl'
+    jsonl.write_text('{"id": "a", "chartText": "x"}\n\n{"encounterId": 7, "chartText": "y"}\n{"chartText": "z"}\n')
+    array = tmp_path / 'charts.json'
+    array.write_text('  \n[{"id": "a", "chartText": "x"}]')
+    assert [c['id'] for c in read_charts(str(jsonl))] == ['a', '7', '2']
+    assert list(read_charts(str(array))) == [{'id': 'a', 'chartText': 'x'}]
+
+
+def test_completed_ids_is_the_resume_checkpoint(tmp_path):
+    output = tmp_path / 'out.jsonl'
+    assert completed_ids(str(output)) == set()
+    output.write_text(json.dumps({'id': 'a', 'status': 'ok'}) + '\n'
+                      + json.dumps({'id': 'b', 'status': 'error'}) + '\n'
+                      + '{"id": "c", "sta')  # cut off by the interruption
+    assert completed_ids(str(output)) == {'a'}
+
+
+def test_every_chart_gets_one_record():
+    service = FakeAIService()
+    runner = BatchRunner(service, concurrency=2, rate_per_minute=60000)
+    records = list(runner.run(charts('a', 'b', '', 'c')))
+    assert sorted(r['id'] for r in records) == ['0', '1', '2', '3']
+    empty = next(r for r in records if r['id'] == '2')
+    assert empty == {'id': '2', 'status': 'error', 'error': 'Chart text is required', 'attempts': 0}
+    assert sorted(service.calls) == ['a', 'b', 'c']
+    stats = runner.get_stats()
+    assert (stats['completed'], stats['failed'], stats['retries']) == (3, 1, 0)
+
+
+def test_quota_errors_are_retried():
+    service = FakeAIService({'a': [{'error': '429 RESOURCE_EXHAUSTED'}, RuntimeError('quota exceeded')]})
+    runner = BatchRunner(service, concurrency=1, rate_per_minute=60000)
+    [record] = runner.run(charts('a'))
+    assert record['status'] == 'ok' and record['attempts'] == 3
+    assert runner.get_stats()['retries'] == 2
+
+
+def test_retries_stop_after_max_retries():
+    service = FakeAIService({'a': [{'error': '429'}] * 5})
+    runner = BatchRunner(service, concurrency=1, rate_per_minute=60000, max_retries=2)
+    [record] = runner.run(charts('a'))
+    assert record == {'id': '0', 'status': 'error', 'error': '429', 'attempts': 3}
+
+
+def test_other_errors_are_not_retried():
+    service = FakeAIService({'a': [{'error': 'Failed to parse JSON response'}]})
+    [record] = BatchRunner(service, concurrency=1, rate_per_minute=60000).run(charts('a'))
+    assert record['status'] == 'error' and record['attempts'] == 1
+
+
+def test_concurrency_is_bounded():
+    service = FakeAIService(delay=0.05)
+    list(BatchRunner(service, concurrency=2, rate_per_minute=60000).run(charts(*'abcdef')))
+    assert service.max_in_flight == 2
+
+
+def test_resume_skips_completed_charts():
+    service = FakeAIService()
+    runner = BatchRunner(service, concurrency=2, rate_per_minute=60000)
+    records = list(runner.run(charts('a', 'b', 'c'), skip_ids={'0', '2'}))
+    assert [r['id'] for r in records] == ['1']
+    assert service.calls == ['b']
+    assert runner.get_stats()['skipped'] == 2
+
+
+@pytest.mark.parametrize('body, error', [
+    ({'charts': []}, 'At least one chart is required'),
+    ({'charts': 'Assessment: hypertension'}, 'At least one chart is required'),
+    ({'charts': ['Assessment: hypertension']}, 'Each chart must be an object'),
+    ({'charts': [{'chartText': 'a'}], 'concurrency': None}, 'concurrency must be an integer'),
+    ({'charts': [{'chartText': 'a'}], 'concurrency': [2]}, 'concurrency must be an integer'),
+    ({'charts': [{'chartText': 'a'}], 'concurrency': 'two'}, 'concurrency must be an integer'),
+    ({'charts': [{'chartText': 'a'}], 'concurrency': 0}, 'concurrency must be at least 1'),
+    ({'charts': [{'chartText': 'a'}], 'concurrency': -3}, 'concurrency must be at least 1'),
+    ('Assessment: hypertension', 'At least one chart is required'),
+    (7, 'At least one chart is required'),
+])
+def test_batch_route_rejects_bad_requests(body, error):
+    response = create_app().test_client().post('/api/batch', json=body)
+    assert response.status_code == 400
+    assert response.get_json() == {'error': error}
+
+
+def test_batch_route_streams_a_record_per_chart(monkeypatch):
+    service = FakeAIService()
+    monkeypatch.setattr(routes, 'ai_service', lambda: service)
+    client = create_app().test_client()
+    response = client.post('/api/batch', json=[{'id': 'x', 'chartText': 'a'}, {'chartText': 'b'}])
+    lines = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert sorted(line['id'] for line in lines[:-1]) == ['1', 'x']
+    assert lines[-1]['summary']['completed'] == 2
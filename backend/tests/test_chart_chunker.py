@@ -0,0 +1,114 @@
+from app.services.chart_chunker import (
+    ANALYSIS_SECTIONS, attribute_analysis, chunk_chart, merge_analyses, split_sections, split_units, unit_key)
+
+CHART = (
+    'Patient: Jane Doe  DOB 01/02/1960\n'
+    'Chief Complaint: follow-up of diabetes\n'
+    'HPI: 64F with T2DM, A1c 8.1 last month.\n'
+    'PMH: hypertension, hyperlipidemia\n'
+    'Medications: metformin 1000 mg BID, lisinopril 10 mg daily\n'
+    'Physical Exam: BP 150/95, HR 78\n'
+    'Assessment/Plan: T2DM uncontrolled, increase metformin. HTN, continue lisinopril.\n'
+)
+
+
+def item(mention, codes=(), rationale='r', snippet='s'):
+    return {'text_mention': mention, 'related_codes': list(codes), 'rationale': rationale, 'source_snippet': snippet}
+
+
+def test_split_sections_names_headers_and_keeps_preamble():
+    sections = split_sections(CHART)
+    assert [s.name for s in sections] == [
+        'preamble', 'chief_complaint', 'hpi', 'history', 'medications', 'exam', 'assessment_plan']
+    assert ''.join(s.text for s in sections) == CHART
+
+
+def test_chart_without_headers_is_one_preamble():
+    assert split_sections('just some text') == [('preamble', 'just some text')]
+
+
+def test_chunks_keep_sections_whole_and_cover_the_chart():
+    chunks = chunk_chart(CHART, max_chars=120)
+    assert ''.join(c.text for c in chunks) == CHART
+    assert all(len(c.text) <= 120 for c in chunks)
+    sections = {s.text for s in split_sections(CHART)}
+    for chunk in chunks:
+        # Each chunk is a run of whole sections
+        assert any(chunk.text.startswith(s) for s in sections)
+
+
+def test_long_section_is_split_on_lines():
+    long_plan = 'Assessment: ' + ''.join(f'problem {i}: stable on current therapy\n' for i in range(40))
+    chunks = chunk_chart(CHART + long_plan, max_chars=300)
+    plan_chunks = [c for c in chunks if c.sections == ['assessment_plan'] and 'problem' in c.text]
+    assert len(plan_chunks) > 1
+    assert all(len(c.text) <= 300 for c in chunks)
+    assert all(c.text.endswith('\n') for c in plan_chunks[:-1])
+
+
+def test_merge_collapses_by_primary_code_and_keeps_the_first():
+    first = {'diagnoses': [item('T2DM', ['E11.9'], rationale='first')]}
+    second = {'diagnoses': [item('diabetes type 2', ['e11.9', 'Z79.84'], rationale='second')]}
+    merged = merge_analyses([first, second])
+    assert merged['diagnoses'] == [item('T2DM', ['E11.9', 'Z79.84'], rationale='first')]
+
+
+def test_merge_collapses_uncoded_items_by_mention():
+    merged = merge_analyses([{'symptoms': [item('Chest  Pain')]}, {'symptoms': [item('chest pain'), item('cough')]}])
+    assert [i['text_mention'] for i in merged['symptoms']] == ['Chest  Pain', 'cough']
+
+
+def test_merge_keeps_chunk_order_and_every_section():
+    merged = merge_analyses([{'medications': [item('metformin')]}, {'medications': [item('lisinopril')]}, {}])
+    assert list(merged) == ANALYSIS_SECTIONS
+    assert [i['text_mention'] for i in merged['medications']] == ['metformin', 'lisinopril']
+    assert merged['procedures'] == []
+
+
+def test_merge_does_not_modify_its_inputs_and_skips_junk():
+    first = {'diagnoses': [item('HTN', ['I10'])]}
+    second = {'diagnoses': [item('hypertension', ['I10', 'I16.9']), 'not an item', None]}
+    merge_analyses([first, second])
+    assert first == {'diagnoses': [item('HTN', ['I10'])]}
+    assert merge_analyses([second])['diagnoses'] == [item('hypertension', ['I10', 'I16.9'])]
+
+
+def keys(chart):
+    return [unit_key(unit) for unit in split_units(chart)]
+
+
+def test_units_cover_the_chart_and_split_long_sections_at_paragraphs():
+    plan = 'Assessment: ' + '\n\n'.join(f'problem {i}: ' + 'stable ' * 50 for i in range(12))
+    units = split_units(CHART + plan)
+    assert ''.join(u.text for u in units) == CHART + plan
+    plan_units = [u for u in units if 'problem' in u.text]
+    assert len(plan_units) > 1 and all(u.text.endswith('\n\n') for u in plan_units[:-1])
+
+
+def test_an_edit_changes_only_the_units_it_touches():
+    edited = CHART.replace('BP 150/95', 'BP 128/80')
+    before, after = keys(CHART), keys(edited)
+    assert len(before) == len(after)
+    changed = [i for i, (a, b) in enumerate(zip(before, after)) if a != b]
+    assert [split_units(edited)[i].name for i in changed] == ['exam']
+
+
+def test_unit_key_ignores_case_and_whitespace_but_not_words():
+    assert keys(CHART) == keys(CHART.replace('HR 78', 'HR   78').replace('Chief', 'CHIEF'))
+    assert keys(CHART) != keys(CHART.replace('HR 78', 'HR 87'))
+
+
+def test_attribute_analysis_places_items_by_snippet_then_mention():
+    units = split_units(CHART)
+    result = {
+        'diagnoses': [item('T2DM', ['E11.9'], snippet='T2DM uncontrolled, increase metformin'),
+                      item('hypertension', ['I10'], snippet='not in the chart'),  # placed by its mention
+                      item('gout', ['M10.9'], snippet='nowhere')],
+        'medications': ['not a dict'],
+    }
+    per_unit, loose = attribute_analysis(result, units)
+    by_name = {unit.name: per_unit[unit_key(unit)] for unit in units}
+    assert [i['text_mention'] for i in by_name['assessment_plan']['diagnoses']] == ['T2DM']
+    assert [i['text_mention'] for i in by_name['history']['diagnoses']] == ['hypertension']
+    assert [i['text_mention'] for i in loose['diagnoses']] == ['gout']
+    assert loose['medications'] == []
@@ -0,0 +1,76 @@
+import pytest
+
+from app.services.code_catalog import CodeCatalog, CodeTable, load_code_table, normalize_code, ICD_CATALOG_FILE
+
+
+@pytest.fixture(scope='module')
+def catalog():
+    return CodeCatalog()
+
+
+def test_normalize_code():
+    assert normalize_code(' e11.9 ') == 'E119'
+
+
+def test_find_ignores_dots_and_case(catalog):
+    row = catalog.icd.row(catalog.icd.find('e119'))
+    assert row == {'code': 'E11.9', 'description': 'Type 2 diabetes mellitus without complications',
+                   'category': 'Endocrine'}
+    assert catalog.icd.find('E11.99') is None
+
+
+def test_cpt_rows_carry_modifiers_and_units(catalog):
+    row = catalog.cpt.row(catalog.cpt.find('99213'))
+    assert row['modifiers'] == ['25', '59']
+    assert row['units'] == '1'
+    assert catalog.cpt.row(catalog.cpt.find('36415'))['modifiers'] == []
+
+
+def test_code_prefix_range(catalog):
+    codes = [catalog.icd.codes[i] for i in catalog.icd.code_prefix_range('E11')]
+    assert codes == ['E11.65', 'E11.9']
+    assert list(catalog.icd.code_prefix_range('')) == []
+    assert list(catalog.icd.code_prefix_range('Q99')) == []
+
+
+def test_description_postings_are_sorted_row_ids(catalog):
+    ids = list(catalog.icd.postings['unspecified'])
+    assert ids == sorted(ids)
+    assert all('unspecified' in catalog.icd.descriptions[i].lower() for i in ids)
+
+
+def test_cms_order_file_gets_dots_and_chapters(tmp_path):
+    path = tmp_path / 'icd10cm_codes_2025.txt'
+    path.write_text('A000    Cholera due to Vibrio cholerae 01, biovar cholerae\n'
+                    'I10     Essential (primary) hypertension\n'
+                    'malformed\n', encoding='utf-8')
+    table = load_code_table(str(path), 'icd')
+    assert len(table) == 2
+    assert table.row(table.find('A00.0')) == {
+        'code': 'A00.0', 'description': 'Cholera due to Vibrio cholerae 01, biovar cholerae',
+        'category': 'Infectious Diseases'}
+    assert table.row(table.find('I10'))['category'] == 'Cardiovascular'
+
+
+def test_missing_file_gives_empty_table(tmp_path):
+    table = load_code_table(str(tmp_path / 'missing.tsv'), 'icd')
+    assert len(table) == 0
+    assert table.find('I10') is None
+
+
+def test_shared_builds_each_index_once():
+    catalog = CodeCatalog(icd_path=ICD_CATALOG_FILE, cpt_path=ICD_CATALOG_FILE)
+    builds = []
+
+    def build(c):
+        builds.append(c)
+        return object()
+
+    first = catalog.shared('index', build)
+    assert catalog.shared('index', build) is first
+    assert builds == [catalog]
+
+
+def test_table_sorts_rows_by_code():
+    table = CodeTable('icd', [{'code': 'J45.909', 'description': 'b'}, {'code': 'E03.9', 'description': 'a'}])
+    assert table.codes == ['E03.9', 'J45.909']
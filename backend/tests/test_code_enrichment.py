@@ -0,0 +1,96 @@
+from types import SimpleNamespace
+
+import pytest
+
+from app.services import code_enrichment
+from app.services.code_catalog import CodeTable
+from app.services.code_enrichment import CodeEnricher
+
+ICD = [
+    {'code': 'E11', 'description': 'Type 2 diabetes mellitus', 'category': 'Endocrine'},
+    {'code': 'E11.6', 'description': 'Type 2 diabetes mellitus with other specified complications',
+     'category': 'Endocrine'},
+    {'code': 'E11.65', 'description': 'Type 2 diabetes mellitus with hyperglycemia', 'category': 'Endocrine'},
+    {'code': 'E11.69', 'description': 'Type 2 diabetes mellitus with other specified complication',
+     'category': 'Endocrine'},
+    {'code': 'E11.9', 'description': 'Type 2 diabetes mellitus without complications', 'category': 'Endocrine'},
+    {'code': 'I10', 'description': 'Essential (primary) hypertension', 'category': 'Circulatory'},
+]
+CPT = [
+    {'code': '99213', 'description': 'Office visit, est patient, 20-29 min', 'category': 'E/M',
+     'modifiers': ['25', '59']},
+    {'code': '71046', 'description': 'Radiologic examination, chest; 2 views', 'category': 'Radiology'},
+]
+
+
+@pytest.fixture(scope='module')
+def enricher():
+    return CodeEnricher(SimpleNamespace(icd=CodeTable('icd', ICD), cpt=CodeTable('cpt', CPT)))
+
+
+def test_icd_code_is_filled_in_from_the_catalog(enricher):
+    item = enricher.enrich_icd({'code': 'e1165', 'rationale': 'A1c 9.2'})
+    assert item == {
+        'code': 'E11.65', 'rationale': 'A1c 9.2', 'description': 'Type 2 diabetes mellitus with hyperglycemia',
+        'category': 'Endocrine', 'relatedSeriesCodes': ['E11.69'], 'valid': True, 'billable': True,
+    }
+
+
+def test_model_description_is_kept(enricher):
+    assert enricher.enrich_icd({'code': 'I10', 'description': 'HTN'})['description'] == 'HTN'
+
+
+def test_header_codes_are_valid_but_not_billable(enricher):
+    for code in ('E11', 'E11.6'):
+        item = enricher.enrich_icd({'code': code})
+        assert item['valid'] and not item['billable']
+
+
+def test_series_of_a_four_character_code_is_its_category(enricher):
+    assert enricher.enrich_icd({'code': 'E11.9'})['relatedSeriesCodes'] == ['E11.65', 'E11.69']
+
+
+def test_series_is_capped(enricher, monkeypatch):
+    monkeypatch.setattr(code_enrichment, 'MAX_SERIES_CODES', 1)
+    assert enricher.enrich_icd({'code': 'E11.9'})['relatedSeriesCodes'] == ['E11.65']
+
+
+@pytest.mark.parametrize('code, series', [
+    ('E11.99', ['E11.65', 'E11.69', 'E11.9']),  # well formed but not in the catalog
+    ('not a code', []),
+    ('', []),
+])
+def test_unknown_icd_codes_are_invalid(enricher, code, series):
+    item = enricher.enrich_icd({'code': code})
+    assert (item['valid'], item['billable'], item['relatedSeriesCodes']) == (False, False, series)
+    assert 'description' not in item
+
+
+def test_cpt_code_gets_modifiers(enricher):
+    item = enricher.enrich_cpt({'code': '99213'})
+    assert item['allowedModifiers'] == ['25', '59']
+    assert item['valid'] and item['billable'] and item['category'] == 'E/M'
+    unknown = enricher.enrich_cpt({'code': '99999'})
+    assert unknown['allowedModifiers'] == [] and not unknown['valid']
+
+
+def test_analysis_items_use_the_table_of_their_section(enricher):
+    analysis = {
+        'diagnoses': [{'code': 'ICD-10: E11.65'}, {'code': 'I99'}],
+        'procedures': [{'code': 'CPT:71046'}],
+        'medications': [{'code': 'I10'}],
+        'symptoms': [{'description': 'no code'}],
+    }
+    enricher.enrich_analysis(analysis)
+    assert analysis['diagnoses'][0] == {'code': 'ICD-10: E11.65', 'valid': True,
+                                        'codeDescription': 'Type 2 diabetes mellitus with hyperglycemia'}
+    assert analysis['diagnoses'][1] == {'code': 'I99', 'codeDescription': '', 'valid': False}
+    assert analysis['procedures'][0]['codeDescription'] == 'Radiologic examination, chest; 2 views'
+    assert analysis['medications'][0] == {'code': 'I10'}
+    assert analysis['symptoms'][0] == {'description': 'no code'}
+
+
+def test_enrich_suggestions_covers_both_lists(enricher):
+    suggestions = {'cptCodes': [{'code': '99213'}], 'icdCodes': [{'code': 'I10'}]}
+    enricher.enrich_suggestions(suggestions)
+    assert suggestions['cptCodes'][0]['valid'] and suggestions['icdCodes'][0]['valid']
@@ -0,0 +1,82 @@
+import pytest
+
+from app.services.code_catalog import CodeCatalog
+from app.services.code_search import CodeSearchEngine, MAX_LIMIT
+
+
+@pytest.fixture(scope='module')
+def catalog():
+    return CodeCatalog()
+
+
+@pytest.fixture(scope='module')
+def icd(catalog):
+    engine = CodeSearchEngine(catalog.icd)
+    return lambda *args, **kwargs: [catalog.icd.codes[i] for i in engine.search(*args, **kwargs)]
+
+
+@pytest.fixture(scope='module')
+def cpt(catalog):
+    engine = CodeSearchEngine(catalog.cpt)
+    return lambda *args, **kwargs: [catalog.cpt.codes[i] for i in engine.search(*args, **kwargs)]
+
+
+def test_every_query_token_must_match(icd):
+    assert icd('diabetes hyperglycemia') == ['E11.65']
+    assert set(icd('type 2 diabetes')) == {'E11.65', 'E11.9'}
+
+
+def test_rarer_terms_rank_higher(icd):
+    # "asthma" appears in three descriptions, "exacerbation" in two; the row with both "acute" and them wins
+    assert icd('acute asthma exacerbation')[0] == 'J45.901'
+
+
+@pytest.mark.parametrize('query, expected', [
+    ('diabtes', 'E11.9'),        # deletion
+    ('hypertensoin', 'I10'),     # transposition
+    ('pnemonia', 'J18.9'),       # missing letter
+    ('migrane', 'G43.909'),
+])
+def test_typos_are_tolerated(icd, query, expected):
+    assert expected in icd(query)
+
+
+def test_short_tokens_are_not_fuzzy_matched(icd):
+    assert icd('xyz') == []
+
+
+def test_last_token_is_a_prefix(icd):
+    assert icd('hypoth') == ['E03.9']
+    assert 'I48.91' in icd('atrial fib')
+    # Only the last token is completed
+    assert icd('hypoth unspecified') == []
+
+
+def test_exact_code_ranks_first(icd):
+    assert icd('E11.9')[0] == 'E11.9'
+    assert icd('e119')[0] == 'E11.9'
+
+
+def test_code_prefix_prefers_closer_completions(icd, cpt):
+    assert icd('J45')[:1] == ['J45.20']
+    assert icd('J45') == ['J45.20', 'J45.901', 'J45.909']
+    assert cpt('9921') == ['99212', '99213', '99214', '99215']
+
+
+def test_category_filter(icd, cpt):
+    assert set(icd('unspecified', category='endocrine')) == {'E03.9', 'E55.9', 'E66.9', 'E78.00', 'E78.5'}
+    assert cpt('visit', category='Evaluation and Management')
+    assert icd('unspecified', category='No Such Category') == []
+
+
+def test_pages_do_not_overlap(icd):
+    everything = icd('unspecified', limit=MAX_LIMIT)
+    pages = icd('unspecified', limit=5) + icd('unspecified', limit=5, offset=5) + icd('unspecified', limit=5, offset=10)
+    assert pages == everything[:15]
+    assert len(set(pages)) == 15
+
+
+def test_limits_are_clamped(icd):
+    assert len(icd('unspecified', limit=MAX_LIMIT * 10)) <= MAX_LIMIT
+    assert icd('unspecified', limit=0) == []
+    assert icd('   ') == []
@@ -0,0 +1,94 @@
+from types import SimpleNamespace
+
+from app.services.context_cache import (
+    CHARS_PER_TOKEN, DEFAULT_MIN_CACHE_TOKENS, ContextCacheManager, is_cache_error, min_cache_tokens)
+
+MODEL = 'gemini-2.5-flash'
+
+
+class FakeCaches:
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.created = []
+
+    def create(self, model, config):
+        if self.fail:
+            raise RuntimeError('500 INTERNAL')
+        self.created.append(config)
+        return SimpleNamespace(name=f'cachedContents/{len(self.created)}')
+
+
+def manager(caches, min_tokens=10, **kwargs):
+    return ContextCacheManager(SimpleNamespace(caches=caches), min_tokens=min_tokens, **kwargs)
+
+
+def chart(tokens):
+    return 'x' * (tokens * CHARS_PER_TOKEN)
+
+
+def test_content_below_the_minimum_is_sent_inline():
+    caches = FakeCaches()
+    assert manager(caches).chart_cache(MODEL, chart(9)) is None
+    assert caches.created == []
+
+
+def test_chart_is_uploaded_once_and_reused():
+    caches = FakeCaches()
+    contexts = manager(caches)
+    assert contexts.chart_cache(MODEL, chart(10)) == 'cachedContents/1'
+    assert contexts.chart_cache(MODEL, chart(10)) == 'cachedContents/1'
+    assert len(caches.created) == 1
+    assert contexts.get_stats() == {'enabled': True, 'live': 1, 'backoff': 0}
+
+
+def test_failed_upload_falls_back_inline_and_backs_off():
+    caches = FakeCaches(fail=True)
+    contexts = manager(caches)
+    assert contexts.chart_cache(MODEL, chart(10)) is None
+    caches.fail = False
+    assert contexts.chart_cache(MODEL, chart(10)) is None  # still backing off
+    assert caches.created == []
+    assert contexts.get_stats()['backoff'] == 1
+
+
+def test_invalidated_handle_is_uploaded_again():
+    caches = FakeCaches()
+    contexts = manager(caches)
+    name = contexts.chart_cache(MODEL, chart(10))
+    contexts.invalidate(name)
+    assert contexts.chart_cache(MODEL, chart(10)) == 'cachedContents/2'
+
+
+def test_disabled_manager_never_uploads():
+    caches = FakeCaches()
+    assert manager(caches, enabled=False).chart_cache(MODEL, chart(100)) is None
+    assert caches.created == []
+
+
+def test_cache_errors_are_recognized():
+    assert is_cache_error(SimpleNamespace(code=404))
+    assert is_cache_error(type('E', (Exception,), {'code': 400})('CachedContent not found'))
+    assert not is_cache_error(type('E', (Exception,), {'code': 400})('invalid argument'))
+    assert not is_cache_error(RuntimeError('boom'))
+
+
+def test_each_model_gets_its_own_upload():
+    caches = FakeCaches()
+    contexts = manager(caches)
+    assert contexts.chart_cache(MODEL, chart(10)) != contexts.chart_cache('gemini-2.5-pro', chart(10))
+    assert len(caches.created) == 2
+
+
+def test_minimum_size_depends_on_the_model():
+    assert min_cache_tokens('gemini-2.5-flash') == 1024
+    assert min_cache_tokens('gemini-2.5-pro-preview-03-25') == 2048
+    assert min_cache_tokens('some-other-model') == DEFAULT_MIN_CACHE_TOKENS
+
+
+def test_model_minimum_applies_unless_one_is_forced():
+    caches = FakeCaches()
+    contexts = manager(caches, min_tokens=None)
+    assert contexts.chart_cache('gemini-2.5-flash', chart(1024)) is not None
+    assert contexts.chart_cache('gemini-2.5-pro', chart(1024)) is None
+    assert contexts.chart_cache('gemini-2.5-pro', chart(2048)) is not None
+    assert manager(caches, min_tokens=4096).chart_cache('gemini-2.5-flash', chart(2048)) is None
@@ -0,0 +1,38 @@
+import os
+import stat
+import time
+
+from app.services.encounter_store import EncounterStore
+
+
+def test_version_goes_up_only_when_the_chart_changes(tmp_path):
+    store = EncounterStore(str(tmp_path / 'encounters.db'))
+    assert store.get('enc-1', 'analysis') is None
+    assert store.put('enc-1', 'analysis', 'hash-a', {'n': 1}) == 1
+    assert store.put('enc-1', 'analysis', 'hash-a', {'n': 2}) == 1
+    assert store.put('enc-1', 'analysis', 'hash-b', {'n': 3}) == 2
+    assert store.get('enc-1', 'analysis') == {'version': 2, 'chartHash': 'hash-b', 'state': {'n': 3}}
+
+
+def test_kinds_and_encounters_are_versioned_separately(tmp_path):
+    store = EncounterStore(str(tmp_path / 'encounters.db'))
+    store.put('enc-1', 'analysis', 'hash-a', {})
+    store.put('enc-1', 'analysis', 'hash-b', {})
+    assert store.put('enc-1', 'suggestions', 'hash-b', {}) == 1
+    assert store.put('enc-2', 'analysis', 'hash-b', {}) == 1
+
+
+def test_expired_encounters_start_over(tmp_path):
+    store = EncounterStore(str(tmp_path / 'encounters.db'), ttl_seconds=0.05)
+    store.put('enc-1', 'analysis', 'hash-a', {})
+    store.put('enc-1', 'analysis', 'hash-b', {})
+    time.sleep(0.06)
+    assert store.get('enc-1', 'analysis') is None
+    assert store.put('enc-1', 'analysis', 'hash-c', {}) == 1
+
+
+def test_database_is_private(tmp_path):
+    path = tmp_path / 'private' / 'encounters.db'
+    EncounterStore(str(path)).put('enc-1', 'analysis', 'hash-a', {})
+    assert stat.S_IMODE(os.stat(path).st_mode) == 0o600
+    assert stat.S_IMODE(os.stat(path.parent).st_mode) == 0o700
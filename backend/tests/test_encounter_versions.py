@@ -0,0 +1,101 @@
+import pytest
+
+from app.services.ai_service import AIService
+from app.services.chart_chunker import CHUNK_THRESHOLD_CHARS
+from app.services.audit_store import AuditStore
+from app.services.encounter_store import EncounterStore
+from app.services.gemini_client import ResilientGeminiClient
+from app.services.model_router import ROUTING_SMALL_PROMPT_CHARS
+from app.services.response_cache import ResponseCache
+
+CHART = (
+    'Chief Complaint: follow-up of diabetes\n'
+    'HPI: 64F with T2DM, A1c 8.1 last month.\n'
+    'PMH: hypertension\n'
+    'Physical Exam: BP 150/95, HR 78\n'
+    'Assessment/Plan: T2DM uncontrolled, increase metformin.\n'
+)
+
+
+@pytest.fixture
+def service(fake_gemini, tmp_path):
+    gemini = ResilientGeminiClient(pool_size=4, api_key='test', base_url=fake_gemini.base_url, hedge=False)
+    # Stores of their own, so no test is answered from another's results
+    service = AIService(response_cache=ResponseCache(db_path=None), gemini=gemini,
+                        encounters=EncounterStore(str(tmp_path / 'encounters.db')),
+                        audit=AuditStore('sqlite:///' + str(tmp_path / 'audit.db')))
+    yield service
+    service.executor.shutdown()
+    service.chunk_executor.shutdown()
+
+
+def test_first_version_analyzes_the_whole_chart(service, fake_gemini):
+    analysis = service.generate_analysis(CHART, encounter_id='enc-1')
+    assert 'error' not in analysis
+    assert analysis['encounter']['version'] == 1
+    assert analysis['encounter']['changedSections'] == []
+    assert analysis['encounter']['reanalyzedChars'] == len(service.prompts.trim_chart(CHART))
+    assert fake_gemini.requests == 1
+
+
+def test_unchanged_chart_is_not_sent_again(service, fake_gemini):
+    first = service.generate_analysis(CHART, encounter_id='enc-1')
+    again = service.generate_analysis(CHART, encounter_id='enc-1')
+    assert fake_gemini.requests == 1
+    assert again['encounter']['version'] == 1 and again['encounter']['reanalyzedChars'] == 0
+    assert {k: v for k, v in again.items() if k != 'encounter'} == \
+        {k: v for k, v in first.items() if k != 'encounter'}
+
+
+def test_edit_reanalyzes_only_the_changed_section(service, fake_gemini):
+    service.generate_analysis(CHART, encounter_id='enc-1')
+    edited = CHART.replace('BP 150/95', 'BP 128/80')
+    analysis = service.generate_analysis(edited, encounter_id='enc-1')
+    encounter = analysis['encounter']
+    assert encounter['version'] == 2
+    assert encounter['changedSections'] == ['exam']
+    assert encounter['removedUnits'] == 1
+    assert encounter['reanalyzedChars'] == len('Physical Exam: BP 128/80, HR 78\n')
+    assert fake_gemini.requests == 2
+
+
+def test_suggestion_versions_report_changed_sections(service):
+    first = service.generate_suggestions(CHART, encounter_id='enc-1')
+    assert first['encounter']['version'] == 1
+    second = service.generate_suggestions(CHART + 'Orders: CBC\n', encounter_id='enc-1')
+    assert second['encounter']['version'] == 2
+    assert second['encounter']['changedSections'] == ['procedures']
+
+
+def test_encounter_state_does_not_keep_the_chart(service):
+    service.generate_analysis(CHART, encounter_id='enc-1')
+    state = service.encounters.get('enc-1', 'analysis')['state']
+    assert set(state) == {'units', 'loose'}
+
+
+def analysis_calls(service):
+    tiers = service.router.get_stats()['tiers']
+    return {name: tiers.get(name, {}).get('promptTypes', {}).get('Analysis', {}).get('calls', 0)
+            for name in service.router.tiers}
+
+
+def long_chart(paragraphs):
+    return 'HPI:\n' + '\n\n'.join(f'Paragraph {n}: ' + 'symptoms noted and reviewed. ' * 20
+                                     for n in range(paragraphs)) + '\n' + CHART
+
+
+def test_chunks_use_the_tier_of_the_whole_chart(service):
+    chart = long_chart(30)
+    assert len(service.prompts.trim_chart(chart)) > CHUNK_THRESHOLD_CHARS
+    assert 'error' not in service.generate_analysis(chart)
+    calls = analysis_calls(service)
+    assert calls['pro'] > 1 and calls['fast'] == 0
+
+
+def test_changed_sections_use_the_tier_of_the_whole_chart(service):
+    chart = long_chart(15)
+    assert ROUTING_SMALL_PROMPT_CHARS < len(service.prompts.trim_chart(chart)) <= CHUNK_THRESHOLD_CHARS
+    service.generate_analysis(chart, encounter_id='enc-1')
+    analysis = service.generate_analysis(chart.replace('BP 150/95', 'BP 128/80'), encounter_id='enc-1')
+    assert analysis['encounter']['reanalyzedChars'] < ROUTING_SMALL_PROMPT_CHARS
+    assert analysis_calls(service) == {'pro': 2, 'fast': 0}
@@ -0,0 +1,143 @@
+import time
+
+import pytest
+from google.genai import errors, types
+
+from app.services import gemini_client
+from app.services.gemini_client import (
+    HEDGE_MIN_SAMPLES, CircuitBreaker, CircuitOpenError, DeadlineExceeded, ResilientGeminiClient)
+
+MODEL = 'gemini-test'
+PROMPT = 'Return JSON with "alerts".'
+CONFIG = types.GenerateContentConfig(response_mime_type='application/json')
+
+
+@pytest.fixture(autouse=True)
+def fast_backoff(monkeypatch):
+    monkeypatch.setattr(gemini_client, 'GEMINI_BACKOFF_BASE_SECONDS', 0.01)
+
+
+def make_client(server, **kwargs):
+    return ResilientGeminiClient(pool_size=4, api_key='test', base_url=server.base_url, **kwargs)
+
+
+def generate(client, deadline=10.0):
+    return client.generate('Alerts', MODEL, PROMPT, CONFIG, time.monotonic() + deadline)
+
+
+class FailFirst:
+    """A fake server rate under which the first ``count`` requests are hit and the rest are not."""
+
+    def __init__(self, count):
+        self.left = count
+
+    def __gt__(self, draw):
+        self.left -= 1
+        return self.left >= 0
+
+
+def test_breaker_opens_at_failure_rate_and_half_opens_after_a_while():
+    breaker = CircuitBreaker('m', failure_rate=0.5, min_calls=4, open_seconds=0.05)
+    for failed in (True, False, True):
+        breaker.record(failed)
+    assert breaker.state == CircuitBreaker.CLOSED  # not enough calls yet
+    breaker.record(False)
+    assert breaker.state == CircuitBreaker.OPEN
+    assert not breaker.allow()
+
+    time.sleep(0.06)
+    assert breaker.allow()           # the trial call
+    assert not breaker.allow()       # only one at a time
+    breaker.record(False)
+    assert breaker.state == CircuitBreaker.CLOSED and breaker.allow()
+
+
+def test_failed_trial_reopens_the_breaker():
+    breaker = CircuitBreaker('m', failure_rate=0.5, min_calls=2, open_seconds=0.05)
+    breaker.record(True)
+    breaker.record(True)
+    time.sleep(0.06)
+    assert breaker.allow()
+    breaker.record(True)
+    assert breaker.state == CircuitBreaker.OPEN and not breaker.allow()
+
+
+def test_breaker_forgets_calls_outside_its_window():
+    breaker = CircuitBreaker('m', failure_rate=0.5, min_calls=3, window_seconds=0.05)
+    breaker.record(True)
+    breaker.record(True)
+    time.sleep(0.06)
+    breaker.record(True)
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_generate_returns_the_model_answer(fake_gemini):
+    response = generate(make_client(fake_gemini, hedge=False))
+    assert '"alerts"' in response.text
+    assert fake_gemini.requests == 1
+
+
+def test_retryable_errors_are_retried(fake_gemini):
+    fake_gemini.settings.error_rate = FailFirst(2)
+    response = generate(make_client(fake_gemini, hedge=False))
+    assert '"alerts"' in response.text
+    assert fake_gemini.requests == 3
+
+
+def test_retries_stop_after_max_retries(fake_gemini):
+    fake_gemini.settings.error_rate = 1.0
+    with pytest.raises(errors.APIError) as raised:
+        generate(make_client(fake_gemini, hedge=False, max_retries=2))
+    assert raised.value.code == 503
+    assert fake_gemini.requests == 3
+
+
+def test_client_errors_are_not_retried(fake_gemini):
+    fake_gemini.settings.error_rate = 1.0
+    fake_gemini.settings.error_status = 400
+    with pytest.raises(errors.APIError):
+        generate(make_client(fake_gemini, hedge=False))
+    assert fake_gemini.requests == 1
+    assert make_client(fake_gemini).breaker(MODEL).state == CircuitBreaker.CLOSED
+
+
+def test_slow_model_raises_deadline_exceeded(fake_gemini):
+    fake_gemini.settings.latency = 2.0
+    start = time.monotonic()
+    with pytest.raises(DeadlineExceeded):
+        generate(make_client(fake_gemini, hedge=False), deadline=0.5)
+    assert time.monotonic() - start < 1.5
+
+
+def test_open_circuit_fails_fast_without_calling_the_model(fake_gemini):
+    fake_gemini.settings.error_rate = 1.0
+    client = make_client(fake_gemini, hedge=False, max_retries=0)
+    client.breaker(MODEL).min_calls = 3
+    for _ in range(3):
+        with pytest.raises(errors.APIError):
+            generate(client)
+    assert client.get_stats()['circuits'] == {MODEL: 'open'}
+
+    with pytest.raises(CircuitOpenError):
+        generate(client)
+    assert fake_gemini.requests == 3
+
+
+def test_stalled_call_is_hedged_and_the_first_answer_wins(fake_gemini):
+    client = make_client(fake_gemini, hedge=True)
+    client._latency(MODEL, 'Alerts').samples.extend([0.05] * HEDGE_MIN_SAMPLES)
+    fake_gemini.settings.slow_latency = 3.0
+    fake_gemini.settings.slow_rate = FailFirst(1)  # only the primary request stalls
+
+    start = time.monotonic()
+    response = generate(client)
+    assert '"alerts"' in response.text
+    assert time.monotonic() - start < 1.5
+    assert fake_gemini.requests == 2
+
+
+def test_hedging_waits_for_enough_samples(fake_gemini):
+    client = make_client(fake_gemini, hedge=True)
+    for _ in range(3):
+        generate(client)
+    assert fake_gemini.requests == 3
@@ -0,0 +1,111 @@
+import os
+import stat
+import threading
+import time
+
+import pytest
+
+from app.services import job_queue
+from app.services.job_queue import JOB_PRIORITIES, JobQueue, current_job
+
+
+def make_queue(tmp_path, **handlers):
+    queue = JobQueue(str(tmp_path / 'jobs.db'), workers=1)
+    for job_type, handler in handlers.items():
+        queue.register(job_type, handler)
+    return queue
+
+
+def test_job_runs_and_returns_its_result(tmp_path):
+    queue = make_queue(tmp_path, echo=lambda payload: {'echo': payload['text']})
+    submitted = queue.submit('echo', {'text': 'hi'})
+    job = queue.wait(submitted['jobId'], timeout=5)
+    assert job['status'] == 'done'
+    assert job['result'] == {'echo': 'hi'}
+    assert queue.get('unknown') is None
+    with pytest.raises(ValueError):
+        queue.submit('missing', {})
+
+
+def test_handler_sees_the_job_it_runs(tmp_path):
+    queue = make_queue(tmp_path, echo=lambda payload: {'job': current_job()})
+    submitted = queue.submit('echo', {}, priority=JOB_PRIORITIES['high'])
+    job = queue.wait(submitted['jobId'], timeout=5)
+    assert job['result']['job'] == {'jobId': submitted['jobId'], 'type': 'echo', 'priority': 0}
+    assert current_job() is None
+
+
+def test_errors_fail_the_job(tmp_path):
+    def broken(payload):
+        raise RuntimeError('boom')
+    queue = make_queue(tmp_path, broken=broken, refused=lambda payload: {'error': 'no chart'})
+    assert queue.wait(queue.submit('broken', {})['jobId'], timeout=5)['error'] == 'boom'
+    assert queue.wait(queue.submit('refused', {})['jobId'], timeout=5)['error'] == 'no chart'
+    assert queue.get_stats()['failed'] == 2
+
+
+def test_duplicate_submissions_share_one_job(tmp_path):
+    release = threading.Event()
+    queue = make_queue(tmp_path, slow=lambda payload: release.wait(5) and {'ok': True})
+    first = queue.submit('slow', {'chartText': 'x'})
+    second = queue.submit('slow', {'chartText': 'x'})
+    assert second == {'jobId': first['jobId'], 'status': second['status'], 'deduplicated': True}
+    assert not queue.submit('slow', {'chartText': 'y'})['deduplicated']
+    release.set()
+    job = queue.wait(first['jobId'], timeout=5)
+    assert job['submissions'] == 2
+    assert queue.submit('slow', {'chartText': 'x'})['status'] == 'done'  # finished results are reused
+
+
+def test_jobs_run_in_priority_order(tmp_path):
+    release, order = threading.Event(), []
+
+    def record(payload):
+        release.wait(5)
+        order.append(payload['n'])
+        return {}
+    queue = make_queue(tmp_path, record=record)
+    blocker = queue.submit('record', {'n': 'first'})
+    time.sleep(0.1)  # the only worker is busy with it
+    low = queue.submit('record', {'n': 'low'}, priority=JOB_PRIORITIES['low'])
+    queue.submit('record', {'n': 'normal'})
+    queue.submit('record', {'n': 'low'}, priority=JOB_PRIORITIES['high'])  # promotes the queued duplicate
+    release.set()
+    queue.wait(blocker['jobId'], timeout=5)
+    queue.wait(low['jobId'], timeout=5)
+    for _ in range(50):
+        if len(order) == 3:
+            break
+        time.sleep(0.05)
+    assert order == ['first', 'low', 'normal']
+
+
+def test_heartbeat_keeps_long_jobs_from_being_requeued(tmp_path, monkeypatch):
+    monkeypatch.setattr(job_queue, 'JOB_HEARTBEAT_SECONDS', 0.05)
+    monkeypatch.setattr(job_queue, 'JOB_STALE_SECONDS', 0.2)
+    queue = make_queue(tmp_path, slow=lambda payload: time.sleep(0.6) or {'ok': True})
+    job_id = queue.submit('slow', {})['jobId']
+    time.sleep(0.4)
+    queue._requeue_stale()
+    assert queue.get(job_id)['status'] == 'running'
+    assert queue.wait(job_id, timeout=5)['status'] == 'done'
+
+
+def test_jobs_of_a_dead_process_are_requeued(tmp_path, monkeypatch):
+    monkeypatch.setattr(job_queue, 'JOB_STALE_SECONDS', 0.1)
+    queue = make_queue(tmp_path, echo=lambda payload: {'ok': True})
+    job_id = queue.submit('echo', {})['jobId']
+    queue.wait(job_id, timeout=5)
+    # As left by a worker that died while running it
+    queue._connection().execute(
+        'UPDATE jobs SET status = ?, finished_at = NULL, heartbeat_at = ? WHERE id = ?',
+        ('running', time.time() - 1, job_id))
+    queue._requeue_stale()
+    assert queue.wait(job_id, timeout=5)['status'] == 'done'
+
+
+def test_database_is_private(tmp_path):
+    path = tmp_path / 'private' / 'jobs.db'
+    JobQueue(str(path), workers=1)
+    assert stat.S_IMODE(os.stat(path).st_mode) == 0o600
+    assert stat.S_IMODE(os.stat(path.parent).st_mode) == 0o700
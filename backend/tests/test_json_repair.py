@@ -0,0 +1,123 @@
+import json
+from typing import List
+
+import pytest
+from pydantic import BaseModel, Field
+
+from app.services.json_repair import extract_json, parse_model_json, validate_partial
+
+
+class Code(BaseModel):
+    code: str
+    rationale: str
+
+
+class Codes(BaseModel):
+    suggestedIcd: List[Code] = Field(default_factory=list)
+    alerts: List[str] = Field(default_factory=list)
+
+
+FULL = {
+    'suggestedIcd': [
+        {'code': 'E11.9', 'rationale': 'A1c 8.1, "uncontrolled" {per note}'},
+        {'code': 'I10', 'rationale': 'BP 150/95 [repeat]'},
+    ],
+    'count': 2,
+    'ratio': -0.25,
+    'flags': [True, False, None],
+    'alerts': ['Missing \\ laterality'],
+}
+DOCUMENT = json.dumps(FULL, indent=2)
+
+
+def is_prefix(partial, full) -> bool:
+    """Whether a recovered value only lacks trailing parts of ``full`` and changes nothing."""
+    if isinstance(full, dict):
+        keys = list(full)
+        return (isinstance(partial, dict) and list(partial) == keys[:len(partial)]
+                and all(is_prefix(partial[k], full[k]) for k in partial))
+    if isinstance(full, list):
+        return (isinstance(partial, list) and len(partial) <= len(full)
+                and all(is_prefix(p, f) for p, f in zip(partial, full)))
+    return partial == full
+
+
+@pytest.mark.parametrize('text', [
+    DOCUMENT,
+    '```json\n' + DOCUMENT + '\n```',
+    'Sure! Here is the JSON:\n' + DOCUMENT + '\nHope this helps {really}.',
+])
+def test_complete_documents(text):
+    assert extract_json(text) == (FULL, False)
+
+
+def test_trailing_commas_are_dropped():
+    assert extract_json('{"a": [1, 2,], "b": {"c": 3,},}') == ({'a': [1, 2], 'b': {'c': 3}}, True)
+
+
+def test_commas_inside_strings_are_kept():
+    assert extract_json('{"a": "x,}", "b": [",]",],}') == ({'a': 'x,}', 'b': [',]']}, True)
+    assert extract_json('{"a": "x,}", "b": [",]"]}') == ({'a': 'x,}', 'b': [',]']}, False)
+
+
+@pytest.mark.parametrize('text, expected', [
+    pytest.param('{"a": [1, 2,]}', {'a': [1, 2]}, id='trailing comma in an array'),
+    pytest.param('{"a": 1,\n}', {'a': 1}, id='trailing comma in an object'),
+    pytest.param('I used {the usual rules}.\n{"a": 1,}', {'a': 1}, id='trailing comma after skipped prose'),
+    pytest.param('{"a": [1, 2], "b": "unfinis', {'a': [1, 2]}, id='cut inside a string'),
+    pytest.param('{"a": 1, "b": 2,', {'a': 1, 'b': 2}, id='cut after a comma'),
+    pytest.param('{"a": {"b": [1, 2', {'a': {'b': [1]}}, id='cut inside nested containers'),
+    pytest.param('{"a": {"b": 1}', {'a': {'b': 1}}, id='unclosed object'),
+    pytest.param('{"a": 1, "b": tru', {'a': 1}, id='cut inside a literal'),
+])
+def test_each_repair_is_reported(text, expected):
+    assert extract_json(text) == (expected, True)
+
+
+def test_prose_in_braces_before_the_object_is_skipped():
+    text = 'I used {the usual rules} to decide.\n' + DOCUMENT
+    assert extract_json(text) == (FULL, False)
+
+
+def test_no_json():
+    assert extract_json('The model declined to answer.') == (None, False)
+    assert extract_json('') == (None, False)
+
+
+@pytest.mark.parametrize('cut', range(1, len(DOCUMENT)))
+def test_every_cut_point_recovers_a_faithful_prefix(cut):
+    value, repaired = extract_json(DOCUMENT[:cut])
+    assert repaired or value is None
+    if value is not None:
+        assert is_prefix(value, FULL)
+
+
+def test_recovery_keeps_everything_before_the_cut():
+    cut = DOCUMENT.index('"I10"')
+    value, repaired = extract_json(DOCUMENT[:cut + 3])
+    assert repaired
+    assert value['suggestedIcd'][0] == FULL['suggestedIcd'][0]
+
+
+def test_validate_partial_drops_only_invalid_items():
+    value = {'suggestedIcd': [{'code': 'E11.9', 'rationale': 'ok'}, {'code': 'I10'}], 'alerts': []}
+    result, dropped = validate_partial(Codes, value)
+    assert dropped
+    assert result == {'suggestedIcd': [{'code': 'E11.9', 'rationale': 'ok'}], 'alerts': []}
+    assert validate_partial(Codes, ['not', 'an', 'object']) == (None, True)
+
+
+@pytest.mark.parametrize('cut', range(1, len(DOCUMENT)))
+def test_parse_model_json_at_every_cut_point(cut):
+    result, complete = parse_model_json(DOCUMENT[:cut], Codes)
+    assert not complete
+    if result is not None:
+        assert all(item in FULL['suggestedIcd'] for item in result['suggestedIcd'])
+
+
+def test_parse_model_json_reports_timings():
+    timings = {}
+    result, complete = parse_model_json(DOCUMENT, Codes, timings)
+    assert complete
+    assert result == {'suggestedIcd': FULL['suggestedIcd'], 'alerts': FULL['alerts']}
+    assert set(timings) == {'clean', 'parse'}
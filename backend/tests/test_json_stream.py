@@ -0,0 +1,66 @@
+import json
+
+import pytest
+
+from app.services.json_stream import StreamingItemParser
+
+DOCUMENT = json.dumps({
+    'note': 'braces {like [these]} and "quotes" in a string',
+    'suggestedIcd': [
+        {'code': 'E11.9', 'rationale': 'A1c 8.1 \\ "uncontrolled" {per note}'},
+        {'code': 'I10', 'rationale': 'BP 150/95', 'nested': {'list': [{'x': 1}, [2, 3]]}},
+    ],
+    'ignored': [{'code': 'Z00.00'}],
+    'suggestedCpt': [{'code': '99214', 'modifiers': ['25'], 'units': '1'}],
+}, indent=2)
+
+EXPECTED = [
+    ('suggestedIcd', {'code': 'E11.9', 'rationale': 'A1c 8.1 \\ "uncontrolled" {per note}'}),
+    ('suggestedIcd', {'code': 'I10', 'rationale': 'BP 150/95', 'nested': {'list': [{'x': 1}, [2, 3]]}}),
+    ('suggestedCpt', {'code': '99214', 'modifiers': ['25'], 'units': '1'}),
+]
+
+
+def parse(chunks):
+    parser = StreamingItemParser(['suggestedIcd', 'suggestedCpt'])
+    items = []
+    for chunk in chunks:
+        items.extend(parser.feed(chunk))
+    return items
+
+
+def test_whole_document():
+    assert parse([DOCUMENT]) == EXPECTED
+
+
+@pytest.mark.parametrize('cut', range(1, len(DOCUMENT)))
+def test_every_cut_point(cut):
+    assert parse([DOCUMENT[:cut], DOCUMENT[cut:]]) == EXPECTED
+
+
+def test_one_character_at_a_time():
+    assert parse(DOCUMENT) == EXPECTED
+
+
+def test_items_are_emitted_as_soon_as_they_close():
+    parser = StreamingItemParser(['suggestedIcd'])
+    # The first brace after the item's rationale string is the one closing the item
+    first_end = DOCUMENT.index('}', DOCUMENT.index('{per note}"') + len('{per note}"')) + 1
+    assert parser.feed(DOCUMENT[:first_end - 1]) == []
+    assert parser.feed(DOCUMENT[first_end - 1:first_end]) == [EXPECTED[0]]
+
+
+def test_truncated_stream_keeps_completed_items():
+    cut = DOCUMENT.index('I10')
+    assert parse([DOCUMENT[:cut]]) == EXPECTED[:1]
+
+
+def test_buffer_holds_at_most_the_open_item():
+    parser = StreamingItemParser(['suggestedIcd'])
+    parser.feed(DOCUMENT[:DOCUMENT.index('"ignored"')])
+    assert len(parser._buffer) < 10
+
+
+def test_code_fences_and_prose_are_skipped():
+    text = 'Here are the codes:\n```json\n' + DOCUMENT + '\n```\nLet me know if you need more.'
+    assert parse([text[:40], text[40:]]) == EXPECTED
@@ -0,0 +1,112 @@
+import json
+import os
+import time
+
+import pytest
+
+from app import _queue_seconds, create_app
+from app.services.metrics import METRICS_DIR_ENV, Counter, Histogram, MetricsRegistry
+
+
+def test_counter_renders_one_line_per_label_set():
+    counter = Counter('calls_total', 'Calls', ('prompt_type', 'result'))
+    counter.inc('Analysis', 'ok')
+    counter.inc('Analysis', 'ok', amount=2)
+    counter.inc('Alerts', 'error')
+    assert counter.render() == [
+        'calls_total{prompt_type="Alerts",result="error"} 1',
+        'calls_total{prompt_type="Analysis",result="ok"} 3',
+    ]
+
+
+def test_label_values_are_escaped():
+    counter = Counter('errors_total', 'Errors', ('error',))
+    counter.inc('bad "quote"\\\n')
+    assert counter.render() == ['errors_total{error="bad \\"quote\\"\\\\\\n"} 1']
+
+
+def test_histogram_buckets_are_cumulative():
+    histogram = Histogram('latency_seconds', 'Latency', ('route',), buckets=(0.1, 1))
+    for value in (0.05, 0.1, 0.5, 3):
+        histogram.observe(value, '/api/x')
+    assert histogram.render() == [
+        'latency_seconds_bucket{route="/api/x",le="0.1"} 2',
+        'latency_seconds_bucket{route="/api/x",le="1"} 3',
+        'latency_seconds_bucket{route="/api/x",le="+Inf"} 4',
+        'latency_seconds_sum{route="/api/x"} 3.65',
+        'latency_seconds_count{route="/api/x"} 4',
+    ]
+
+
+def test_histogram_times_a_block_even_when_it_raises():
+    histogram = Histogram('stage_seconds', 'Stage', buckets=(0.01, 1))
+    with pytest.raises(ValueError):
+        with histogram.time():
+            time.sleep(0.02)
+            raise ValueError
+    assert histogram.render()[:2] == ['stage_seconds_bucket{le="0.01"} 0', 'stage_seconds_bucket{le="1"} 1']
+
+
+def test_registry_renders_help_and_type_and_keeps_the_first_registration():
+    registry = MetricsRegistry()
+    first = registry.counter('b_total', 'B')
+    assert registry.counter('b_total', 'B again') is first
+    registry.histogram('a_seconds', 'A', buckets=(1,))
+    first.inc()
+    assert registry.render() == (
+        '# HELP a_seconds A\n# TYPE a_seconds histogram\n'
+        '# HELP b_total B\n# TYPE b_total counter\nb_total 1\n'
+    )
+
+
+def test_queue_time_accepts_milliseconds_and_microseconds():
+    now = time.time()
+    assert _queue_seconds(f't={int((now - 1.5) * 1000)}', now) == pytest.approx(1.5, abs=0.01)
+    assert _queue_seconds(f't={int((now - 1.5) * 1_000_000)}', now) == pytest.approx(1.5, abs=0.01)
+    assert _queue_seconds(f't={now + 5}', now) == 0.0
+    assert _queue_seconds('t=garbage', now) is None
+
+
+def test_metrics_endpoint_counts_requests():
+    client = create_app().test_client()
+    client.get('/api/icd/search')  # 400: no query
+    body = client.get('/metrics').get_data(as_text=True)
+    assert '# TYPE http_request_duration_seconds histogram' in body
+    assert 'http_request_errors_total{route="/api/icd/search",status="400"}' in body
+
+
+def worker_registry():
+    registry = MetricsRegistry()
+    return registry, registry.counter('calls_total', 'Calls', ('result',)), \
+        registry.histogram('latency_seconds', 'Latency', buckets=(1,))
+
+
+def test_render_sums_the_files_of_other_workers(tmp_path, monkeypatch):
+    monkeypatch.setenv(METRICS_DIR_ENV, str(tmp_path))
+    other, other_calls, other_latency = worker_registry()
+    other_calls.inc('ok', amount=2)
+    other_calls.inc('error')
+    other_latency.observe(0.5)
+    other.write_snapshot(str(tmp_path))
+    os.replace(tmp_path / f'{os.getpid()}.json', tmp_path / '1.json')  # as written by another process
+
+    registry, calls, latency = worker_registry()
+    calls.inc('ok')
+    latency.observe(2)
+    registry.write_snapshot(str(tmp_path))  # this process's own file is not added to its live values
+    (tmp_path / '2.json').write_text('{"calls_total": [[["ok"], 1')  # being rewritten
+    (tmp_path / '3.json').write_text(json.dumps({'latency_seconds': [[[], [[1, 1, 1], 1]]], 'gone_total': []}))
+
+    body = registry.render()
+    assert 'calls_total{result="ok"} 3' in body
+    assert 'calls_total{result="error"} 1' in body
+    assert 'latency_seconds_bucket{le="1"} 1' in body
+    assert 'latency_seconds_count 2' in body  # the file with other buckets is skipped
+    assert calls.render() == ['calls_total{result="ok"} 1']
+
+
+def test_render_is_per_process_without_a_directory(monkeypatch):
+    monkeypatch.delenv(METRICS_DIR_ENV, raising=False)
+    registry, calls, _ = worker_registry()
+    calls.inc('ok')
+    assert 'calls_total{result="ok"} 1' in registry.render()
@@ -0,0 +1,115 @@
+from types import SimpleNamespace
+
+from app.services.model_router import (
+    ROUTING_ERROR_HALF_LIFE_SECONDS, ROUTING_MIN_SAMPLES, ROUTING_SMALL_PROMPT_CHARS, ModelRouter)
+
+SMALL = ROUTING_SMALL_PROMPT_CHARS
+LARGE = ROUTING_SMALL_PROMPT_CHARS + 1
+
+
+def fail(router, tier, prompt_type, times=ROUTING_MIN_SAMPLES * 2):
+    for _ in range(times):
+        router.record(router.tier(tier), prompt_type, 1.0, error=True)
+
+
+def succeed(router, tier, prompt_type, seconds=1.0, times=ROUTING_MIN_SAMPLES):
+    for _ in range(times):
+        router.record(router.tier(tier), prompt_type, seconds)
+
+
+def agree(router, prompt_type, agreed=True, times=ROUTING_MIN_SAMPLES):
+    for _ in range(times):
+        router.record_agreement(prompt_type, agreed)
+
+
+def test_static_routes_by_prompt_size():
+    router = ModelRouter()
+    assert router.choose('Analysis', SMALL).name == 'fast'
+    assert router.choose('Analysis', LARGE).name == 'pro'
+    assert router.choose('Alerts', LARGE).name == 'fast'
+    assert router.choose('Unknown prompt', 10).name == 'pro'
+
+
+def test_verified_route_waits_for_agreement():
+    router = ModelRouter()
+    assert router.choose('Confident Codes', SMALL).name == 'pro'
+    agree(router, 'Confident Codes', times=ROUTING_MIN_SAMPLES - 1)
+    assert router.choose('Confident Codes', SMALL).name == 'pro'
+    agree(router, 'Confident Codes', times=1)
+    assert router.choose('Confident Codes', SMALL).name == 'fast'
+
+
+def test_verified_route_stays_slow_when_fast_disagrees():
+    router = ModelRouter()
+    agree(router, 'Confident Codes', agreed=False)
+    assert router.choose('Confident Codes', SMALL).name == 'pro'
+
+
+def test_slow_interactive_route_moves_to_trusted_fast_tier():
+    router = ModelRouter()
+    succeed(router, 'pro', 'Confident Codes', seconds=45)
+    assert router.choose('Confident Codes', LARGE).name == 'pro'  # fast not yet trusted
+    agree(router, 'Confident Codes')
+    assert router.choose('Confident Codes', LARGE).name == 'fast'
+
+
+def test_route_without_latency_budget_stays_put_when_slow():
+    router = ModelRouter()
+    succeed(router, 'pro', 'Analysis', seconds=500)
+    assert router.choose('Analysis', LARGE).name == 'pro'
+
+
+def test_failing_tier_is_routed_around():
+    router = ModelRouter()
+    fail(router, 'pro', 'Analysis')
+    assert router.choose('Analysis', LARGE).name == 'fast'
+    fail(router, 'fast', 'Alerts')
+    assert router.choose('Alerts', SMALL).name == 'pro'
+
+
+def test_few_failures_do_not_reroute():
+    router = ModelRouter()
+    fail(router, 'pro', 'Analysis', times=ROUTING_MIN_SAMPLES - 1)
+    assert router.choose('Analysis', LARGE).name == 'pro'
+
+
+def test_no_failover_when_both_tiers_fail():
+    router = ModelRouter()
+    fail(router, 'pro', 'Analysis')
+    fail(router, 'fast', 'Analysis')
+    assert router.choose('Analysis', LARGE).name == 'pro'
+
+
+def test_failover_never_uses_an_untrusted_fast_tier():
+    router = ModelRouter()
+    fail(router, 'pro', 'Confident Codes')
+    assert router.choose('Confident Codes', LARGE).name == 'pro'
+    agree(router, 'Confident Codes')
+    assert router.choose('Confident Codes', LARGE).name == 'fast'
+
+
+def test_failing_tier_is_retried_once_its_errors_decay():
+    router = ModelRouter()
+    fail(router, 'pro', 'Analysis')
+    assert router.choose('Analysis', LARGE).name == 'fast'
+    # No calls go to pro while it is routed around; its failures age instead
+    router._stats[('pro', 'Analysis')].updated_at -= ROUTING_ERROR_HALF_LIFE_SECONDS * 2
+    assert router.choose('Analysis', LARGE).name == 'pro'
+    assert router.get_stats()['tiers']['pro']['promptTypes']['Analysis']['errorRate'] <= 0.5
+
+
+def test_stats_report_tokens_cost_and_agreement():
+    router = ModelRouter()
+    usage = SimpleNamespace(prompt_token_count=1_000_000, candidates_token_count=100_000, thoughts_token_count=None)
+    router.record(router.tier('pro'), 'Analysis', 2.0, usage=usage)
+    router.record(router.tier('pro'), 'Analysis', 4.0, error=True)
+    agree(router, 'Confident Codes', times=3)
+    agree(router, 'Confident Codes', agreed=False, times=1)
+
+    stats = router.get_stats()
+    analysis = stats['tiers']['pro']['promptTypes']['Analysis']
+    assert analysis['calls'] == 2 and analysis['errors'] == 1
+    assert analysis['avgSeconds'] == 2.0  # failed calls do not count toward latency
+    assert analysis['promptTokens'] == 1_000_000 and analysis['outputTokens'] == 100_000
+    assert analysis['estimatedCostUsd'] == 2.25
+    assert stats['agreement']['Confident Codes'] == {'checks': 4, 'agreed': 3, 'rate': 0.75}
@@ -0,0 +1,156 @@
+import pytest
+
+from app.services import precoder as precoder_module
+from app.services.code_catalog import CodeCatalog
+from app.services.precoder import PhraseMatcher, PreCoder, description_phrases, load_synonyms
+
+VISIT = (
+    'Chief Complaint: follow-up\n'
+    'Assessment/Plan:\n'
+    '1. Type 2 diabetes mellitus without complications - continue metformin 500 mg\n'
+    '2. Hyperlipidemia, stable - continue atorvastatin 20 mg daily\n'
+)
+
+
+@pytest.fixture(scope='module')
+def precoder():
+    return PreCoder(CodeCatalog())
+
+
+def statuses(precoder, chart):
+    return {(m.code, m.status) for m in precoder.mentions(chart)}
+
+
+def test_phrase_matcher_finds_whole_token_patterns():
+    matcher = PhraseMatcher()
+    matcher.add(['asthma'], 'a')
+    matcher.add(['mild', 'intermittent', 'asthma'], 'm')
+    matcher.add(['htn'], 'h')
+    matcher.build()
+    found = {(start, end, matcher.values[i]) for start, end, i in
+             matcher.find('mild intermittent asthma and htnx'.split())}
+    assert found == {(0, 3, 'm'), (2, 3, 'a')}
+
+
+def test_description_phrases_drop_qualifiers():
+    assert 'essential hypertension' in description_phrases('Essential (primary) hypertension')
+    assert 'hypothyroidism' in description_phrases('Hypothyroidism, unspecified')
+    assert 'pneumonia' in description_phrases('Pneumonia, unspecified organism')
+
+
+@pytest.mark.parametrize('description, short_form', [
+    ('Chronic kidney disease, stage 3 (moderate)', 'chronic kidney disease'),
+    ('Mild intermittent asthma, uncomplicated', 'mild intermittent asthma'),
+    ('Major depressive disorder, single episode, unspecified', 'major depressive disorder'),
+    ('Hemoglobin; glycosylated (A1C)', 'hemoglobin'),
+])
+def test_description_phrases_keep_specific_qualifiers(description, short_form):
+    assert short_form not in description_phrases(description)
+
+
+def test_answering_without_the_model_is_off_by_default():
+    assert precoder_module.PRECODER_ANSWERS is False
+
+
+def test_generic_synonyms_are_hint_only():
+    hint_only = {synonym: hint for code, synonym, hint in load_synonyms()}
+    assert hint_only['type 2 diabetes mellitus'] and hint_only['hypertension'] and hint_only['asthma']
+    assert not hint_only['ckd stage 3']
+
+
+@pytest.mark.parametrize('chart, expected', [
+    ('Assessment: 1. Hypertension.', {('I10', 'current')}),
+    ('HPI: no fever.', {('R50.9', 'negated')}),
+    ('HPI: denies chest pain.', {('R07.9', 'negated')}),
+    ('Assessment: 1. Pneumonia, resolved.', {('J18.9', 'negated')}),
+    ('Assessment: 1. Possible pneumonia.', {('J18.9', 'uncertain')}),
+    ('Assessment: 1. Rule out pneumonia.', {('J18.9', 'uncertain')}),
+    ('Assessment: 1. History of hypertension.', {('I10', 'history')}),
+    ('Assessment: 1. Mother has hypertension.', {('I10', 'family')}),
+    ('Assessment: 1. Will order electrocardiogram.', {('93000', 'planned')}),
+])
+def test_cues_set_the_status(precoder, chart, expected):
+    assert statuses(precoder, chart) == expected
+
+
+def test_stop_cue_ends_a_negation(precoder):
+    assert statuses(precoder, 'Assessment: 1. Denies chest pain but has hypertension.') == {
+        ('R07.9', 'negated'), ('I10', 'current')}
+
+
+def test_negation_does_not_cross_clauses(precoder):
+    assert statuses(precoder, 'Assessment: 1. No fever. Hypertension.') == {
+        ('R50.9', 'negated'), ('I10', 'current')}
+
+
+def test_history_sections_are_history_or_family(precoder):
+    chart = 'PMH: hypertension\nFamily History: type 2 diabetes\n'
+    assert statuses(precoder, chart) == {('I10', 'history'), ('E11.9', 'family')}
+
+
+def test_negation_holds_inside_a_history_section(precoder):
+    assert statuses(precoder, 'PMH: no hypertension\n') == {('I10', 'negated')}
+
+
+def test_routine_visit_is_confident(precoder):
+    result = precoder.precode(VISIT)
+    assert result.confident, result.reasons
+    assert [c.code for c in result.icd] == ['E11.9', 'E78.5']
+    assert [c.code for c in result.cpt] == ['99214']  # two chronic problems with prescriptions
+    assert result.as_model_output()['suggestedCpt'][0]['code'] == '99214'
+
+
+@pytest.mark.parametrize('line, hinted', [
+    ('Type 2 diabetes mellitus with diabetic polyneuropathy', ['E11.9']),
+    ('Type 2 diabetes with foot ulcer', ['E11.9']),
+    ('Hypertensive heart disease with heart failure', ['I50.9']),
+    ('Hypertension in pregnancy', ['I10']),
+    ('Asthma, moderate persistent', ['J45.909']),
+    ('Chronic kidney disease', []),
+])
+def test_unspecific_assessment_lines_need_the_model(precoder, line, hinted):
+    result = precoder.precode(f'Chief Complaint: follow-up\nAssessment/Plan:\n1. {line} - continue lisinopril 10 mg\n')
+    assert not result.confident
+    assert [c.code for c in result.icd] == hinted
+
+
+def test_words_left_over_in_an_assessment_line_need_the_model(precoder):
+    result = precoder.precode(VISIT + '3. Hyperlipidemia due to hypothyroidism\n')
+    assert not result.confident
+    assert any(reason.startswith('unmatched words "due to"') for reason in result.reasons)
+
+
+def test_generic_terms_are_hints_only(precoder):
+    result = precoder.precode(VISIT + '3. Hypertension - continue lisinopril 10 mg daily\n')
+    assert not result.confident
+    assert 'generic term "hypertension" needs the model to pick a specific code' in result.reasons
+    assert '- ICD-10-CM I10 (high)' in result.hints()
+
+
+def test_negated_and_uncertain_diagnoses_are_not_coded(precoder):
+    result = precoder.precode(VISIT + '3. No pneumonia.\n4. Possible asthma.\n')
+    assert {c.code for c in result.icd} == {'E11.9', 'E78.5'}
+    assert not result.confident
+    assert 'uncertain diagnosis "asthma"' in result.reasons
+
+
+def test_history_is_only_coded_as_a_z_code(precoder):
+    result = precoder.precode('Assessment/Plan:\n1. History of hypertension. History of tobacco use.\n')
+    assert [c.code for c in result.icd] == ['Z87.891']
+
+
+def test_unmatched_assessment_line_needs_the_model(precoder):
+    result = precoder.precode(VISIT + '3. Chronic fatigue of unclear cause\n')
+    assert not result.confident
+    assert any(reason.startswith('unmatched assessment line') for reason in result.reasons)
+    assert 'CANDIDATE CODES' in result.hints()
+
+
+def test_long_chart_needs_the_model(precoder):
+    result = precoder.precode(VISIT + 'Note: ' + 'stable. ' * 1000)
+    assert 'chart too long for rule-based coding' in result.reasons
+
+
+def test_documented_time_sets_the_em_level(precoder):
+    result = precoder.precode(VISIT + 'Total time spent 45 minutes.\n')
+    assert result.cpt[0].code == '99215'
@@ -0,0 +1,42 @@
+import itertools
+import os
+
+import pytest
+
+from app.services.process_local import ProcessLocal
+
+
+def test_value_is_built_once_per_process():
+    counter = itertools.count(1)
+    local = ProcessLocal(lambda: next(counter))
+    assert local.get() == 1
+    assert local() == 1
+
+
+@pytest.mark.skipif(not hasattr(os, 'fork'), reason='needs os.fork')
+def test_forked_child_builds_its_own_value():
+    local = ProcessLocal(lambda: (os.getpid(), object()))
+    parent_value = local.get()
+    read, write = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        try:
+            child_value = local.get()
+            rebuilt = child_value is not parent_value and child_value[0] == os.getpid()
+            os.write(write, b'1' if rebuilt and local.get() is child_value else b'0')
+        finally:
+            os._exit(0)
+    os.close(write)
+    assert os.read(read, 1) == b'1'
+    os.close(read)
+    os.waitpid(pid, 0)
+    assert local.get() is parent_value
+
+
+def test_lock_is_replaced_in_the_child():
+    local = ProcessLocal(object)
+    lock = local._lock
+    lock.acquire()  # as if another thread held it at fork time
+    local._reset_lock()
+    assert local._lock is not lock and not local._lock.locked()
+    lock.release()
@@ -0,0 +1,92 @@
+import pytest
+
+from app.services import prompt_builder
+from app.services.prompt_builder import PromptBuilder, PromptTemplate, compact_codes, trim_chart
+
+HEADER = 'General Hospital - Internal Medicine - Doe, Jane MRN 123456'
+
+
+def paged(*pages):
+    return '\n'.join(f'{HEADER}\n{page}\nPage {n} of {len(pages)}' for n, page in enumerate(pages, 1))
+
+
+def test_trimming_is_off_by_default():
+    assert prompt_builder.PROMPT_TRIM_CHARTS is False
+    chart = 'CC: chest pain\n\n\n\nElectronically signed by Dr. Smith'
+    assert PromptBuilder().trim_chart(chart) == chart
+
+
+def test_chief_complaint_lines_are_kept():
+    assert trim_chart('CC: chest pain\nHPI: 2 days') == 'CC: chest pain\nHPI: 2 days'
+
+
+def test_serial_values_are_kept():
+    chart = '\n'.join(f'Day {day}: Troponin {value} ng/mL, Creatinine 1.1 mg/dL'
+                      for day, value in ((1, '0.01'), (2, '2.45'), (3, '8.90'), (4, '12.3')))
+    assert trim_chart(chart) == chart
+
+
+def test_repeated_body_lines_are_kept():
+    line = 'Patient tolerated the procedure well.'
+    chart = paged(f'Note A\nbody\n{line}\nmore\nend',     # in the middle of the page
+                  f'Note B\nbody\nmore\nend\n{line}',      # second to last, before the page marker
+                  f'Note C\nbody\nmore\n{line}\nend')      # third to last
+    assert trim_chart(chart).count(line) == 3
+
+
+def test_line_in_a_different_place_on_each_page_is_not_a_header():
+    line = 'Patient tolerated the procedure well.'
+    chart = paged(f'{line}\nbody\nmore\nend',        # second line, after the header
+                  f'Note B\nbody\nmore\n{line}',        # last line
+                  f'Note C\nbody\nmore\n{line}\nend')   # second to last
+    assert trim_chart(chart).count(line) == 3
+
+
+def test_page_headers_are_kept_once():
+    trimmed = trim_chart(paged('HPI: one', 'Exam: two', 'Plan: three'))
+    assert trimmed.count(HEADER) == 1
+    assert 'Page 1 of 3' not in trimmed
+    assert ['HPI: one', 'Exam: two', 'Plan: three'] == [l for l in trimmed.splitlines() if l != HEADER]
+
+
+def test_headers_on_fewer_pages_are_kept():
+    assert trim_chart(paged('HPI: one', 'Exam: two')).count(HEADER) == 2
+
+
+def test_headers_that_differ_are_not_deduplicated():
+    chart = '\f'.join(f'Visit {n} - Internal Medicine clinic note\nbody {n}' for n in range(1, 5))
+    assert all(f'Visit {n} - Internal Medicine clinic note' in trim_chart(chart) for n in range(1, 5))
+
+
+def test_signatures_and_whitespace():
+    chart = 'HPI:   cough  x 3 days\n\n\n\nElectronically signed by Dr. Smith on 01/01/2025'
+    assert trim_chart(chart) == 'HPI: cough x 3 days'
+
+
+def test_long_vitals_flowsheet_keeps_latest_rows():
+    rows = '\n'.join(f'01/0{d}/2025  {120 + d}/80  7{d}  98.{d}' for d in range(1, 7))
+    trimmed = trim_chart(f'Date  BP  HR  Temp\n{rows}\nPlan: recheck')
+    assert '01/01/2025' not in trimmed
+    assert '01/06/2025' in trimmed
+    assert '[3 earlier rows omitted]' in trimmed
+    assert trimmed.endswith('Plan: recheck')
+
+
+@pytest.mark.parametrize('chart', [
+    paged('HPI: one', 'Exam: two', 'Plan: three'),
+    'CC: cough\nDay 1: temp 101\nDay 2: temp 99',
+])
+def test_trimming_twice_changes_nothing(chart):
+    assert trim_chart(trim_chart(chart)) == trim_chart(chart)
+
+
+def test_compact_codes_keeps_model_fields():
+    codes = [{'code': 'E11.9', 'description': 'T2DM', 'id': 'icd-ai-E11.9', 'modifiers': [], 'rationale': ''}]
+    assert compact_codes(codes) == '[{"code":"E11.9","description":"T2DM"}]'
+
+
+def test_template_escapes_and_reload(tmp_path):
+    path = tmp_path / 'greeting.txt'
+    path.write_text('{{literal}} hello {name}', encoding='utf-8')
+    template = PromptTemplate(str(path), reload_seconds=0)
+    assert template.render(name='Jane') == '{literal} hello Jane'
@@ -0,0 +1,115 @@
+import time
+
+import pytest
+
+from app.services import gemini_client
+from app.services.ai_service import AIService
+from app.services.audit_store import AuditStore
+from app.services.gemini_client import ResilientGeminiClient
+from app.services.response_cache import ResponseCache, cache_key
+
+
+def test_cache_key_is_stable_and_covers_every_input():
+    key = cache_key('Analysis', 'chart', 'model-a', {'temperature': 0.2, 'top_p': 0.9})
+    assert key == cache_key('Analysis', 'chart', 'model-a', {'top_p': 0.9, 'temperature': 0.2})
+    assert key != cache_key('Alerts', 'chart', 'model-a', {'temperature': 0.2, 'top_p': 0.9})
+    assert key != cache_key('Analysis', 'chart', 'model-b', {'temperature': 0.2, 'top_p': 0.9})
+    assert key != cache_key('Analysis', 'chart', 'model-a', {'temperature': 0.3, 'top_p': 0.9})
+
+
+def test_values_are_private_copies():
+    cache = ResponseCache(db_path='')
+    value = {'codes': ['I10']}
+    cache.set('k', value)
+    value['codes'].append('E11.9')
+    cached = cache.get('k')
+    cached['codes'].clear()
+    assert cache.get('k') == {'codes': ['I10']}
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = ResponseCache(max_entries=2, db_path='')
+    cache.set('a', {'n': 1})
+    cache.set('b', {'n': 2})
+    cache.get('a')  # 'b' is now the oldest
+    cache.set('c', {'n': 3})
+    assert cache.get('b') is None
+    assert cache.get('a') == {'n': 1} and cache.get('c') == {'n': 3}
+    assert cache.get_stats()['evictions'] == 1
+
+
+def test_entries_expire_after_the_ttl():
+    cache = ResponseCache(ttl_seconds=0.05, db_path='', stale_seconds=0)
+    cache.set('k', {'n': 1})
+    assert cache.get('k') == {'n': 1}
+    time.sleep(0.06)
+    assert cache.get('k') is None
+    assert cache.get_stats()['entries'] == 0
+
+
+def test_sqlite_tier_is_read_through_by_other_instances(tmp_path):
+    path = str(tmp_path / 'responses.db')
+    ResponseCache(db_path=path).set('k', {'n': 1})
+
+    other = ResponseCache(db_path=path)
+    assert other.get('k') == {'n': 1}
+    assert other.get('k') == {'n': 1}
+    stats = other.get_stats()
+    assert (stats['disk_hits'], stats['hits'], stats['entries']) == (1, 1, 1)
+    assert stats['disk_tier'] and stats['hit_rate'] == 1.0
+
+
+def test_sqlite_tier_honours_the_ttl(tmp_path):
+    path = str(tmp_path / 'responses.db')
+    ResponseCache(ttl_seconds=0.05, db_path=path).set('k', {'n': 1})
+    time.sleep(0.06)
+    assert ResponseCache(db_path=path).get('k') is None
+
+
+def test_clear_empties_both_tiers(tmp_path):
+    path = str(tmp_path / 'responses.db')
+    cache = ResponseCache(db_path=path)
+    cache.set('k', {'n': 1})
+    cache.clear()
+    assert cache.get('k') is None
+    assert ResponseCache(db_path=path).get('k') is None
+
+
+def test_expired_entries_are_served_stale_within_the_window(tmp_path):
+    path = str(tmp_path / 'responses.db')
+    cache = ResponseCache(ttl_seconds=0.05, db_path=path, stale_seconds=0.1)
+    cache.set('k', {'n': 1})
+    time.sleep(0.06)
+    assert cache.get('k') is None
+    assert cache.get_stale('k') == {'n': 1}
+    assert ResponseCache(db_path=path, stale_seconds=0.1).get_stale('k') == {'n': 1}
+    time.sleep(0.1)
+    assert cache.get_stale('k') is None
+    assert cache.get_stale('missing') is None
+    assert cache.get_stats()['stale_hits'] == 1
+
+
+@pytest.fixture
+def service(fake_gemini, monkeypatch, tmp_path):
+    monkeypatch.setattr(gemini_client, 'GEMINI_BACKOFF_BASE_SECONDS', 0.001)
+    gemini = ResilientGeminiClient(pool_size=4, api_key='test', base_url=fake_gemini.base_url, hedge=False)
+    # No audit lookups, so expired answers can only come back as stale ones
+    service = AIService(response_cache=ResponseCache(ttl_seconds=0.05, db_path=''), gemini=gemini,
+                        audit=AuditStore('sqlite:///' + str(tmp_path / 'audit.db'), dedupe_seconds=0))
+    yield service
+    service.executor.shutdown()
+
+
+def test_stale_answer_is_served_while_the_model_fails(service, fake_gemini):
+    alerts = service.generate_alerts('Assessment: type 2 diabetes')
+    assert alerts
+    time.sleep(0.06)
+    fake_gemini.settings.error_rate = 1.0
+    assert service.generate_alerts('Assessment: type 2 diabetes') == alerts
+    assert service.response_cache.get_stats()['stale_hits'] == 1
+
+
+def test_no_stale_answer_means_an_error(service, fake_gemini):
+    fake_gemini.settings.error_rate = 1.0
+    assert service.generate_alerts('Assessment: hypertension') == []
+    assert service.response_cache.get_stats()['stale_hits'] == 0
@@ -0,0 +1,85 @@
+import threading
+import time
+
+import pytest
+
+from app.services.ai_service import AIService
+from app.services.prompt_builder import PromptBuilder, trim_chart
+from app.services.response_cache import ResponseCache
+
+SUGGESTIONS = {'cptCodes': [{'code': '99213'}], 'icdCodes': [{'code': 'I10'}]}
+ANALYSIS = {'symptoms': [], 'diagnoses': [{'description': 'Hypertension'}], 'medications': [], 'procedures': []}
+ALERTS = ['Document laterality.']
+
+
+@pytest.fixture
+def service(monkeypatch):
+    monkeypatch.setenv('GEMINI_API_KEY', 'test')
+    service = AIService(response_cache=ResponseCache(db_path=''))
+    yield service
+    service.executor.shutdown()
+
+
+def stub(service, **parts):
+    """Replace the workup's prompts with functions of the chart text."""
+    for part, fn in parts.items():
+        setattr(service, f'generate_{part}', lambda chart_text, *args, fn=fn, **kwargs: fn(chart_text))
+
+
+def test_prompts_run_concurrently(service):
+    # Each prompt waits for the other two, so the workup only finishes if all three run at once
+    barrier = threading.Barrier(3, timeout=2)
+
+    def part(result):
+        return lambda chart_text: barrier.wait() is not None and result
+    stub(service, suggestions=part(SUGGESTIONS), analysis=part(ANALYSIS), alerts=part(ALERTS))
+
+    workup = service.generate_workup('chart')
+    assert workup == {**SUGGESTIONS, 'alerts': ALERTS, 'analysis': ANALYSIS, 'errors': {}}
+
+
+def test_latency_is_the_slowest_prompt(service):
+    def slow(result):
+        return lambda chart_text: time.sleep(0.2) or result
+    stub(service, suggestions=slow(SUGGESTIONS), analysis=slow(ANALYSIS), alerts=slow(ALERTS))
+
+    start = time.monotonic()
+    service.generate_workup('chart')
+    assert time.monotonic() - start < 0.5
+
+
+def test_a_failing_prompt_does_not_discard_the_others(service):
+    def broken(chart_text):
+        raise RuntimeError('alerts failed')
+    stub(service, suggestions=lambda chart_text: SUGGESTIONS, analysis=lambda chart_text: {'error': 'bad JSON'},
+         alerts=broken)
+
+    workup = service.generate_workup('chart')
+    assert workup['cptCodes'] == SUGGESTIONS['cptCodes'] and workup['icdCodes'] == SUGGESTIONS['icdCodes']
+    assert workup['analysis'] is None and workup['alerts'] == []
+    assert workup['errors'] == {'analysis': 'bad JSON', 'alerts': 'alerts failed'}
+
+
+def test_every_prompt_gets_the_chart(service):
+    seen = []
+    stub(service, suggestions=lambda chart_text: seen.append(chart_text) or SUGGESTIONS,
+         analysis=lambda chart_text: seen.append(chart_text) or ANALYSIS,
+         alerts=lambda chart_text: seen.append(chart_text) or ALERTS)
+    service.generate_workup('Assessment: hypertension')
+    assert seen == ['Assessment: hypertension'] * 3
+
+
+def test_prompt_sizes_count_the_chart_as_submitted(monkeypatch):
+    monkeypatch.setenv('GEMINI_API_KEY', 'test')
+    service = AIService(response_cache=ResponseCache(db_path=''), prompts=PromptBuilder(trim_charts=True))
+    service._call_gemini = lambda *args, **kwargs: {'error': 'offline'}
+    sizes = {}
+    service.prompts.record = lambda prompt_type, original_chars, sent_chars: sizes.update(
+        {prompt_type: original_chars - sent_chars})
+    chart = 'HPI:   cough   x 3 days\n\n\n\n\nElectronically signed by Dr. Smith on 01/01/2025'
+    try:
+        service.generate_workup(chart)
+    finally:
+        service.executor.shutdown()
+    saved = len(chart) - len(trim_chart(chart))
+    assert sizes == {'Confident Codes': saved, 'Analysis': saved, 'Alerts': saved}
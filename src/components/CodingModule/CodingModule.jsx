@@ -1,5 +1,5 @@
 // /src/components/CodingModule/CodingModule.jsx
-import React, { useState, useCallback, useMemo, useEffect } from 'react';
+import React, { useState, useCallback, useMemo, useEffect, useRef } from 'react';
 import EncounterSlider from '../EncounterSlider/EncounterSlider';
 import CodeList from '../CodeList/CodeList';
 import IndepthAnalysis from '../IndepthAnalysis/IndepthAnalysis';
@@ -83,6 +83,22 @@ function CodingModule({
     }
   }, [encounterDetails, chartText]);
 
+  // Removed codes and code links belong to one encounter's chart; code ids repeat across charts
+  useEffect(() => {
+    setRemovedCodeIds(new Set());
+    setCodeLinks({});
+  }, [encounterDetails?.encounterId, encounterDetails?.chartText]);
+
+  // Suggestion and analysis jobs being waited on; a new request or unmounting cancels the wait
+  const jobControllers = useRef({});
+  const startJob = useCallback((name) => {
+    jobControllers.current[name]?.abort();
+    const controller = new AbortController();
+    jobControllers.current[name] = controller;
+    return controller.signal;
+  }, []);
+  useEffect(() => () => Object.values(jobControllers.current).forEach(controller => controller.abort()), []);
+
   // --- Memos / Derived State ---
   const displayedCptCodes = useMemo(() => allCptCodes.filter(c => !removedCodeIds.has(c.id)), [allCptCodes, removedCodeIds]);
   const displayedIcdCodes = useMemo(() => allIcdCodes.filter(c => !removedCodeIds.has(c.id)), [allIcdCodes, removedCodeIds]);
@@ -112,25 +128,33 @@ function CodingModule({
     setAllCptCodes([]); 
     setAllIcdCodes([]); 
     setAlerts([]);
-    setRemovedCodeIds(new Set()); 
-    setCodeLinks({});
+    // Within an encounter suggested code ids are stable across runs, so removals and links carry over;
+    // without one, each run may be for a different pasted chart
+    if (!encounterDetails?.encounterId) {
+      setRemovedCodeIds(new Set());
+      setCodeLinks({});
+    }
 
+    const signal = startJob('suggestions');
     try {
-      const results = await api.getSuggestions(chartText);
+      const results = await api.getSuggestions(chartText, encounterDetails?.encounterId, signal);
       setAllCptCodes(results.cptCodes || []);
       setAllIcdCodes(results.icdCodes || []);
       setAlerts((results.alerts || []).map(alert => 
         typeof alert === 'object' ? alert.message || 'Unknown alert' : alert
       ));
     } catch (error) {
+      if (signal.aborted) return;
       console.error("Error fetching suggestions:", error);
-      setAlerts(['Error generating suggestions. Please try again.']);
+      setAlerts([error.name === 'TimeoutError'
+        ? `${error.message}. Please try again.`
+        : 'Error generating suggestions. Please try again.']);
       setAllCptCodes([]); 
       setAllIcdCodes([]); 
     } finally {
-      setIsLoading({ suggestions: false, analysis: false });
+      if (!signal.aborted) setIsLoading({ suggestions: false, analysis: false });
     }
-  }, [chartText]);
+  }, [chartText, encounterDetails, startJob]);
 
   const handleSubmit = async (isFlagged = false) => {
     try {
@@ -246,17 +270,21 @@ function CodingModule({
 
   const handleShowAnalysis = useCallback(async () => {
     setIsLoadingAnalysis(true);
+    const signal = startJob('analysis');
     try {
-      const data = await api.getAnalysis(chartText);
+      const data = await api.getAnalysis(chartText, encounterDetails?.encounterId, signal);
       setAnalysisData(data);
       setAnalysisVisible(true);
     } catch (error) {
+      if (signal.aborted) return;
       console.error('Error fetching analysis:', error);
-      setAlerts(['Error generating analysis. Please try again.']);
+      setAlerts([error.name === 'TimeoutError'
+        ? `${error.message}. Please try again.`
+        : 'Error generating analysis. Please try again.']);
     } finally {
-      setIsLoadingAnalysis(false);
+      if (!signal.aborted) setIsLoadingAnalysis(false);
     }
-  }, [chartText]);
+  }, [chartText, encounterDetails, startJob]);
 
   const openRationalePanel = useCallback(() => {
     setRationalePanelState(prev => ({
@@ -1,25 +1,129 @@
+import config from './config';
+
 const API_BASE_URL = 'http://localhost:5000/api';
 const BASE_APP_API_URL = process.env.REACT_APP_BASE_APP_API_URL || 'http://localhost:3000/api/base-app';
 
+// POST to a server-sent-events endpoint and call onEvent(event, data) for each event
+const streamEvents = async (path, body, onEvent) => {
+    const response = await fetch(`${API_BASE_URL}${path}`, {
+        method: 'POST',
+        headers: {
+            'Content-Type': 'application/json',
+        },
+        body: JSON.stringify(body),
+    });
+    if (!response.ok) {
+        throw new Error(`Failed to stream ${path}`);
+    }
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    for (;;) {
+        const { done, value } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+        const messages = buffer.split('\n\n');
+        buffer = messages.pop();
+        messages.forEach((message) => {
+            const event = (message.match(/^event: (.*)$/m) || [])[1];
+            const data = (message.match(/^data: (.*)$/m) || [])[1];
+            if (event) onEvent(event, data ? JSON.parse(data) : null);
+        });
+    }
+};
+
+// Queue a background job and long-poll until it finishes; resolves to the job's result.
+// Resubmitting the same chart joins the job already running instead of starting another.
+// With an encounterId the server only redoes the parts of the chart changed since its last run.
+// Aborting `signal` stops waiting (the promise rejects with an AbortError).
+const runJob = async (type, chartText, priority = 'normal', encounterId = undefined, signal = undefined) => {
+    const response = await fetch(`${API_BASE_URL}/jobs`, {
+        method: 'POST',
+        headers: {
+            'Content-Type': 'application/json',
+        },
+        body: JSON.stringify({ type, chartText, priority, encounterId }),
+        signal,
+    });
+    if (!response.ok) {
+        throw new Error(`Failed to submit ${type} job`);
+    }
+    const { jobId } = await response.json();
+    return waitForJob(jobId, type, signal);
+};
+
+// Long-poll a queued job until it finishes; resolves to the job's result.
+// Rejects with a TimeoutError once config.api.jobTimeout ms have passed in total,
+// and with an AbortError when `signal` is aborted.
+const waitForJob = async (jobId, type, signal = undefined) => {
+    const controller = new AbortController();
+    let timedOut = false;
+    const timeoutId = setTimeout(() => {
+        timedOut = true;
+        controller.abort();
+    }, config.api.jobTimeout);
+    const cancel = () => controller.abort();
+    if (signal?.aborted) cancel();
+    signal?.addEventListener('abort', cancel);
+    try {
+        for (;;) {
+            const poll = await fetch(`${API_BASE_URL}/jobs/${jobId}?wait=25`, { signal: controller.signal });
+            if (!poll.ok && poll.status !== 202) {
+                throw new Error(`Failed to get ${type} job`);
+            }
+            const job = await poll.json();
+            if (job.status === 'done') return job.result;
+            if (job.status === 'failed') throw new Error(job.error || `Failed to get ${type}`);
+        }
+    } catch (error) {
+        if (!timedOut) throw error;
+        const timeout = new Error(`Timed out waiting for ${type} after ${Math.round(config.api.jobTimeout / 1000)} s`);
+        timeout.name = 'TimeoutError';
+        throw timeout;
+    } finally {
+        clearTimeout(timeoutId);
+        signal?.removeEventListener('abort', cancel);
+    }
+};
+
 export const api = {
-    // Get AI suggestions for CPT and ICD codes
-    getSuggestions: async (chartText) => {
+    // Get AI suggestions for CPT and ICD codes; aborting `signal` cancels the wait
+    getSuggestions: (chartText, encounterId, signal) => runJob('suggestions', chartText, 'high', encounterId, signal),
+
+    // Get suggestions from a fast model at once; if the full model later changes the codes,
+    // onVerified receives its suggestions with `changes` ({cpt, icd} codes added and removed)
+    getSpeculativeSuggestions: async (chartText, onVerified) => {
         const response = await fetch(`${API_BASE_URL}/suggestions`, {
             method: 'POST',
             headers: {
                 'Content-Type': 'application/json',
             },
-            body: JSON.stringify({ chartText }),
+            body: JSON.stringify({ chartText, speculative: true }),
         });
         if (!response.ok) {
             throw new Error('Failed to get suggestions');
         }
-        return response.json();
+        const suggestions = await response.json();
+        if (suggestions.verification) {
+            waitForJob(suggestions.verification.jobId, 'verify_suggestions')
+                .then((verified) => verified.changed && onVerified(verified))
+                .catch(() => {});
+        }
+        return suggestions;
     },
 
-    // Get in-depth analysis
-    getAnalysis: async (chartText) => {
-        const response = await fetch(`${API_BASE_URL}/analysis`, {
+    // Stream AI suggestions; onEvent receives ('cptCode' | 'icdCode' | 'done' | 'error', data)
+    streamSuggestions: (chartText, onEvent) => streamEvents('/suggestions/stream', { chartText }, onEvent),
+
+    // Stream in-depth analysis; onEvent receives ('analysisItem' | 'done' | 'error', data)
+    streamAnalysis: (chartText, onEvent) => streamEvents('/analysis/stream', { chartText }, onEvent),
+
+    // Get in-depth analysis; 'high' like suggestions, since a coder is waiting on it
+    getAnalysis: (chartText, encounterId, signal) => runJob('analysis', chartText, 'high', encounterId, signal),
+
+    // Get suggestions, analysis and alerts for a chart in one request
+    getWorkup: async (chartText) => {
+        const response = await fetch(`${API_BASE_URL}/workup`, {
             method: 'POST',
             headers: {
                 'Content-Type': 'application/json',
@@ -27,7 +131,7 @@ export const api = {
             body: JSON.stringify({ chartText }),
         });
         if (!response.ok) {
-            throw new Error('Failed to get analysis');
+            throw new Error('Failed to get workup');
         }
         return response.json();
     },
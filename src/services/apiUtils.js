@@ -36,7 +36,7 @@ export const fetchWithRetry = async (url, options = {}, retryCount = 0) => {
 };
 
 export const handleApiError = (error) => {
-    if (error.name === 'AbortError') {
+    if (error.name === 'AbortError' || error.name === 'TimeoutError') {
         return {
             message: 'Request timed out. Please try again.',
             type: 'timeout'
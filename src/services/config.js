@@ -4,6 +4,8 @@ const config = {
         timeout: parseInt(process.env.REACT_APP_API_TIMEOUT || '30000', 10),
         retryAttempts: parseInt(process.env.REACT_APP_API_RETRY_ATTEMPTS || '3', 10),
         retryDelay: parseInt(process.env.REACT_APP_API_RETRY_DELAY || '1000', 10),
+        // How long to wait in total for a queued job (suggestions, analysis) to finish
+        jobTimeout: parseInt(process.env.REACT_APP_JOB_TIMEOUT || '300000', 10),
     }
 };
 